@@ -0,0 +1,171 @@
+import math
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from PIL import Image, ImageFont
+
+from pt750.models import settings
+
+# glyphs the atlas draws.  Past ascii, pillow places some glyphs of a
+# whole string differently from the same glyphs drawn one at a time.
+ATLAS_CHARS = frozenset(chr(x) for x in range(32, 127))
+
+# below this, glyphs can run past the box pillow renders a whole string
+# into and get clipped there, which the atlas would not do
+MIN_ATLAS_SIZE = 12
+
+# sprites kept per atlas.  A sprite depends on where in its first
+# pixel the glyph starts, which labels only vary a little.
+MAX_SPRITES = 4096
+
+Sprite = tuple[Optional[Image.Image], int, int]
+
+
+def paste_clipped(
+    img: Image.Image,
+    mask: Image.Image,
+    xy: tuple[int, int],
+    clip: tuple[int, int, int, int],
+):
+    """paste black through mask at xy, keeping inside the clip box"""
+    x, y = xy
+    width, height = mask.size
+    left, top, right, bottom = clip
+    if left <= x and top <= y and x + width <= right and y + height <= bottom:
+        img.paste(0, xy, mask)
+        return
+
+    box = (max(x, left), max(y, top), min(x + width, right), min(y + height, bottom))
+    if box[0] < box[2] and box[1] < box[3]:
+        mask = mask.crop((box[0] - x, box[1] - y, box[2] - x, box[3] - y))
+        img.paste(0, box[:2], mask)
+
+
+class GlyphAtlas:
+    """1-bit sprites of each glyph of one font at one size
+
+    Text is drawn by pasting sprites at the pen positions pillow would
+    use, so the result matches ImageDraw.text pixel for pixel.  That
+    only holds for fixed-pitch fonts, use supports() before draw().
+    """
+
+    def __init__(self, font: ImageFont.FreeTypeFont):
+        self.font = font
+        self._sprites: dict[tuple[str, float, float], Sprite] = {}
+        self._advances: dict[tuple[str, str], float] = {}
+        self._bboxes: dict[str, tuple[int, int, int, int]] = {}
+
+        advances = {font.getlength(x) for x in ATLAS_CHARS}
+        self.fixed_pitch = len(advances) == 1
+
+    def supports(self, text: str) -> bool:
+        return (
+            self.fixed_pitch
+            and self.font.size >= MIN_ATLAS_SIZE
+            and all(x in ATLAS_CHARS for x in text)
+        )
+
+    def sprite(self, char: str, x: float, y: float) -> Sprite:
+        """char rasterized starting x and y into its first pixel"""
+        key = (char, x, y)
+        sprite = self._sprites.get(key)
+        if sprite is None:
+            mask, (dx, dy) = self.font.getmask2(char, "1", start=(x, y))
+
+            img = None
+            if mask.size[0] and mask.size[1]:
+                img = Image.Image()._new(mask)
+
+            sprite = (img, dx, dy)
+            if len(self._sprites) >= MAX_SPRITES:
+                self._sprites.clear()
+            self._sprites[key] = sprite
+
+        return sprite
+
+    def advance(self, previous: str, char: str) -> float:
+        """pen movement from previous to char, including kerning"""
+        key = (previous, char)
+        advance = self._advances.get(key)
+        if advance is None:
+            advance = self.font.getlength(previous + char) - self.font.getlength(char)
+            self._advances[key] = advance
+
+        return advance
+
+    def bbox(self, char: str) -> tuple[int, int, int, int]:
+        bbox = self._bboxes.get(char)
+        if bbox is None:
+            bbox = self._bboxes[char] = self.font.getbbox(char)
+
+        return bbox
+
+    def getsize(self, text: str) -> tuple[int, int]:
+        """as draw.getsize, from the glyph metrics"""
+        # like getbbox, the width covers the advance of trailing spaces
+        right = bottom = 0
+        pen = 0.0
+        for pen, char in self._layout(text, 0.0):
+            _, _, glyph_right, glyph_bottom = self.bbox(char)
+            right = max(right, math.ceil(pen + glyph_right))
+            bottom = max(bottom, glyph_bottom)
+
+        if text:
+            right = max(right, math.ceil(pen + self.font.getlength(text[-1])))
+
+        return right, bottom
+
+    def _layout(self, text: str, x: float):
+        previous = None
+        for char in text:
+            if previous is not None:
+                x += self.advance(previous, char)
+            yield x, char
+            previous = char
+
+    @staticmethod
+    def _phase(x: float, y: float) -> tuple[float, float]:
+        # as ImageDraw.text splits its position
+        return math.modf(x)[0], math.modf(y)[0]
+
+    def draw(
+        self,
+        img: Image.Image,
+        xy: tuple[float, float],
+        text: str,
+        origin: tuple[int, int] = (0, 0),
+        clip: Optional[tuple[int, int, int, int]] = None,
+    ):
+        """draw text in black on a mode 1 image, like draw.draw_text"""
+        x, y = xy
+        top = origin[1] + int(y)
+        if clip is None:
+            clip = (0, 0) + img.size
+
+        for pen, char in self._layout(text, x):
+            sprite, dx, dy = self.sprite(char, *self._phase(pen, y))
+            if sprite is not None:
+                paste_clipped(img, sprite, (origin[0] + int(pen) + dx, top + dy), clip)
+
+
+_atlases: OrderedDict[ImageFont.FreeTypeFont, GlyphAtlas] = OrderedDict()
+_atlases_lock = threading.Lock()
+
+
+def atlas_for(font: ImageFont.FreeTypeFont) -> GlyphAtlas:
+    """the atlas for a font from draw.get_font, bounded like the face cache"""
+    with _atlases_lock:
+        atlas = _atlases.get(font)
+        if atlas is not None:
+            _atlases.move_to_end(font)
+            return atlas
+
+    atlas = GlyphAtlas(font)
+
+    with _atlases_lock:
+        _atlases[font] = atlas
+        while len(_atlases) > settings.face_cache_size:
+            _atlases.popitem(last=False)
+
+    return atlas
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import platform
+import socketserver
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from operator import itemgetter
+
+import PIL
+from PIL import ImageFont
+
+from pt750 import draw, labels, models, transports
+
+
+def linear_fit(fontpath: str, size: float, text: str, constrain_height: bool = True):
+    """the original size-at-a-time search, kept as a baseline"""
+    fontsize = 1
+    font = ImageFont.truetype(fontpath, fontsize)
+
+    constraint = itemgetter(1) if constrain_height else itemgetter(0)
+    if constrain_height:
+        text = draw.FIT_PROBE_TEXT
+
+    while constraint(draw.getsize(font, text)) < size:
+        fontsize += 1
+        font = ImageFont.truetype(fontpath, fontsize)
+
+    return fontsize - 1
+
+
+def timed(fn, iterations: int):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def bench_fit(args):
+    fontpath = draw.path_for(args.font)
+
+    print(f"{'tape':>6} {'size':>5} {'linear':>10} {'cold':>10} {'warm':>10}")
+    for tape in models.tapes.values():
+        target = tape.printable_height
+
+        def cold():
+            draw._fit_cache.clear()
+            return draw.find_fit(fontpath, target, args.text)
+
+        fontsize = linear_fit(fontpath, target, args.text)
+        assert cold() == fontsize
+
+        linear = timed(lambda: linear_fit(fontpath, target, args.text), args.iterations)
+        cold_time = timed(cold, args.iterations)
+        warm = timed(
+            lambda: draw.find_fit(fontpath, target, args.text), args.iterations
+        )
+
+        print(
+            f"{tape.size:>6} {fontsize:>5} {linear * 1000:>8.2f}ms "
+            f"{cold_time * 1000:>8.2f}ms {warm * 1000:>8.4f}ms"
+        )
+
+
+def bench_qr(args):
+    print(f"{'tape':>6} " + " ".join(f"{x:>12}" for x in draw.qr_backends))
+    for tape in models.tapes.values():
+        height = tape.printable_height
+        results = []
+
+        for backend in draw.qr_backends.values():
+            try:
+                elapsed = timed(lambda: backend(height, args.text), args.iterations)
+                results.append(f"{elapsed * 1000:>10.2f}ms")
+            except Exception:
+                results.append(f"{'unavailable':>12}")
+
+        print(f"{tape.size:>6} " + " ".join(results))
+
+
+ASSET_TAGS = ["ASSET-0042", "RACK-A01", "SRV-DB-07", "PDU-B2 OUTLET 14"]
+
+
+def bench_atlas(args):
+    """labels/sec for text and flag labels, drawn with and without the atlas"""
+    kinds = {
+        "text": lambda height, tag: labels.TextLabel(
+            height, args.font, [tag, "ops@example.com"]
+        ),
+        "flag": lambda height, tag: labels.FlagLabel(height, args.font, tag),
+    }
+
+    print(f"{'tape':>6} {'label':>6} {'imagedraw':>12} {'atlas':>12} {'speedup':>8}")
+    for tape in models.tapes.values():
+        for kind, make in kinds.items():
+            results = []
+            for glyph_atlas in (False, True):
+                models.settings.glyph_atlas = glyph_atlas
+
+                def render():
+                    # labels only lay out until their image is asked for
+                    for tag in ASSET_TAGS:
+                        make(tape.printable_height, tag).image
+
+                render()  # warm the fit, face and sprite caches
+                results.append(len(ASSET_TAGS) / timed(render, args.iterations))
+
+            print(
+                f"{tape.size:>6} {kind:>6} {results[0]:>8.0f}/sec "
+                f"{results[1]:>8.0f}/sec {results[1] / results[0]:>7.2f}x"
+            )
+
+
+# a typical request for each label class, the tape and printer are
+# filled in per run
+SAMPLES = {
+    "text": {
+        "label_type": "text",
+        "align": "left",
+        "lines": ["ASSET-0042", "ops@example.com"],
+    },
+    "qr": {
+        "label_type": "qr",
+        "align": "left",
+        "qrtext": "https://example.com/asset/0042",
+        "lines": ["ASSET-0042"],
+    },
+    "aruco": {
+        "label_type": "aruco",
+        "align": "left",
+        "dictionary": "DICT_4X4_100",
+        "id": 42,
+        "lines": ["ASSET-0042"],
+    },
+    "wrap": {"label_type": "wrap", "label": "ASSET-0042"},
+    "flag": {"label_type": "flag", "label": "ASSET-0042"},
+}
+
+
+class _Sink(socketserver.BaseRequestHandler):
+    def handle(self):
+        while self.request.recv(65536):
+            pass
+
+
+class _RawPrint(BaseHTTPRequestHandler):
+    # keep-alive, as the pooled client expects.  Headers and body are
+    # written separately, so without TCP_NODELAY every reply waits out
+    # the client's delayed ack.
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_PUT(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        body = b'{"state": "done"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def fake_printers():
+    """printer uris for a local tcp sink, http server and usb device file"""
+    socketserver.ThreadingTCPServer.daemon_threads = True
+    tcp = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _Sink)
+    http = ThreadingHTTPServer(("127.0.0.1", 0), _RawPrint)
+    http.daemon_threads = True
+
+    for server in (tcp, http):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        try:
+            yield {
+                "tcp": "tcp://%s:%d" % tcp.server_address,
+                "http": "http://%s:%d/default" % http.server_address,
+                "usb": "file://" + os.path.join(tmpdir, "lp0"),
+            }
+        finally:
+            for server in (tcp, http):
+                server.shutdown()
+                server.server_close()
+
+
+def measure(fn, iterations: int) -> dict[str, float]:
+    """timings of fn in ms, after one untimed call to warm caches"""
+    fn()
+
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "min_ms": min(times),
+        "median_ms": statistics.median(times),
+        "mean_ms": statistics.fmean(times),
+    }
+
+
+def run_suite(iterations: int, compress: bool = True) -> list[dict]:
+    """render, encode and send timings for every label class and tape"""
+    missing = set(labels.label_classes) - set(SAMPLES)
+    if missing:
+        raise RuntimeError(f"No benchmark sample for {', '.join(sorted(missing))}")
+
+    results = []
+
+    def record(label_type, tape, stage, timings):
+        results.append({"label": label_type, "tape": tape, "stage": stage} | timings)
+        print(
+            f"{label_type:>6} {tape:>5} {stage:>10} {timings['median_ms']:>9.3f}ms",
+            file=sys.stderr,
+        )
+
+    with fake_printers() as uris:
+        printers = {
+            kind: transports.PT750W(uri, compress=compress)
+            for kind, uri in uris.items()
+        }
+        encoder = printers["usb"]
+
+        for label_type, sample in SAMPLES.items():
+            for tape in models.tapes:
+                request = models.LabelRequest.model_validate(
+                    {"label": sample | {"tape": tape, "printer": "default"}}
+                )
+
+                def render():
+                    return labels.render(request.label)
+
+                img = render()
+                job = encoder.encode(img)
+
+                record(label_type, tape, "render", measure(render, iterations))
+                record(
+                    label_type,
+                    tape,
+                    "encode",
+                    measure(lambda: encoder.encode(img), iterations),
+                )
+                for kind, printer in printers.items():
+                    record(
+                        label_type,
+                        tape,
+                        f"send_{kind}",
+                        measure(lambda: printer.transport.send_bytes(job), iterations),
+                    )
+
+        printers["tcp"].transport.close()
+
+    return results
+
+
+def bench_suite(args):
+    results = run_suite(args.iterations, compress=not args.uncompressed)
+
+    report = {
+        "created": time.time(),
+        "iterations": args.iterations,
+        "compress": not args.uncompressed,
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"wrote {len(results)} results to {args.output}", file=sys.stderr)
+
+
+def compare_results(old: dict, new: dict) -> list[tuple[str, float, float]]:
+    """(name, old, new) median times for results in both runs"""
+
+    def by_name(report):
+        return {
+            f"{x['label']}/{x['tape']}/{x['stage']}": x["median_ms"]
+            for x in report["results"]
+        }
+
+    old_times = by_name(old)
+    new_times = by_name(new)
+
+    return [
+        (name, old_times[name], new_times[name])
+        for name in old_times
+        if name in new_times
+    ]
+
+
+def bench_compare(args):
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    regressions = 0
+
+    print(f"{'benchmark':>24} {'old':>10} {'new':>10} {'ratio':>7}")
+    for name, old_ms, new_ms in compare_results(old, new):
+        ratio = new_ms / old_ms if old_ms else float("inf")
+        slower = ratio > args.threshold
+        regressions += slower
+
+        print(
+            f"{name:>24} {old_ms:>8.3f}ms {new_ms:>8.3f}ms {ratio:>6.2f}x"
+            f"{'  SLOWER' if slower else ''}"
+        )
+
+    if regressions:
+        print(f"{regressions} benchmarks slower than {args.threshold}x")
+        sys.exit(1)
+
+
+# cumulative import time allowed for each entry point, in milliseconds
+IMPORT_BUDGETS = {"pt750.main": 400, "pt750.web": 1000}
+
+# only loaded by the features that need them, never at import
+LAZY_MODULES = ["cv2", "treepoem", "easysnmp", "httpx"]
+
+
+def import_time(module: str) -> tuple[float, set[str]]:
+    """cumulative import time of module in ms, and every module it loaded
+
+    Runs in a fresh interpreter with -X importtime, so nothing is
+    already imported.
+    """
+    rv = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    elapsed = 0.0
+    loaded = set()
+    for line in rv.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+
+        parts = line.split("|")
+        name = parts[-1].strip()
+        if not parts[1].strip().isdigit():
+            # the header line
+            continue
+
+        loaded.add(name)
+        if name == module:
+            elapsed = int(parts[1]) / 1000
+
+    return elapsed, loaded
+
+
+def bench_importtime(args):
+    failed = False
+
+    print(f"{'module':>12} {'best':>10} {'budget':>10}  lazy modules loaded")
+    for module, budget in IMPORT_BUDGETS.items():
+        results = [import_time(module) for _ in range(args.iterations)]
+        best = min(x[0] for x in results)
+        eager = sorted(set(LAZY_MODULES).intersection(*[x[1] for x in results]))
+
+        over = best > budget * args.slack
+        failed = failed or over or bool(eager)
+
+        print(
+            f"{module:>12} {best:>8.1f}ms {budget:>8}ms  "
+            f"{', '.join(eager) or '-'}{'  OVER BUDGET' if over else ''}"
+        )
+
+    if failed:
+        sys.exit(1)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="benchmark label generation")
+
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--font", default="mono")
+
+    subparsers = parser.add_subparsers(help="what to benchmark", dest="kind")
+    subparsers.required = True
+
+    fit_parser = subparsers.add_parser("fit")
+    fit_parser.add_argument("--text", default="ASSET-0042")
+    fit_parser.set_defaults(func=bench_fit)
+
+    qr_parser = subparsers.add_parser("qr")
+    qr_parser.add_argument("--text", default="WIFI:T:WPA;S:office;P:hunter2;;")
+    qr_parser.set_defaults(func=bench_qr)
+
+    atlas_parser = subparsers.add_parser("atlas")
+    atlas_parser.set_defaults(func=bench_atlas)
+
+    suite_parser = subparsers.add_parser(
+        "suite", help="render, encode and send every label type on every tape"
+    )
+    suite_parser.add_argument("--output", default="-", help="JSON results file")
+    suite_parser.add_argument("--uncompressed", action="store_true")
+    suite_parser.set_defaults(func=bench_suite)
+
+    compare_parser = subparsers.add_parser("compare", help="compare two suite runs")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=1.2, help="slowdown counted as regression"
+    )
+    compare_parser.set_defaults(func=bench_compare)
+
+    importtime_parser = subparsers.add_parser("importtime")
+    importtime_parser.add_argument(
+        "--slack", type=float, default=1.0, help="multiplier on the budgets"
+    )
+    importtime_parser.set_defaults(func=bench_importtime)
+
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from PIL import Image
+
+from pt750 import draw, models
+
+# bumped whenever what gets cached for a key changes, so entries
+# spilled to disk by an older version are not picked up
+KEY_VERSION = 3
+
+
+def _fingerprint(label: models.BaseLabel) -> dict:
+    # settings that change the rendered image without changing the label
+    settings = models.settings
+    data = {
+        "font_map": draw.font_map,
+        "qr_backend": settings.qr_backend,
+        "qr_ecc": settings.qr_ecc,
+        "glyph_atlas": settings.glyph_atlas,
+    }
+
+    try:
+        path = draw.path_for(label.fontname)
+        stat = os.stat(path)
+        data["font"] = [path, stat.st_size, stat.st_mtime_ns]
+    except (OSError, RuntimeError):
+        # rendering fails anyway, so nothing is cached under it
+        data["font"] = label.fontname
+
+    return data
+
+
+def key_for(label: models.BaseLabel) -> str:
+    """hash of everything that affects how a label renders
+
+    The printer is left out, so the same label previewed or printed
+    on any printer shares one entry.  The settings and font file the
+    label renders with are included, so changing them is not served
+    stale images.
+    """
+    data = label.model_dump(mode="json", exclude={"printer"})
+    data["key_version"] = KEY_VERSION
+    data["settings"] = _fingerprint(label)
+    canonical = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class RenderCache:
+    """bounded LRU of rendered label images, optionally spilled to disk
+
+    The directory is held to the same number of entries, dropping the
+    least recently used.  Cached images are handed out as-is, so
+    callers must not modify them.
+    """
+
+    def __init__(self, maxsize: int, directory: Optional[str] = None):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._images: OrderedDict[str, Image.Image] = OrderedDict()
+        self._lock = threading.Lock()
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def _path_for(self, key: str) -> str:
+        assert self.directory
+        return os.path.join(self.directory, f"{key}.png")
+
+    def _load(self, key: str) -> Optional[Image.Image]:
+        if not self.directory:
+            return None
+
+        path = self._path_for(key)
+        try:
+            with Image.open(path) as img:
+                img.load()
+            # the file's mtime is its last use, for pruning
+            os.utime(path)
+            return img
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, key: str, img: Image.Image):
+        if not self.directory:
+            return
+
+        path = self._path_for(key)
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(
+                dir=self.directory, suffix=".tmp", delete=False
+            ) as f:
+                tmp_path = f.name
+                img.save(f, format="PNG")
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Cannot write render cache entry {path}: {e}")
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        self._prune()
+
+    def _prune(self):
+        assert self.directory
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".png"):
+                continue
+            try:
+                entries.append((entry.stat().st_mtime_ns, entry.path))
+            except FileNotFoundError:
+                pass
+
+        entries.sort()
+        for _, path in entries[: max(len(entries) - self.maxsize, 0)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # pruned by another thread
+                pass
+
+    def _insert(self, key: str, img: Image.Image):
+        with self._lock:
+            self._images[key] = img
+            self._images.move_to_end(key)
+            while len(self._images) > self.maxsize:
+                self._images.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Image.Image]:
+        with self._lock:
+            img = self._images.get(key)
+            if img is not None:
+                self._images.move_to_end(key)
+                self.hits += 1
+                return img
+
+        img = self._load(key)
+
+        with self._lock:
+            if img is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        self._insert(key, img)
+        return img
+
+    def put(self, key: str, img: Image.Image):
+        self._insert(key, img)
+        self._store(key, img)
+
+    def info(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._images),
+                "maxsize": self.maxsize,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self.hits = 0
+            self.misses = 0
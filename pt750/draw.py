@@ -1,13 +1,31 @@
-import os
-import subprocess
+import functools
+import math
+import threading
+from collections import OrderedDict
 from operator import itemgetter
+from typing import Optional
 
-import treepoem
 from PIL import Image, ImageDraw, ImageFont
 
-from pt750.models import HAlignment, settings
+from pt750 import atlas, fonts, metrics, qr
+from pt750.models import HAlignment, ParameterError, settings
 
-_font_cache: dict[str, str] = {}
+# (fontpath, target size, constrain_height, probe text) -> point size
+_fit_cache: OrderedDict[tuple[str, float, bool, str], int] = OrderedDict()
+_fit_cache_lock = threading.Lock()
+FIT_CACHE_SIZE = 1024
+
+# text used to measure line height, covering ascenders and descenders
+FIT_PROBE_TEXT = "bdfhkltgjpgyfz"
+MAX_FONT_SIZE = 1024
+
+# rendered aruco markers, keyed by (dictionary, id, height)
+ARUCO_CACHE_SIZE = 1024
+
+# (fontpath, point size) -> loaded face, shared by every thread
+_face_cache: OrderedDict[tuple[str, int], ImageFont.FreeTypeFont] = OrderedDict()
+_face_cache_lock = threading.Lock()
+_face_cache_stats = {"hits": 0, "misses": 0}
 
 font_sizes = {"large": 1.0, "medium": 0.75, "small": 0.5}
 
@@ -26,61 +44,116 @@ def getsize(font, text: str):
     return (right, bottom)
 
 
+def get_font(fontpath: str, fontsize: int) -> ImageFont.FreeTypeFont:
+    key = (fontpath, fontsize)
+
+    with _face_cache_lock:
+        font = _face_cache.get(key)
+        if font is not None:
+            _face_cache.move_to_end(key)
+            _face_cache_stats["hits"] += 1
+            return font
+
+        _face_cache_stats["misses"] += 1
+
+    # load outside the lock, a duplicate load on a race is harmless
+    font = ImageFont.truetype(fontpath, fontsize)
+
+    with _face_cache_lock:
+        _face_cache[key] = font
+        while len(_face_cache) > settings.face_cache_size:
+            _face_cache.popitem(last=False)
+
+    return font
+
+
+def face_cache_info() -> dict[str, int]:
+    with _face_cache_lock:
+        return {
+            "hits": _face_cache_stats["hits"],
+            "misses": _face_cache_stats["misses"],
+            "size": len(_face_cache),
+            "maxsize": settings.face_cache_size,
+        }
+
+
+def clear_face_cache():
+    with _face_cache_lock:
+        _face_cache.clear()
+        _face_cache_stats["hits"] = 0
+        _face_cache_stats["misses"] = 0
+
+
 def path_for(fontname: str):
     if fontname.startswith("/"):
         return fontname
 
     fontname = font_map.get(fontname, fontname)
 
-    if not _font_cache:
-        path_lists = subprocess.check_output(["fc-list", "-f", "%{file}\n"]).decode()
+    with metrics.render_stage_seconds.time(stage="font_lookup"):
+        path = fonts.lookup(fontname)
+    if not path:
+        raise RuntimeError(f"Bad font: {fontname}")
 
-        for line in path_lists.split("\n"):
-            line = line.strip()
-            if line:
-                font = line.split("/")[-1]
-                if font.endswith(".ttf"):
-                    _font_cache[font] = line
+    return path
 
-        # additionally, let's add any .ttf files found in
-        # settings.font_dir
-        if settings.font_dirs:
-            for fd_path in settings.font_dirs:
-                for font in os.listdir(fd_path):
-                    if font.endswith(".ttf"):
-                        _font_cache[font] = os.path.join(fd_path, font)
 
-    path = _font_cache.get(fontname)
-    if path is None:
-        path = _font_cache.get(f"{fontname}.ttf")
+def _measure(fontpath: str, fontsize: int, text: str, constraint) -> int:
+    font = get_font(fontpath, fontsize)
+    return constraint(getsize(font, text))
 
-    if not path:
-        raise RuntimeError(f"Bad font: {fontname}")
 
-    return path
+def _search_fit(fontpath: str, size: float, text: str, constrain_height: bool):
+    constraint = itemgetter(1) if constrain_height else itemgetter(0)
 
+    # find the smallest font size that overshoots.  Grow the upper
+    # bound exponentially, then bisect between the last fitting size
+    # and the first overshooting one.
+    low, high = 0, 1
+    while high < MAX_FONT_SIZE and _measure(fontpath, high, text, constraint) < size:
+        low, high = high, min(high * 2, MAX_FONT_SIZE)
+
+    while high - low > 1:
+        mid = (low + high) // 2
+        if _measure(fontpath, mid, text, constraint) < size:
+            low = mid
+        else:
+            high = mid
 
-def find_fit(fontname: str, size: float, text: str, constrain_height: bool = True):
-    fontsize = 1
+    return high - 1
 
-    fontname = path_for(fontname)
-    if not fontname:
-        raise RuntimeError(f"Cannot find font {fontname}")
 
-    font = ImageFont.truetype(fontname, fontsize)
+def find_fit(fontname: str, size: float, text: str, constrain_height: bool = True):
+    fontpath = path_for(fontname)
+    if not fontpath:
+        raise RuntimeError(f"Cannot find font {fontname}")
 
-    constraint = itemgetter(1) if constrain_height else itemgetter(0)
     if constrain_height:
-        text = "bdfhkltgjpgyfz"
+        text = FIT_PROBE_TEXT
 
-    while constraint(getsize(font, text)) < size:
-        fontsize += 1
-        font = ImageFont.truetype(fontname, fontsize)
+    key = (fontpath, size, constrain_height, text)
+    with _fit_cache_lock:
+        fontsize = _fit_cache.get(key)
+        if fontsize is not None:
+            _fit_cache.move_to_end(key)
+            return fontsize
 
-    return fontsize - 1
+    # searched outside the lock, as faces are loaded in get_font
+    with metrics.render_stage_seconds.time(stage="fit"):
+        fontsize = _search_fit(fontpath, size, text, constrain_height)
 
+    with _fit_cache_lock:
+        _fit_cache[key] = fontsize
+        while len(_fit_cache) > FIT_CACHE_SIZE:
+            _fit_cache.popitem(last=False)
+
+    return fontsize
+
+
+def _treepoem_qr_code(height: int, text: str):
+    # treepoem is slow to import and needs ghostscript, only load it if used
+    import treepoem
 
-def qr_code(height: int, text: str):
     img = Image.new("1", size=(height, height), color=1)
 
     code = treepoem.generate_barcode(barcode_type="qrcode", data=text)
@@ -90,76 +163,210 @@ def qr_code(height: int, text: str):
     return img
 
 
-def vertical_text_block(width: int, height: int, fontname: str, text: str, min_count=1):
-    fontpath = path_for(fontname)
-    if not fontpath:
-        raise RuntimeError("Cannot find font")
+def _native_qr_code(height: int, text: str):
+    matrix = qr.encode(text, ecc=settings.qr_ecc)
+    modules = len(matrix)
 
-    # width here is "width of text", i.e. height
+    # largest whole-pixel module size leaving at least a one module
+    # quiet zone on each side
+    scale = height // (modules + 2)
+    if not scale:
+        code_img = qr.render(matrix)
+        return code_img.resize((height, height), resample=Image.Resampling.NEAREST)
 
-    # constrain width
-    fs_width = find_fit(fontpath, width, text, constrain_height=False)
-    fs_height = find_fit(fontpath, height / min_count, text)
+    code_img = qr.render(matrix, scale=scale)
 
-    fs = min(fs_width, fs_height)
+    img = Image.new("1", size=(height, height), color=1)
+    ofs = (height - code_img.width) // 2
+    img.paste(code_img, (ofs, ofs))
+    return img
 
-    font = ImageFont.truetype(fontpath, fs)
-    img = Image.new("1", size=(width, height), color=1)
-    draw = ImageDraw.Draw(img)
 
-    line_height = getsize(font, text)[1]
+qr_backends = {
+    "native": _native_qr_code,
+    "treepoem": _treepoem_qr_code,
+}
 
-    line_count = height // line_height
 
-    for idx in range(line_count):
-        draw.text((0, idx * line_height), text, font=font)
+def qr_code(height: int, text: str):
+    backend = qr_backends.get(settings.qr_backend)
+    if backend is None:
+        raise RuntimeError(f"Bad qr backend: {settings.qr_backend}")
 
-    img = img.transpose(Image.Transpose.ROTATE_270)
+    with metrics.render_stage_seconds.time(stage="qr"):
+        return backend(height, text)
+
+
+@functools.lru_cache(maxsize=None)
+def _aruco_dictionary(dictionary: int):
+    # opencv is slow to import, so only aruco markers pay for it
+    import cv2
+
+    return cv2.aruco.getPredefinedDictionary(dictionary)
+
+
+@functools.lru_cache(maxsize=ARUCO_CACHE_SIZE)
+def _aruco_marker(dictionary: int, id: int, height: int) -> Image.Image:
+    import cv2
+
+    aruco_dict = _aruco_dictionary(dictionary)
+    if not 0 <= id < len(aruco_dict.bytesList):
+        raise ParameterError(f"Bad aruco id {id}")
+
+    bits = cv2.aruco.Dictionary.getBitsFromByteList(
+        aruco_dict.bytesList[[id]], aruco_dict.markerSize
+    )
+
+    # the marker bits inside a one cell black border, 1 is white in PIL
+    cells = aruco_dict.markerSize + 2
+    data = bytearray(cells * cells)
+    for y, row in enumerate(bits):
+        for x, bit in enumerate(row):
+            data[(y + 1) * cells + x + 1] = 255 if bit else 0
+
+    marker = Image.frombytes("L", (cells, cells), bytes(data)).convert(
+        "1", dither=Image.Dither.NONE
+    )
+
+    scale = height // cells
+    if not scale:
+        return marker.resize((height, height), resample=Image.Resampling.NEAREST)
+
+    marker = marker.resize((cells * scale, cells * scale), Image.Resampling.NEAREST)
+
+    img = Image.new("1", size=(height, height), color=1)
+    ofs = (height - marker.width) // 2
+    img.paste(marker, (ofs, ofs))
     return img
 
 
-def horiz_text_block(
-    height: int,
-    fontname: str,
-    fontsize: str,
-    lines: list[str],
-    alignment: HAlignment = HAlignment.left,
-):
+def aruco_marker(
+    dictionary: int, id: int, height: int, copy: bool = True
+) -> Image.Image:
+    """a height square 1-bit aruco marker at the largest whole-pixel cell size
+
+    Markers are memoized, so this returns a copy that is safe to modify
+    unless copy is False, for callers that only paste it somewhere.
+    """
+    with metrics.render_stage_seconds.time(stage="aruco"):
+        marker = _aruco_marker(dictionary, id, height)
+        return marker.copy() if copy else marker
+
 
+def vertical_text_block(width: int, height: int, fontname: str, text: str, min_count=1):
     fontpath = path_for(fontname)
     if not fontpath:
-        raise RuntimeError(f"Cannot find font {fontname}")
-
-    rows = len(lines)
-    height_per_row = height / rows
+        raise RuntimeError("Cannot find font")
 
-    font_height = height_per_row * font_sizes[fontsize]
+    # width here is "width of text", i.e. height
 
-    # now, choose a font!
-    fs = find_fit(fontpath, font_height, "".join(lines))
+    # constrain width
+    fs_width = find_fit(fontpath, width, text, constrain_height=False)
+    fs_height = find_fit(fontpath, height / min_count, text)
 
-    line_ofs = (height_per_row - font_height) // 2
-    font = ImageFont.truetype(fontpath, fs)
+    fs = min(fs_width, fs_height)
 
-    # find max width
-    width = 0
-    for line in lines:
-        width = max(width, getsize(font, line)[0])
+    with metrics.render_stage_seconds.time(stage="text"):
+        font = get_font(fontpath, fs)
+        img = Image.new("1", size=(width, height), color=1)
+        draw = ImageDraw.Draw(img)
 
-    img = Image.new(mode="1", size=(width, height), color=1)
+        line_height = getsize(font, text)[1]
 
-    draw = ImageDraw.Draw(img)
+        line_count = height // line_height
 
-    for idx, line in enumerate(lines):
-        line_width = getsize(font, line)[0]
+        for idx in range(line_count):
+            draw.text((0, idx * line_height), text, font=font)
 
-        if alignment == HAlignment.left:
-            xofs = 0
-        elif alignment == HAlignment.center:
-            xofs = (width - line_width) / 2
-        else:
-            xofs = width - line_width
+    img = img.transpose(Image.Transpose.ROTATE_270)
+    return img
 
-        draw.text((xofs, (idx * height_per_row) + line_ofs), line, font=font)
 
-    return img
+def draw_text(
+    img: Image.Image,
+    xy: tuple[float, float],
+    text: str,
+    font: ImageFont.FreeTypeFont,
+    origin: tuple[int, int] = (0, 0),
+    clip: Optional[tuple[int, int, int, int]] = None,
+):
+    """ImageDraw.text in black on a mode 1 image, offset by a whole origin
+
+    Keeping the origin apart from xy leaves the sub-pixel phase exactly
+    as it would be drawing at xy into an image of its own.
+    """
+    x, y = xy
+    mask, (dx, dy) = font.getmask2(text, "1", start=(math.modf(x)[0], math.modf(y)[0]))
+    if not mask.size[0] or not mask.size[1]:
+        return
+
+    xy = (origin[0] + int(x) + dx, origin[1] + int(y) + dy)
+    if clip is None:
+        clip = (0, 0) + img.size
+
+    atlas.paste_clipped(img, Image.Image()._new(mask), xy, clip)
+
+
+class TextBlock:
+    """lines of text fitted to a height, measured before anything is drawn
+
+    Labels lay out a block to learn its width, then draw it straight
+    into their own image at any offset.
+    """
+
+    def __init__(
+        self,
+        height: int,
+        fontname: str,
+        fontsize: str,
+        lines: list[str],
+        alignment: HAlignment = HAlignment.left,
+    ):
+        fontpath = path_for(fontname)
+        if not fontpath:
+            raise RuntimeError(f"Cannot find font {fontname}")
+
+        self.height = height
+        self.lines = lines
+        self.alignment = alignment
+
+        rows = len(lines)
+        self.height_per_row = height / rows
+
+        font_height = self.height_per_row * font_sizes[fontsize]
+
+        # now, choose a font!
+        fs = find_fit(fontpath, font_height, "".join(lines))
+
+        self.line_ofs = (self.height_per_row - font_height) // 2
+        self.font = get_font(fontpath, fs)
+        self.glyphs = atlas.atlas_for(self.font) if settings.glyph_atlas else None
+
+        # find max width, measuring each line once
+        self.widths = [self._measure(line) for line in lines]
+        self.width = max(self.widths, default=0)
+
+    def _measure(self, line: str) -> int:
+        if self.glyphs is not None and self.glyphs.supports(line):
+            return self.glyphs.getsize(line)[0]
+        return getsize(self.font, line)[0]
+
+    def draw(self, img: Image.Image, x: int = 0, y: int = 0):
+        """draw the block with its top left at x, y, clipped to its own box"""
+        origin = (x, y)
+        clip = (x, y, x + self.width, y + self.height)
+
+        with metrics.render_stage_seconds.time(stage="text"):
+            for idx, (line, line_width) in enumerate(zip(self.lines, self.widths)):
+                if self.alignment == HAlignment.left:
+                    xofs = 0
+                elif self.alignment == HAlignment.center:
+                    xofs = (self.width - line_width) / 2
+                else:
+                    xofs = self.width - line_width
+
+                xy = (xofs, (idx * self.height_per_row) + self.line_ofs)
+                if self.glyphs is not None and self.glyphs.supports(line):
+                    self.glyphs.draw(img, xy, line, origin, clip)
+                else:
+                    draw_text(img, xy, line, self.font, origin, clip)
@@ -0,0 +1,149 @@
+import json
+import logging
+import os
+import threading
+from typing import Optional
+
+from pt750.models import settings
+
+FONT_EXTENSIONS = (".ttf", ".otf", ".ttc")
+
+# the usual fontconfig locations, settings.font_dirs are searched after
+# these and win on a name collision
+DEFAULT_FONT_DIRS = [
+    "/usr/share/fonts",
+    "/usr/local/share/fonts",
+    "~/.local/share/fonts",
+    "~/.fonts",
+    "/Library/Fonts",
+    "/System/Library/Fonts",
+]
+
+INDEX_VERSION = 1
+
+
+def _mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class FontIndex:
+    """map of font file names to paths, found by walking font directories
+
+    The index remembers the mtime of every directory it walked, so a
+    persisted copy can be validated with one stat per directory rather
+    than a full rescan.
+    """
+
+    def __init__(self, roots: list[str], cache_path: Optional[str] = None):
+        self.roots = [os.path.expanduser(x) for x in roots]
+        self.cache_path = os.path.expanduser(cache_path) if cache_path else None
+        self.dirs: dict[str, Optional[int]] = {}
+        self.fonts: dict[str, str] = {}
+        self.ready = False
+        self._lock = threading.Lock()
+
+    def scan(self):
+        dirs: dict[str, Optional[int]] = {}
+        fonts: dict[str, str] = {}
+
+        for root in self.roots:
+            dirs[root] = _mtime(root)
+            if dirs[root] is None:
+                continue
+
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames.sort()
+                dirs[dirpath] = _mtime(dirpath)
+
+                for filename in sorted(filenames):
+                    if filename.lower().endswith(FONT_EXTENSIONS):
+                        fonts[filename] = os.path.join(dirpath, filename)
+
+        self.dirs = dirs
+        self.fonts = fonts
+
+    def load(self) -> bool:
+        if not self.cache_path:
+            return False
+
+        try:
+            with open(self.cache_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if index.get("version") != INDEX_VERSION or index.get("roots") != self.roots:
+            return False
+
+        dirs = index.get("dirs", {})
+        if any(_mtime(path) != mtime for path, mtime in dirs.items()):
+            return False
+
+        self.dirs = dirs
+        self.fonts = index.get("fonts", {})
+        return True
+
+    def save(self):
+        if not self.cache_path:
+            return
+
+        index = {
+            "version": INDEX_VERSION,
+            "roots": self.roots,
+            "dirs": self.dirs,
+            "fonts": self.fonts,
+        }
+
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump(index, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logging.warning(f"Cannot write font index {self.cache_path}: {e}")
+
+    def warm(self):
+        with self._lock:
+            if self.ready:
+                return
+
+            if not self.load():
+                self.scan()
+                self.save()
+
+            self.ready = True
+
+    def lookup(self, fontname: str) -> Optional[str]:
+        self.warm()
+
+        path = self.fonts.get(fontname)
+        if path is None:
+            for ext in FONT_EXTENSIONS:
+                path = self.fonts.get(f"{fontname}{ext}")
+                if path is not None:
+                    break
+
+        return path
+
+
+def _font_roots() -> list[str]:
+    roots = list(DEFAULT_FONT_DIRS)
+    if settings.font_dirs:
+        roots += settings.font_dirs
+
+    return roots
+
+
+registry = FontIndex(_font_roots(), settings.font_index)
+
+
+def warm():
+    registry.warm()
+
+
+def lookup(fontname: str) -> Optional[str]:
+    return registry.lookup(fontname)
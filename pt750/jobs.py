@@ -0,0 +1,206 @@
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional, Union
+
+from pt750.models import JobState, PrintJob, settings
+from pt750.spool import Entry, Spool, SpoolError
+
+# a job's bytes, or chunks of them produced as they are sent
+Job = Union[bytes, Iterable[bytes]]
+
+# renders a job's bytes, and may record per-item errors on the job
+Render = Callable[[PrintJob], Job]
+
+# every job, newest last, trimmed to settings.job_history finished jobs
+_jobs: OrderedDict[str, PrintJob] = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def _remember(job: PrintJob):
+    with _jobs_lock:
+        _jobs[job.id] = job
+
+        excess = len(_jobs) - settings.job_history
+        for job_id in [k for k, v in _jobs.items() if v.finished][: max(excess, 0)]:
+            del _jobs[job_id]
+
+
+def get_job(job_id: str) -> Optional[PrintJob]:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def list_jobs(printer: Optional[str] = None) -> list[PrintJob]:
+    with _jobs_lock:
+        return [x for x in _jobs.values() if printer is None or x.printer == printer]
+
+
+def wait_for(job: PrintJob, timeout: Optional[float] = None) -> bool:
+    """wait until the job is finished, or spooled but its printer failed"""
+    return job._done.wait(timeout)
+
+
+def _finish(job: PrintJob, state: JobState, error: Optional[str] = None):
+    job.state = state
+    job.error = error
+    job.finished_at = time.time()
+    job._done.set()
+
+
+class PrintQueue:
+    """jobs for one printer, rendered and sent in order by a worker thread
+
+    Each job is submitted with a render function that produces the bytes
+    to hand to send, so a slow printer only holds up its own queue.  A
+    render that returns an iterable is encoded while it is sent, and
+    that time counts as send_time.
+
+    With a spool, jobs are instead encoded into the spool and then sent
+    from it, oldest first unless reordered.  A job the printer fails
+    stays spooled, and sending is retried every spool_retry_interval or
+    when another job arrives.  Jobs left in the spool by a previous run
+    are sent before anything new.
+    """
+
+    def __init__(
+        self,
+        printer: str,
+        send: Callable[[Job], None],
+        spool: Optional[Spool] = None,
+    ):
+        self.printer = printer
+        self.send = send
+        self.spool = spool
+
+        if spool is not None:
+            for entry in spool.pending():
+                self._spooled_job(entry)
+
+        self._queue: queue.Queue[tuple[PrintJob, Render]] = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name=f"print-{printer}", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def depth(self) -> int:
+        spooled = len(self.spool) if self.spool is not None else 0
+        return self._queue.qsize() + spooled
+
+    def submit(self, render: Render) -> PrintJob:
+        job = PrintJob(id=uuid.uuid4().hex, printer=self.printer, queued_at=time.time())
+        _remember(job)
+
+        self._queue.put((job, render))
+        return job
+
+    def cancel(self, job_id: str) -> PrintJob:
+        """drop a spooled job that is not being sent"""
+        if self.spool is None:
+            raise SpoolError("spooling is turned off")
+
+        self.spool.cancel(job_id)
+
+        job = get_job(job_id)
+        if job is None:
+            job = PrintJob(id=job_id, printer=self.printer, queued_at=time.time())
+            _remember(job)
+
+        _finish(job, JobState.cancelled)
+        return job
+
+    def _run(self):
+        while True:
+            timeout = None
+            if self.spool is not None and not self._drain():
+                timeout = settings.spool_retry_interval
+
+            try:
+                job, render = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                continue
+
+            try:
+                self._process(job, render)
+            finally:
+                self._queue.task_done()
+
+    def _process(self, job: PrintJob, render: Render):
+        job.started_at = time.time()
+
+        try:
+            job.state = JobState.rendering
+            start = time.perf_counter()
+            data = render(job)
+
+            if self.spool is not None:
+                # encoded as it is written, and sent by _drain
+                self.spool.append(job.id, job.queued_at, data)
+                job.render_time = time.perf_counter() - start
+                job.state = JobState.spooled
+                return
+
+            job.render_time = time.perf_counter() - start
+
+            job.state = JobState.sending
+            start = time.perf_counter()
+            self.send(data)
+            job.send_time = time.perf_counter() - start
+
+            _finish(job, JobState.done)
+        except Exception as e:
+            logging.exception(f"Print job {job.id} on {self.printer} failed")
+            job._exception = e
+            _finish(job, JobState.failed, str(e))
+
+    def _spooled_job(self, entry: Entry) -> PrintJob:
+        job = get_job(entry.id)
+        if job is None:
+            # from before a restart, or dropped from the history
+            job = PrintJob(
+                id=entry.id,
+                printer=self.printer,
+                queued_at=entry.queued_at,
+                state=JobState.spooled,
+            )
+            _remember(job)
+
+        return job
+
+    def _drain(self) -> bool:
+        """send spooled jobs in order, False if the printer failed one"""
+        assert self.spool is not None
+
+        while (entry := self.spool.take()) is not None:
+            job = self._spooled_job(entry)
+            try:
+                job.state = JobState.sending
+                if job.started_at is None:
+                    job.started_at = time.time()
+
+                start = time.perf_counter()
+                self.send(self.spool.read(entry.id))
+                job.send_time = time.perf_counter() - start
+
+                # marked while still held, so a printed job cannot be
+                # cancelled
+                self.spool.mark_sent(entry.id)
+            except Exception as e:
+                logging.warning(f"Print job {job.id} on {self.printer} kept: {e}")
+                job.state = JobState.spooled
+                job.error = str(e)
+                # waiters on this job and those held behind it are told
+                # now, rather than when the printer is back
+                for held in self.spool.pending():
+                    self._spooled_job(held)._done.set()
+                return False
+            finally:
+                self.spool.release()
+
+            _finish(job, JobState.done)
+
+        return True
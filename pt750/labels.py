@@ -1,27 +1,69 @@
-import cv2
-from typing import Optional
+from typing import Optional, Protocol
 
 from PIL import Image, ImageDraw
 
 from pt750 import draw, models
 
+# dots across the print head, the height of a printer-ready image
+PRINT_HEAD_DOTS = 128
+
+
+class Part(Protocol):
+    """something a label lays out by width and later draws at an offset"""
+
+    width: int
+
+    def draw(self, img: Image.Image, x: int, y: int): ...
+
+
+class ImagePart:
+    """an already rendered image, such as a qr code, pasted as-is"""
+
+    def __init__(self, img: Image.Image):
+        self.img = img
+        self.width = img.width
+
+    def draw(self, img: Image.Image, x: int, y: int):
+        img.paste(self.img, (x, y))
+
 
 class Label:
-    def __init__(self):
-        self.img = None
+    """a label laid out as parts side by side, drawn only when needed
+
+    generate() fills in parts and width.  Drawing the parts straight
+    into one image, either the label alone or a whole print head high
+    image at the tape's offset, avoids compositing intermediate images.
+    """
+
+    height: int
+    width: int = 0
+    parts: list[tuple[int, Part]] = []
+    img: Optional[Image.Image] = None
+
+    def draw(self, img: Image.Image, x: int, y: int):
+        """draw the label with its top left at x, y"""
+        for ofs, part in self.parts:
+            part.draw(img, x + ofs, y)
 
     @property
-    def image(self):
+    def image(self) -> Image.Image:
+        if self.img is None:
+            self.img = Image.new(mode="1", size=(self.width, self.height), color=1)
+            self.draw(self.img, 0, 0)
         return self.img
 
+    def tape_image(self, tape: str) -> Image.Image:
+        """the label drawn where it sits across the print head on tape"""
+        img = Image.new(mode="1", size=(self.width, PRINT_HEAD_DOTS), color=1)
+        self.draw(img, 0, models.tapes[tape].offset)
+        return img
+
     @property
     def bytes(self):
-        assert self.img
-        return self.img.to_bytes()
+        return self.image.tobytes()
 
     def save(self, filename: str):
-        assert self.img
-        self.img.save(filename)
+        self.image.save(filename)
 
 
 class TextLabel(Label):
@@ -45,10 +87,11 @@ class TextLabel(Label):
         self.generate()
 
     def generate(self):
-        img = draw.horiz_text_block(
+        block = draw.TextBlock(
             self.height, self.fontname, self.size, self.lines, alignment=self.align
         )
-        self.img = img
+        self.parts = [(0, block)]
+        self.width = block.width
 
 
 class QRLabel(Label):
@@ -79,18 +122,15 @@ class QRLabel(Label):
 
     def generate(self):
         qr_img = draw.qr_code(self.height, self.qrtext)
+        self.parts = [(0, ImagePart(qr_img))]
+        self.width = qr_img.width
+
         if self.lines and all(x for x in self.lines):
-            text_img = draw.horiz_text_block(
+            block = draw.TextBlock(
                 self.height, self.fontname, self.size, self.lines, self.align
             )
-            width = qr_img.width + text_img.width + self.padding
-            img = Image.new(mode="1", size=(width, self.height), color=1)
-            img.paste(qr_img)
-            img.paste(text_img, (qr_img.width + self.padding, 0))
-        else:
-            img = qr_img
-
-        self.img = img
+            self.parts.append((qr_img.width + self.padding, block))
+            self.width += self.padding + block.width
 
 
 class ArucoLabel(Label):
@@ -123,24 +163,18 @@ class ArucoLabel(Label):
 
     def generate(self):
         dictionary_idx = getattr(models.ArucoDictionary, self.dictionary, 0)
-        aruco_dict = cv2.aruco.getPredefinedDictionary(dictionary_idx)
-        aruco_cv_img = cv2.aruco.generateImageMarker(aruco_dict, self.id, self.height)
-
-        color_coverted = cv2.cvtColor(aruco_cv_img, cv2.COLOR_BGR2RGB)
-        aruco_img = Image.fromarray(color_coverted)
+        aruco_img = draw.aruco_marker(
+            int(dictionary_idx), self.id, self.height, copy=False
+        )
+        self.parts = [(0, ImagePart(aruco_img))]
+        self.width = aruco_img.width
 
         if self.lines and all(x for x in self.lines):
-            text_img = draw.horiz_text_block(
+            block = draw.TextBlock(
                 self.height, self.fontname, self.size, self.lines, self.align
             )
-            width = aruco_img.width + text_img.width + self.padding
-            img = Image.new(mode="1", size=(width, self.height), color=1)
-            img.paste(aruco_img)
-            img.paste(text_img, (aruco_img.width + self.padding, 0))
-        else:
-            img = aruco_img
-
-        self.img = img
+            self.parts.append((aruco_img.width + self.padding, block))
+            self.width += self.padding + block.width
 
 
 class WrapLabel(Label):
@@ -171,7 +205,8 @@ class WrapLabel(Label):
             self.label,
             min_count=self.min_count,
         )
-        self.img = img
+        self.parts = [(0, ImagePart(img))]
+        self.width = img.width
 
 
 class FlagLabel(Label):
@@ -188,16 +223,80 @@ class FlagLabel(Label):
         self.generate()
 
     def generate(self):
-        text_img = draw.horiz_text_block(
+        block = draw.TextBlock(
             self.height, self.fontname, self.size, lines=[self.label]
         )
 
-        width = (text_img.width * 2) + self.padding
-        img = Image.new(mode="1", size=(width, self.height), color=1)
-        img.paste(text_img)
-        img.paste(text_img, (text_img.width + self.padding, 0))
+        self.parts = [(0, block)]
+        self.width = (block.width * 2) + self.padding
+        self.middle = block.width + (self.padding // 2)
+
+    def draw(self, img: Image.Image, x: int, y: int):
+        super().draw(img, x, y)
+
+        # the text again, copied rather than drawn a second time
+        text_width = self.parts[0][1].width
+        text = img.crop((x, y, x + text_width, y + self.height))
+        img.paste(text, (x + text_width + self.padding, y))
+
+        # the fold line, kept inside the label's rows
         img_draw = ImageDraw.Draw(img)
-        middle = text_img.width + (self.padding // 2)
-        img_draw.line(((middle, 0), (middle, self.height)), width=1)
+        middle = x + self.middle
+        img_draw.line(((middle, y), (middle, y + self.height - 1)), width=1)
 
-        self.img = img
+
+label_classes = {
+    "text": TextLabel,
+    "qr": QRLabel,
+    "aruco": ArucoLabel,
+    "wrap": WrapLabel,
+    "flag": FlagLabel,
+}
+
+
+def from_request(label: models.BaseLabel) -> Label:
+    """build the label described by one of the label request models"""
+    label_info = label.model_dump()
+
+    label_type = label_info.pop("label_type")
+
+    _ = label_info.pop("printer")
+    tape = label_info.pop("tape").value
+
+    height = models.tapes[tape].printable_height
+
+    if label_type not in label_classes:
+        raise models.ParameterError(f"cannot render {label_type} labels")
+
+    if label_type == "text" and not label_info["lines"]:
+        raise models.ParameterError("must supply some lines to print")
+
+    return label_classes[label_type](height=height, **label_info)
+
+
+def off_tape(img: Image.Image, tape: str) -> Image.Image:
+    """the label alone, from an image of it across the print head"""
+    offset = models.tapes[tape].offset
+    return img.crop(
+        (0, offset, img.width, offset + models.tapes[tape].printable_height)
+    )
+
+
+def render(label: models.BaseLabel) -> Image.Image:
+    """a label request drawn straight into a printer-ready image"""
+    return from_request(label).tape_image(label.tape.value)
+
+
+def shrink(img: Image.Image, max_width: int) -> Image.Image:
+    """a 1-bit image scaled down to max_width, for previews
+
+    Pixels are averaged into grey rather than picked, so thin strokes
+    survive.  Whole-factor box reduction does most of the work.
+    """
+    if not max_width or img.width <= max_width:
+        return img
+
+    height = max(int(img.height * max_width / img.width), 1)
+    return img.convert("L").resize(
+        (max_width, height), Image.Resampling.BOX, reducing_gap=1.0
+    )
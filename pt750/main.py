@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
 
 import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
-from PIL import Image
-
-from pt750 import labels, models, transports
+from pt750 import labels, models, series, transports
 
 
 def get_parser():
@@ -14,6 +16,10 @@ def get_parser():
     parser.add_argument("--printer")
     parser.add_argument("--tape", default="24mm")
     parser.add_argument("--font", default="mono")
+    parser.add_argument("--count", type=int, default=1, help="number of copies")
+    parser.add_argument(
+        "--uncompressed", action="store_true", help="send raster lines uncompressed"
+    )
 
     subparsers = parser.add_subparsers(help="kind of label", dest="kind")
     subparsers.required = True
@@ -47,15 +53,184 @@ def get_parser():
     flag_parser.add_argument("--size", default="large")
     flag_parser.add_argument("label")
 
+    batch_parser = subparsers.add_parser("batch")
+    batch_parser.add_argument("--workers", type=int, default=4)
+    batch_parser.add_argument(
+        "file", help="JSON list or JSON lines of label requests, - for stdin"
+    )
+
+    series_parser = subparsers.add_parser("series")
+    series_parser.add_argument(
+        "template",
+        help="JSON label with {name} placeholders, printer, tape and font default "
+        "to the global options",
+    )
+    series_parser.add_argument(
+        "--counter",
+        action="append",
+        default=[],
+        metavar="NAME=START:STOP[:STEP]",
+        help="count NAME from START to STOP inclusive, may be repeated",
+    )
+    series_parser.add_argument(
+        "--rows", help="CSV with a header line, or JSON lines, - for stdin"
+    )
+    series_parser.add_argument(
+        "--rows-format",
+        choices=["csv", "jsonl"],
+        help="format of --rows, by default from its extension",
+    )
+    series_parser.add_argument(
+        "--chunk", type=int, default=50, help="labels sent per printer job"
+    )
+
     return parser
 
 
+def load_batch(f) -> list[models.LabelRequest]:
+    text = f.read()
+
+    if text.lstrip().startswith("["):
+        items = json.loads(text)
+    else:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    return [models.LabelRequest.model_validate(x) for x in items]
+
+
+def batch(args):
+    if args.file == "-":
+        items = load_batch(sys.stdin)
+    else:
+        with open(args.file) as f:
+            items = load_batch(f)
+
+    printer = None
+    if args.printer:
+        printer = transports.PT750W(args.printer, compress=not args.uncompressed)
+
+    def render(item: models.LabelRequest):
+        img = labels.render(item.label)
+        if printer:
+            return printer.encode_page(img)
+        return img
+
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(render, item) for item in items]
+
+    # report failed labels, but still print the rest
+    failures = 0
+    pages = []
+    root, ext = os.path.splitext(args.outfile)
+
+    for idx, (item, future) in enumerate(zip(items, futures)):
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"label {idx}: {e}", file=sys.stderr)
+            failures += 1
+            continue
+
+        if printer:
+            pages += [result] * item.count
+        else:
+            outfile = f"{root}-{idx}{ext}"
+            print(f"saving to {outfile}")
+            result.save(outfile)
+
+    if printer and pages:
+        print(f"sending {len(pages)} labels to printer")
+        printer.transport.send_bytes(printer.encode_pages(pages))
+
+    return 1 if failures else 0
+
+
+def run_series(args, rows):
+    template = json.loads(args.template)
+    template.setdefault("printer", "default")
+    template.setdefault("tape", args.tape)
+    template.setdefault("fontname", args.font)
+
+    if rows is not None:
+        values = rows
+    elif args.counter:
+        values = series.counter_values(dict(map(series.parse_counter, args.counter)))
+    else:
+        raise models.ParameterError("A series needs --counter or --rows")
+
+    items = series.expand_values(template, values, count=args.count)
+    errors: list[models.ItemError] = []
+
+    # labels are rendered and sent a chunk at a time, so memory use
+    # does not grow with the length of the series
+    if args.printer:
+        printer = transports.PT750W(args.printer, compress=not args.uncompressed)
+        pages = series.render_pages(printer, items, errors)
+        for idx, job in enumerate(series.print_jobs(printer, pages, args.chunk)):
+            print(f"sending job {idx} to printer")
+            printer.transport.send_bytes(job)
+    else:
+        root, ext = os.path.splitext(args.outfile)
+        for idx, item in items:
+            if isinstance(item, models.ItemError):
+                errors.append(item)
+                continue
+
+            try:
+                img = labels.render(item.label)
+            except Exception as e:
+                errors.append(models.ItemError(index=idx, error=str(e)))
+                continue
+
+            outfile = f"{root}-{idx}{ext}"
+            print(f"saving to {outfile}")
+            img.save(outfile)
+
+    # report failed rows, but still print the rest
+    for error in errors:
+        print(f"row {error.index}: {error.error}", file=sys.stderr)
+    if errors:
+        rows = ", ".join(str(x.index) for x in errors)
+        raise models.ParameterError(f"rows not printed: {rows}")
+
+
+def run_series_file(args):
+    if not args.rows:
+        return run_series(args, None)
+
+    fmt = args.rows_format
+    if fmt is None:
+        fmt = "jsonl" if args.rows.endswith((".jsonl", ".json")) else "csv"
+
+    if args.rows == "-":
+        return run_series(args, series.read_rows(sys.stdin, fmt))
+
+    with open(args.rows, newline="") as f:
+        return run_series(args, series.read_rows(f, fmt))
+
+
 def main():
-    args = get_parser().parse_args()
-    height = models.tapes[args.tape]["printable_height"]
-    final_ofs = models.tapes[args.tape]["offset"]
+    parser = get_parser()
+    args = parser.parse_args()
 
-    img = None
+    if args.count < 1:
+        parser.error("--count must be at least 1")
+
+    if args.kind == "batch":
+        sys.exit(batch(args))
+
+    if args.kind == "series":
+        if args.chunk < 1:
+            parser.error("--chunk must be at least 1")
+
+        try:
+            run_series_file(args)
+        except models.ParameterError as e:
+            print(f"error: {e}", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    height = models.tapes[args.tape].printable_height
 
     if args.kind == "text":
         align = models.HAlignment(args.align)
@@ -63,8 +238,6 @@ def main():
             height, args.font, args.line, align=align, size=args.size
         )
 
-        img = label.image
-
     elif args.kind == "qr":
         align = models.HAlignment(args.align)
 
@@ -77,37 +250,31 @@ def main():
             align=align,
             lines=args.line,
         )
-        img = label.image
-    elif args.kind == "ssid":
+    elif args.kind == "wifi":
         qrtext = f"WIFI:T:WPA;S:{args.ssid};P:{args.password};;"
         lines = [f"SSID: {args.ssid}", f"PASS: {args.password}"]
 
         label = labels.QRLabel(
             height, args.font, qrtext, size=args.size, padding=args.padding, lines=lines
         )
-        img = label.image
     elif args.kind == "wrap":
         label = labels.WrapLabel(
             height, args.font, args.label, length=args.length, min_count=args.min_count
         )
-        img = label.image
 
     elif args.kind == "flag":
         label = labels.FlagLabel(
             height, args.font, args.label, size=args.size, padding=args.padding
         )
-        img = label.image
     else:
         raise RuntimeError("invalid label kind")
 
-    final_width = img.width
-    out_img = Image.new(mode="1", size=(final_width, 128), color=1)
-    out_img.paste(img, (0, final_ofs))
+    out_img = label.tape_image(args.tape)
 
     if args.printer:
         print("sending to printer")
-        printer = transports.PT750W(args.printer)
-        printer.print(out_img)
+        printer = transports.PT750W(args.printer, compress=not args.uncompressed)
+        printer.print(out_img, count=args.count)
     else:
         print(f"saving to {args.outfile}")
         out_img.save(args.outfile)
@@ -0,0 +1,228 @@
+"""timing histograms and counters, exposed in the prometheus text format
+
+Collection is skipped when settings.metrics is off, so instrumented
+code only pays for one attribute check.
+"""
+
+import bisect
+import math
+import threading
+import time
+from typing import Callable, Iterable
+
+from pt750.models import settings
+
+# seconds, from a cached lookup up to a slow network send
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+_registry: list["Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], **extra) -> str:
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ""
+
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+
+    return repr(float(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels[x]) for x in self.labelnames)
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def exposition(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not settings.metrics:
+            return
+
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+
+        return [
+            f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}"
+            for k, v in sorted(values.items())
+        ]
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_null_timer = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: "Histogram", labels: dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # per label values: a count for each bucket, the sum and the count
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        if not settings.metrics:
+            return
+
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            counts, total = self._values[key]
+            counts[idx] += 1
+            total[0] += value
+
+    def time(self, **labels):
+        """context manager observing the time spent inside it"""
+        if not settings.metrics:
+            return _null_timer
+
+        return _Timer(self, labels)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = {k: (list(v[0]), v[1][0]) for k, v in self._values.items()}
+
+        lines = []
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, le=_format_value(bound))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+
+        return lines
+
+
+class Gauge(Metric):
+    """a value read from the app when scraped, one per label set"""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...],
+        collect: Callable[[], dict[tuple[str, ...], float]],
+    ):
+        super().__init__(name, help, labelnames)
+        self.collect = collect
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}"
+            for k, v in sorted(self.collect().items())
+        ]
+
+
+def exposition() -> str:
+    """every metric, in the prometheus text format"""
+    return "\n".join(x.exposition() for x in _registry) + "\n"
+
+
+def hit_ratio(info: dict[str, int]) -> float:
+    lookups = info["hits"] + info["misses"]
+    return info["hits"] / lookups if lookups else 0.0
+
+
+render_stage_seconds = Histogram(
+    "pt750_render_stage_seconds",
+    "Time spent in each stage of rendering a label",
+    ("stage",),
+)
+encode_seconds = Histogram(
+    "pt750_encode_seconds", "Time spent encoding a label as raster lines"
+)
+transport_seconds = Histogram(
+    "pt750_transport_seconds",
+    "Time spent sending jobs to and getting status from each printer",
+    ("printer", "operation"),
+)
+bytes_sent = Counter(
+    "pt750_bytes_sent_total", "Bytes of print jobs sent to each printer", ("printer",)
+)
+previews_superseded = Counter(
+    "pt750_previews_superseded_total",
+    "Live previews replaced by a newer request before they were rendered",
+)
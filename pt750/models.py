@@ -1,8 +1,8 @@
+import threading
 from enum import Enum, IntEnum
-from typing import Any, Literal, Union
+from typing import Any, Literal, Optional, Union
 
-import cv2
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, field_validator, PrivateAttr
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -24,27 +24,29 @@ class Tapes(Enum):
 
 
 class ArucoDictionary(IntEnum):
-    DICT_4X4_50 = cv2.aruco.DICT_4X4_50
-    DICT_4X4_100 = cv2.aruco.DICT_4X4_100
-    DICT_4X4_250 = cv2.aruco.DICT_4X4_250
-    DICT_4X4_1000 = cv2.aruco.DICT_4X4_1000
-    DICT_5X5_50 = cv2.aruco.DICT_5X5_50
-    DICT_5X5_100 = cv2.aruco.DICT_5X5_100
-    DICT_5X5_250 = cv2.aruco.DICT_5X5_250
-    DICT_5X5_1000 = cv2.aruco.DICT_5X5_1000
-    DICT_6X6_50 = cv2.aruco.DICT_6X6_50
-    DICT_6X6_100 = cv2.aruco.DICT_6X6_100
-    DICT_6X6_250 = cv2.aruco.DICT_6X6_250
-    DICT_6X6_1000 = cv2.aruco.DICT_6X6_1000
-    DICT_7X7_50 = cv2.aruco.DICT_7X7_50
-    DICT_7X7_100 = cv2.aruco.DICT_7X7_100
-    DICT_7X7_250 = cv2.aruco.DICT_7X7_250
-    DICT_7X7_1000 = cv2.aruco.DICT_7X7_1000
-    DICT_ARUCO_ORIGINAL = cv2.aruco.DICT_ARUCO_ORIGINAL
-    DICT_APRILTAG_16h5 = cv2.aruco.DICT_APRILTAG_16h5
-    DICT_APRILTAG_25h9 = cv2.aruco.DICT_APRILTAG_25h9
-    DICT_APRILTAG_36h10 = cv2.aruco.DICT_APRILTAG_36h10
-    DICT_APRILTAG_36h11 = cv2.aruco.DICT_APRILTAG_36h11
+    # values of the matching cv2.aruco constants, kept here so that
+    # importing the models does not load opencv
+    DICT_4X4_50 = 0
+    DICT_4X4_100 = 1
+    DICT_4X4_250 = 2
+    DICT_4X4_1000 = 3
+    DICT_5X5_50 = 4
+    DICT_5X5_100 = 5
+    DICT_5X5_250 = 6
+    DICT_5X5_1000 = 7
+    DICT_6X6_50 = 8
+    DICT_6X6_100 = 9
+    DICT_6X6_250 = 10
+    DICT_6X6_1000 = 11
+    DICT_7X7_50 = 12
+    DICT_7X7_100 = 13
+    DICT_7X7_250 = 14
+    DICT_7X7_1000 = 15
+    DICT_ARUCO_ORIGINAL = 16
+    DICT_APRILTAG_16h5 = 17
+    DICT_APRILTAG_25h9 = 18
+    DICT_APRILTAG_36h10 = 19
+    DICT_APRILTAG_36h11 = 20
 
 
 tapes = {
@@ -132,12 +134,81 @@ class LabelRequest(BaseModel):
         TextLabelRequest,
         WrapLabelRequest,
     ] = Field(discriminator="label_type")
-    count: int = 1
+    count: int = Field(default=1, ge=1)
+
+
+class BatchRequest(BaseModel):
+    labels: list[LabelRequest]
+
+
+class Counter(BaseModel):
+    start: int = 1
+    stop: int  # inclusive
+    step: int = 1
+
+    @field_validator("step")
+    @classmethod
+    def nonzero(cls, value: int) -> int:
+        if value == 0:
+            raise ValueError("step cannot be 0")
+
+        return value
+
+    def values(self) -> range:
+        return range(self.start, self.stop + (1 if self.step > 0 else -1), self.step)
+
+
+class SeriesRequest(BaseModel):
+    # a label, as in LabelRequest, whose strings may hold {name}
+    # placeholders filled from the counters or from each row
+    template: dict[str, Any]
+    counters: dict[str, Counter] = {}
+    rows: list[dict[str, Any]] = []
+    count: int = Field(default=1, ge=1)
 
 
 class PrinterStatus(BaseModel):
     media: Tapes | None = None
     ready: bool
+    error: Optional[str] = None
+    updated_at: Optional[float] = None
+
+
+class JobState(Enum):
+    queued = "queued"
+    rendering = "rendering"
+    sending = "sending"
+    spooled = "spooled"
+    done = "done"
+    failed = "failed"
+    cancelled = "cancelled"
+
+
+class ItemError(BaseModel):
+    index: int
+    error: str
+
+
+class PrintJob(BaseModel):
+    id: str
+    printer: str
+    state: JobState = JobState.queued
+    error: Optional[str] = None
+
+    queued_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    render_time: Optional[float] = None
+    send_time: Optional[float] = None
+    item_errors: list[ItemError] = []
+
+    _done: threading.Event = PrivateAttr(default_factory=threading.Event)
+    # what a failed job raised, to tell bad requests from printer faults
+    _exception: Optional[Exception] = PrivateAttr(default=None)
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (JobState.done, JobState.failed, JobState.cancelled)
 
 
 class Settings(BaseSettings):
@@ -145,6 +216,30 @@ class Settings(BaseSettings):
     font_dirs: Union[None, str, list[str]] = None
     font_map: Union[str, dict[str, str]] = ""
     port: int = 5000
+    face_cache_size: int = 64
+    glyph_atlas: bool = True
+    metrics: bool = True
+    font_index: str = "~/.cache/pt750/fonts.json"
+    qr_backend: str = "native"
+    qr_ecc: str = "M"
+    render_cache_size: int = 256
+    render_cache_dir: Optional[str] = None
+    raster_compression: bool = True
+    tcp_send_timeout: float = 10.0
+    tcp_idle_timeout: float = 60.0
+    tcp_reuse: bool = True
+    http_timeout: float = 30.0
+    http2: bool = False
+    series_chunk: int = 50
+    spool_dir: Optional[str] = None
+    spool_max_bytes: int = 256 * 1024 * 1024
+    spool_retry_interval: float = 5.0
+    job_history: int = 1000
+    job_wait_timeout: float = 60.0
+    status_interval: float = 10.0
+    status_timeout: float = 5.0
+    render_executor: str = "thread"
+    render_workers: int = 4
 
     model_config = SettingsConfigDict(env_prefix="l_")
 
@@ -0,0 +1,413 @@
+"""in-process QR code encoder (byte mode, versions 1-40)
+
+This follows ISO/IEC 18004: the data is placed in a single byte mode
+segment, the smallest version that fits is chosen for the requested
+error correction level, and the mask with the lowest penalty score is
+applied.
+"""
+
+from typing import Optional
+
+from PIL import Image
+
+from pt750.models import ParameterError
+
+# per error correction level: format bits, then ecc codewords per block
+# and number of blocks, each indexed by version (index 0 unused)
+ECC_LEVELS = {
+    "L": 1,
+    "M": 0,
+    "Q": 3,
+    "H": 2,
+}
+
+ECC_CODEWORDS_PER_BLOCK = {
+    # fmt: off
+    "L": [-1, 7, 10, 15, 20, 26, 18, 20, 24, 30, 18, 20, 24, 26, 30, 22, 24, 28,
+          30, 28, 28, 28, 28, 30, 30, 26, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30,
+          30, 30, 30, 30, 30],
+    "M": [-1, 10, 16, 26, 18, 24, 16, 18, 22, 22, 26, 30, 22, 22, 24, 24, 28, 28,
+          26, 26, 26, 26, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28,
+          28, 28, 28, 28, 28],
+    "Q": [-1, 13, 22, 18, 26, 18, 24, 18, 22, 20, 24, 28, 26, 24, 20, 30, 24, 28,
+          28, 26, 30, 28, 30, 30, 30, 30, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30,
+          30, 30, 30, 30, 30],
+    "H": [-1, 17, 28, 22, 16, 22, 28, 26, 26, 24, 28, 24, 28, 22, 24, 24, 30, 28,
+          28, 26, 28, 30, 24, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30,
+          30, 30, 30, 30, 30],
+    # fmt: on
+}
+
+NUM_ERROR_CORRECTION_BLOCKS = {
+    # fmt: off
+    "L": [-1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 4, 4, 4, 4, 4, 6, 6, 6, 6, 7, 8, 8, 9, 9,
+          10, 12, 12, 12, 13, 14, 15, 16, 17, 18, 19, 19, 20, 21, 22, 24, 25],
+    "M": [-1, 1, 1, 1, 2, 2, 4, 4, 4, 5, 5, 5, 8, 9, 9, 10, 10, 11, 13, 14, 16, 17,
+          17, 18, 20, 21, 23, 25, 26, 28, 29, 31, 33, 35, 37, 38, 40, 43, 45, 47,
+          49],
+    "Q": [-1, 1, 1, 2, 2, 4, 4, 6, 6, 8, 8, 8, 10, 12, 16, 12, 17, 16, 18, 21, 20,
+          23, 23, 25, 27, 29, 34, 34, 35, 38, 40, 43, 45, 48, 51, 53, 56, 59, 62,
+          65, 68],
+    "H": [-1, 1, 1, 2, 4, 4, 4, 5, 6, 8, 8, 11, 11, 16, 16, 18, 16, 19, 21, 25, 25,
+          25, 34, 30, 32, 35, 37, 40, 42, 45, 48, 51, 54, 57, 60, 63, 66, 70, 74,
+          77, 81],
+    # fmt: on
+}
+
+MIN_VERSION = 1
+MAX_VERSION = 40
+
+PENALTY_N1 = 3
+PENALTY_N2 = 3
+PENALTY_N3 = 40
+PENALTY_N4 = 10
+
+MASKS = [
+    lambda x, y: (x + y) % 2 == 0,
+    lambda x, y: y % 2 == 0,
+    lambda x, y: x % 3 == 0,
+    lambda x, y: (x + y) % 3 == 0,
+    lambda x, y: (x // 3 + y // 2) % 2 == 0,
+    lambda x, y: x * y % 2 + x * y % 3 == 0,
+    lambda x, y: (x * y % 2 + x * y % 3) % 2 == 0,
+    lambda x, y: ((x + y) % 2 + x * y % 3) % 2 == 0,
+]
+
+
+def _get_bit(value: int, idx: int) -> bool:
+    return ((value >> idx) & 1) != 0
+
+
+def _num_raw_data_modules(version: int) -> int:
+    result = (16 * version + 128) * version + 64
+    if version >= 2:
+        num_align = version // 7 + 2
+        result -= (25 * num_align - 10) * num_align - 55
+        if version >= 7:
+            result -= 36
+    return result
+
+
+def _num_data_codewords(version: int, ecc: str) -> int:
+    return (
+        _num_raw_data_modules(version) // 8
+        - ECC_CODEWORDS_PER_BLOCK[ecc][version]
+        * NUM_ERROR_CORRECTION_BLOCKS[ecc][version]
+    )
+
+
+def _char_count_bits(version: int) -> int:
+    return 8 if version <= 9 else 16
+
+
+def _gf_multiply(x: int, y: int) -> int:
+    z = 0
+    for i in reversed(range(8)):
+        z = (z << 1) ^ ((z >> 7) * 0x11D)
+        z ^= ((y >> i) & 1) * x
+    return z
+
+
+def _rs_divisor(degree: int) -> list[int]:
+    result = [0] * (degree - 1) + [1]
+    root = 1
+    for _ in range(degree):
+        for j in range(degree):
+            result[j] = _gf_multiply(result[j], root)
+            if j + 1 < degree:
+                result[j] ^= result[j + 1]
+        root = _gf_multiply(root, 0x02)
+    return result
+
+
+def _rs_remainder(data: bytes, divisor: list[int]) -> list[int]:
+    result = [0] * len(divisor)
+    for b in data:
+        factor = b ^ result.pop(0)
+        result.append(0)
+        for i, coef in enumerate(divisor):
+            result[i] ^= _gf_multiply(coef, factor)
+    return result
+
+
+def _choose_version(length: int, ecc: str) -> int:
+    for version in range(MIN_VERSION, MAX_VERSION + 1):
+        used_bits = 4 + _char_count_bits(version) + length * 8
+        if used_bits <= _num_data_codewords(version, ecc) * 8:
+            return version
+
+    raise ParameterError("QR code text too long")
+
+
+def _data_codewords(data: bytes, version: int, ecc: str) -> bytes:
+    capacity = _num_data_codewords(version, ecc) * 8
+
+    bits: list[int] = []
+
+    def append(value: int, count: int):
+        bits.extend((value >> i) & 1 for i in reversed(range(count)))
+
+    append(0x4, 4)  # byte mode
+    append(len(data), _char_count_bits(version))
+    for b in data:
+        append(b, 8)
+
+    append(0, min(4, capacity - len(bits)))  # terminator
+    append(0, -len(bits) % 8)
+
+    codewords = bytearray()
+    for idx in range(0, len(bits), 8):
+        value = 0
+        for bit in bits[idx : idx + 8]:  # noqa: E203
+            value = (value << 1) | bit
+        codewords.append(value)
+
+    pad = 0xEC
+    while len(codewords) < capacity // 8:
+        codewords.append(pad)
+        pad ^= 0xEC ^ 0x11
+
+    return bytes(codewords)
+
+
+def _add_ecc_and_interleave(data: bytes, version: int, ecc: str) -> bytes:
+    num_blocks = NUM_ERROR_CORRECTION_BLOCKS[ecc][version]
+    block_ecc_len = ECC_CODEWORDS_PER_BLOCK[ecc][version]
+    raw_codewords = _num_raw_data_modules(version) // 8
+    num_short_blocks = num_blocks - raw_codewords % num_blocks
+    short_block_len = raw_codewords // num_blocks
+
+    divisor = _rs_divisor(block_ecc_len)
+    blocks = []
+    k = 0
+    for idx in range(num_blocks):
+        data_len = (
+            short_block_len - block_ecc_len + (0 if idx < num_short_blocks else 1)
+        )
+        block = list(data[k : k + data_len])  # noqa: E203
+        k += data_len
+        block_ecc = _rs_remainder(bytes(block), divisor)
+        if idx < num_short_blocks:
+            block.append(0)
+        blocks.append(block + block_ecc)
+
+    result = bytearray()
+    for i in range(len(blocks[0])):
+        for j, block in enumerate(blocks):
+            # skip the padding byte in short blocks
+            if i != short_block_len - block_ecc_len or j >= num_short_blocks:
+                result.append(block[i])
+
+    return bytes(result)
+
+
+class _Symbol:
+    def __init__(self, version: int, ecc: str):
+        self.version = version
+        self.ecc = ecc
+        self.size = version * 4 + 17
+        self.modules = [[False] * self.size for _ in range(self.size)]
+        self.is_function = [[False] * self.size for _ in range(self.size)]
+
+        self._draw_function_patterns()
+
+    def _set_function(self, x: int, y: int, dark: bool):
+        self.modules[y][x] = dark
+        self.is_function[y][x] = True
+
+    def _alignment_positions(self) -> list[int]:
+        if self.version == 1:
+            return []
+
+        num_align = self.version // 7 + 2
+        step = (self.version * 8 + num_align * 3 + 5) // (num_align * 4 - 4) * 2
+        result = [self.size - 7 - i * step for i in range(num_align - 1)] + [6]
+        return list(reversed(result))
+
+    def _draw_finder(self, x: int, y: int):
+        for dy in range(-4, 5):
+            for dx in range(-4, 5):
+                xx, yy = x + dx, y + dy
+                if 0 <= xx < self.size and 0 <= yy < self.size:
+                    dist = max(abs(dx), abs(dy))
+                    self._set_function(xx, yy, dist not in (2, 4))
+
+    def _draw_alignment(self, x: int, y: int):
+        for dy in range(-2, 3):
+            for dx in range(-2, 3):
+                self._set_function(x + dx, y + dy, max(abs(dx), abs(dy)) != 1)
+
+    def _draw_function_patterns(self):
+        for idx in range(self.size):
+            self._set_function(6, idx, idx % 2 == 0)
+            self._set_function(idx, 6, idx % 2 == 0)
+
+        self._draw_finder(3, 3)
+        self._draw_finder(self.size - 4, 3)
+        self._draw_finder(3, self.size - 4)
+
+        positions = self._alignment_positions()
+        last = len(positions) - 1
+        for i, x in enumerate(positions):
+            for j, y in enumerate(positions):
+                if (i, j) not in ((0, 0), (0, last), (last, 0)):
+                    self._draw_alignment(x, y)
+
+        # reserve the format area, the real bits go in after masking
+        self.draw_format_bits(0)
+        self._draw_version()
+
+    def draw_format_bits(self, mask: int):
+        data = ECC_LEVELS[self.ecc] << 3 | mask
+        rem = data
+        for _ in range(10):
+            rem = (rem << 1) ^ ((rem >> 9) * 0x537)
+        bits = (data << 10 | rem) ^ 0x5412
+
+        for i in range(0, 6):
+            self._set_function(8, i, _get_bit(bits, i))
+        self._set_function(8, 7, _get_bit(bits, 6))
+        self._set_function(8, 8, _get_bit(bits, 7))
+        self._set_function(7, 8, _get_bit(bits, 8))
+        for i in range(9, 15):
+            self._set_function(14 - i, 8, _get_bit(bits, i))
+
+        for i in range(0, 8):
+            self._set_function(self.size - 1 - i, 8, _get_bit(bits, i))
+        for i in range(8, 15):
+            self._set_function(8, self.size - 15 + i, _get_bit(bits, i))
+        self._set_function(8, self.size - 8, True)
+
+    def _draw_version(self):
+        if self.version < 7:
+            return
+
+        rem = self.version
+        for _ in range(12):
+            rem = (rem << 1) ^ ((rem >> 11) * 0x1F25)
+        bits = self.version << 12 | rem
+
+        for i in range(18):
+            bit = _get_bit(bits, i)
+            a = self.size - 11 + i % 3
+            b = i // 3
+            self._set_function(a, b, bit)
+            self._set_function(b, a, bit)
+
+    def draw_codewords(self, data: bytes):
+        i = 0
+        right = self.size - 1
+        while right >= 1:
+            if right == 6:
+                right = 5
+            upward = ((right + 1) & 2) == 0
+            for vert in range(self.size):
+                y = self.size - 1 - vert if upward else vert
+                for j in range(2):
+                    x = right - j
+                    if not self.is_function[y][x] and i < len(data) * 8:
+                        self.modules[y][x] = _get_bit(data[i >> 3], 7 - (i & 7))
+                        i += 1
+            right -= 2
+
+    def apply_mask(self, mask: int):
+        fn = MASKS[mask]
+        for y in range(self.size):
+            row = self.modules[y]
+            function_row = self.is_function[y]
+            for x in range(self.size):
+                if not function_row[x] and fn(x, y):
+                    row[x] = not row[x]
+
+    def penalty(self) -> int:
+        result = 0
+        size = self.size
+        columns = [[row[x] for row in self.modules] for x in range(size)]
+
+        for line in self.modules + columns:
+            # runs of five or more same-colored modules
+            run = 1
+            for idx in range(1, size):
+                if line[idx] == line[idx - 1]:
+                    run += 1
+                else:
+                    if run >= 5:
+                        result += PENALTY_N1 + run - 5
+                    run = 1
+            if run >= 5:
+                result += PENALTY_N1 + run - 5
+
+            # finder-like 1:1:3:1:1 patterns with light space on a side
+            text = "".join("1" if x else "0" for x in line)
+            result += PENALTY_N3 * (
+                text.count("10111010000") + text.count("00001011101")
+            )
+
+        for y in range(size - 1):
+            for x in range(size - 1):
+                color = self.modules[y][x]
+                if (
+                    color == self.modules[y][x + 1]
+                    and color == self.modules[y + 1][x]
+                    and color == self.modules[y + 1][x + 1]
+                ):
+                    result += PENALTY_N2
+
+        dark = sum(sum(row) for row in self.modules)
+        total = size * size
+        k = (abs(dark * 20 - total * 10) + total - 1) // total - 1
+        result += k * PENALTY_N4
+
+        return result
+
+
+def encode(text: str, ecc: str = "M", mask: Optional[int] = None) -> list[list[bool]]:
+    """return the module matrix for text, True is a dark module"""
+    if ecc not in ECC_LEVELS:
+        raise ParameterError(f"Bad error correction level: {ecc}")
+
+    data = text.encode("utf-8")
+    version = _choose_version(len(data), ecc)
+    codewords = _add_ecc_and_interleave(
+        _data_codewords(data, version, ecc), version, ecc
+    )
+
+    symbol = _Symbol(version, ecc)
+    symbol.draw_codewords(codewords)
+
+    if mask is None:
+        best = None
+        for candidate in range(len(MASKS)):
+            symbol.apply_mask(candidate)
+            symbol.draw_format_bits(candidate)
+            score = symbol.penalty()
+            if best is None or score < best[0]:
+                best = (score, candidate)
+            symbol.apply_mask(candidate)  # masks are their own inverse
+        mask = best[1]
+
+    symbol.apply_mask(mask)
+    symbol.draw_format_bits(mask)
+
+    return symbol.modules
+
+
+def render(matrix: list[list[bool]], scale: int = 1, border: int = 0) -> Image:
+    """render a module matrix into a 1-bit image"""
+    size = len(matrix)
+
+    img = Image.new("1", size=(size, size), color=1)
+    img.putdata([0 if dark else 255 for row in matrix for dark in row])
+
+    if scale != 1:
+        img = img.resize(
+            (size * scale, size * scale), resample=Image.Resampling.NEAREST
+        )
+
+    if border:
+        out_size = (size + 2 * border) * scale
+        out = Image.new("1", size=(out_size, out_size), color=1)
+        out.paste(img, (border * scale, border * scale))
+        img = out
+
+    return img
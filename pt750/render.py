@@ -0,0 +1,109 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from typing import NamedTuple, Optional
+
+from PIL import Image
+
+from pt750 import fonts, labels, models
+
+
+class PackedImage(NamedTuple):
+    """a 1-bit image as packed rows, cheap to pass between processes"""
+
+    width: int
+    height: int
+    data: bytes
+
+    @classmethod
+    def from_image(cls, img: Image.Image) -> "PackedImage":
+        if img.mode != "1":
+            img = img.convert("1", dither=Image.Dither.NONE)
+
+        return cls(img.width, img.height, img.tobytes())
+
+    def to_image(self) -> Image.Image:
+        return Image.frombytes("1", (self.width, self.height), self.data)
+
+
+def render_packed(label: models.BaseLabel) -> PackedImage:
+    return PackedImage.from_image(labels.render(label))
+
+
+class Renderer:
+    """renders labels inline, on a thread pool or on a process pool
+
+    Labels come back printer-ready, placed across the print head.
+    """
+
+    KINDS = ["inline", "thread", "process"]
+
+    def __init__(self, kind: str = "inline", workers: int = 1):
+        if kind not in self.KINDS:
+            raise models.ParameterError(f"Bad render executor: {kind}")
+
+        self.kind = kind
+        self.workers = workers
+        self._executor: Optional[Executor] = None
+
+    @property
+    def executor(self) -> Optional[Executor]:
+        if self.kind == "inline":
+            return None
+
+        if self._executor is None:
+            if self.kind == "thread":
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="render"
+                )
+            else:
+                # spawn rather than fork, the parent has threads running
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=fonts.warm,
+                )
+
+        return self._executor
+
+    def submit(self, label: models.BaseLabel) -> "Future[Image.Image]":
+        """start rendering a label, so several can render at once"""
+        rendered: Future[Image.Image] = Future()
+
+        def unpack(packed: "Future[PackedImage]"):
+            try:
+                rendered.set_result(packed.result().to_image())
+            except Exception as e:
+                rendered.set_exception(e)
+
+        executor = self.executor
+        if executor is None:
+            try:
+                rendered.set_result(labels.render(label))
+            except Exception as e:
+                rendered.set_exception(e)
+        else:
+            executor.submit(render_packed, label).add_done_callback(unpack)
+
+        return rendered
+
+    def render(self, label: models.BaseLabel) -> Image.Image:
+        return self.submit(label).result()
+
+    async def render_async(self, label: models.BaseLabel) -> Image.Image:
+        executor = self.executor
+        if executor is None:
+            return labels.render(label)
+
+        packed = await asyncio.wrap_future(executor.submit(render_packed, label))
+        return packed.to_image()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,162 @@
+import csv
+import itertools
+import json
+import string
+from typing import Any, Iterable, Iterator, TextIO, TypeVar, Union
+
+from pydantic import ValidationError
+
+from pt750 import labels, models, transports
+
+T = TypeVar("T")
+
+# a label of a series, or why its row did not make one
+Item = Union[models.LabelRequest, models.ItemError]
+
+
+def counter_values(counters: dict[str, models.Counter]) -> Iterator[dict[str, int]]:
+    """every combination of the counters, the last one changing fastest"""
+    names = list(counters)
+    for values in itertools.product(*[counters[x].values() for x in names]):
+        yield dict(zip(names, values))
+
+
+def series_length(request: models.SeriesRequest) -> int:
+    if request.rows:
+        return len(request.rows)
+
+    length = 1
+    for counter in request.counters.values():
+        length *= len(counter.values())
+    return length
+
+
+def parse_counter(text: str) -> tuple[str, models.Counter]:
+    """name=start:stop[:step], as given on the command line"""
+    name, _, spec = text.partition("=")
+    parts = spec.split(":")
+    if not name or len(parts) not in (2, 3):
+        raise models.ParameterError(f"Bad counter {text}, use name=start:stop[:step]")
+
+    try:
+        values = [int(x) for x in parts]
+    except ValueError:
+        raise models.ParameterError(f"Bad counter {text}, use name=start:stop[:step]")
+
+    return name, models.Counter(**dict(zip(["start", "stop", "step"], values)))
+
+
+def read_rows(f: TextIO, fmt: str = "csv") -> Iterator[dict[str, Any]]:
+    """rows from a csv file with a header line, or from json lines"""
+    if fmt == "csv":
+        yield from csv.DictReader(f)
+    elif fmt == "jsonl":
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        raise models.ParameterError(f"Bad row format: {fmt}")
+
+
+def fill(template: Any, values: dict[str, Any]) -> Any:
+    """template with {name} placeholders in its strings replaced
+
+    A string that is a single placeholder takes the value as-is, so
+    counters can fill in numeric fields like an aruco id.
+    """
+    if isinstance(template, dict):
+        return {k: fill(v, values) for k, v in template.items()}
+
+    if isinstance(template, list):
+        return [fill(x, values) for x in template]
+
+    if not isinstance(template, str):
+        return template
+
+    parsed = list(string.Formatter().parse(template))
+    try:
+        if len(parsed) == 1 and not parsed[0][0] and parsed[0][1]:
+            _, name, spec, conversion = parsed[0]
+            if not spec and not conversion:
+                return values[name]
+
+        return template.format(**values)
+    except KeyError as e:
+        raise models.ParameterError(f"No value for {e} in template")
+    except (IndexError, ValueError) as e:
+        raise models.ParameterError(f"Bad template {template}: {e}")
+
+
+def series_values(request: models.SeriesRequest) -> Iterable[dict[str, Any]]:
+    """the values filled into the template for each label"""
+    if request.rows:
+        return request.rows
+    if request.counters:
+        return counter_values(request.counters)
+
+    raise models.ParameterError("A series needs counters or rows")
+
+
+def expand_values(
+    template: dict[str, Any], values: Iterable[dict[str, Any]], count: int = 1
+) -> Iterator[tuple[int, Item]]:
+    """each row's index and label, or an ItemError for a row without one"""
+    for idx, values_for_row in enumerate(values):
+        try:
+            request = models.LabelRequest.model_validate(
+                {"label": fill(template, values_for_row), "count": count}
+            )
+        except (models.ParameterError, ValidationError) as e:
+            yield idx, models.ItemError(index=idx, error=str(e))
+            continue
+
+        yield idx, request
+
+
+def chunked(items: Iterable[T], size: int) -> Iterator[list[T]]:
+    iterator = iter(items)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def render_pages(
+    printer: transports.PT750W,
+    items: Iterable[tuple[int, Item]],
+    errors: list[models.ItemError],
+) -> Iterator[bytes]:
+    """encoded pages for each label, rendered only as they are needed
+
+    Rows that do not make a label, or whose label fails to render, are
+    added to errors and left out.
+    """
+    for idx, item in items:
+        if isinstance(item, models.ItemError):
+            errors.append(item)
+            continue
+
+        try:
+            page = printer.encode_page(labels.render(item.label))
+        except Exception as e:
+            errors.append(models.ItemError(index=idx, error=str(e)))
+            continue
+
+        for _ in range(item.count):
+            yield page
+
+
+def print_jobs(
+    printer: transports.PT750W, pages: Iterable[bytes], chunk: int
+) -> Iterator[bytes]:
+    """printer jobs of up to chunk pages
+
+    Every job but the last is chain printed, so the series comes out
+    as one run of labels without extra feeds between jobs.  Each job is
+    only made once the pages of the next are in hand, so the last job
+    sent is always fed and cut.
+    """
+    chunks = chunked(pages, chunk)
+    current = next(chunks, None)
+    while current is not None:
+        following = next(chunks, None)
+        yield printer.encode_pages(current, chain=following is not None)
+        current = following
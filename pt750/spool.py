@@ -0,0 +1,367 @@
+"""a durable, append-only log of encoded print jobs for one printer
+
+Every job is written to the log before it is sent, and a record marking
+it sent (or cancelled) is appended once it is done with.  After a
+restart the log is scanned to find the jobs still pending, which are
+then replayed straight from the file without rendering them again.
+
+Records are a fixed header followed by a payload:
+
+    magic, kind, job id, queued at, payload length, payload crc32
+
+A job whose payload was still being written when the process stopped
+is left with an unset length, and it and anything after it are cut
+off when the log is next opened.  Jobs are delivered at least once:
+a job sent just before a crash, but not yet marked, is sent again.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Iterable, Iterator, NamedTuple, Optional, Union
+
+MAGIC = b"PTsp"
+HEADER = struct.Struct("<4sB16sdQI")
+
+JOB = 1
+SENT = 2
+CANCELLED = 3
+ORDER = 4
+
+# the length of a job record until its payload is completely written
+UNCOMMITTED = 2**64 - 1
+
+# payload bytes read from the log per chunk when replaying a job
+READ_CHUNK = 64 * 1024
+
+# compaction is not worth it for less dead space than this
+COMPACT_MIN = 1024 * 1024
+
+Job = Union[bytes, Iterable[bytes]]
+
+
+class SpoolError(Exception):
+    pass
+
+
+class SpoolFull(SpoolError):
+    pass
+
+
+class Entry(NamedTuple):
+    """a pending job, with where its payload is in the log"""
+
+    id: str
+    queued_at: float
+    offset: int
+    size: int
+    crc: int
+
+
+def _chunks(data: Job) -> Iterable[bytes]:
+    # as transports.job_chunks, without importing the transports
+    return (data,) if isinstance(data, (bytes, bytearray)) else data
+
+
+class Spool:
+    """the pending jobs of one printer, kept in a log file at path
+
+    max_bytes caps the size of the log.  A job that would go past it
+    has the log compacted under it, and raises SpoolFull if that does
+    not free enough.  The log is compacted by itself once more of it
+    is sent or cancelled jobs than pending ones.
+
+    A job is encoded and written without holding the lock, so the
+    pending jobs can be looked at meanwhile.  Records written after it
+    (cancels and reorders) wait until it is complete.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.sending: Optional[str] = None
+
+        self._lock = threading.RLock()
+        # notified when a job being appended is complete, or dropped
+        self._appended = threading.Condition(self._lock)
+        self._appending = False
+        self._pending: OrderedDict[str, Entry] = OrderedDict()
+        self._size = 0
+        self._mm: Optional[mmap.mmap] = None
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # written at explicit offsets, which O_APPEND would ignore
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._recover()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    @property
+    def size(self) -> int:
+        """bytes in the log"""
+        return self._size
+
+    @property
+    def live_bytes(self) -> int:
+        """bytes the pending jobs would take in a compacted log"""
+        with self._lock:
+            return sum(HEADER.size + x.size for x in self._pending.values())
+
+    def pending(self) -> list[Entry]:
+        """jobs not yet sent, in the order they will be sent"""
+        with self._lock:
+            return list(self._pending.values())
+
+    def _map(self) -> Optional[mmap.mmap]:
+        # remapped as the log grows, readers keep the map they started with
+        if self._size == 0:
+            return None
+
+        if self._mm is None or len(self._mm) < self._size:
+            self._mm = mmap.mmap(self._fd, 0, access=mmap.ACCESS_READ)
+
+        return self._mm
+
+    def _recover(self):
+        self._size = os.fstat(self._fd).st_size
+        mm = self._map()
+
+        offset = 0
+        while mm is not None and offset + HEADER.size <= self._size:
+            magic, kind, raw_id, queued_at, length, crc = HEADER.unpack_from(mm, offset)
+            start = offset + HEADER.size
+            end = start + length
+            if (
+                magic != MAGIC
+                or length == UNCOMMITTED
+                or end > self._size
+                or zlib.crc32(mm[start:end]) != crc
+            ):
+                break
+
+            job_id = uuid.UUID(bytes=raw_id).hex
+            self._apply(kind, Entry(job_id, queued_at, start, length, crc))
+            offset = end
+
+        if offset != self._size:
+            # a torn write at the end, from a crash while appending
+            self._mm = None
+            os.ftruncate(self._fd, offset)
+            os.fsync(self._fd)
+            self._size = offset
+
+    def _apply(self, kind: int, entry: Entry):
+        job_id, start, end = entry.id, entry.offset, entry.offset + entry.size
+        if kind == JOB:
+            self._pending[job_id] = entry
+        elif kind in (SENT, CANCELLED):
+            self._pending.pop(job_id, None)
+        elif kind == ORDER:
+            mm = self._map()
+            assert mm is not None
+            ids = [
+                uuid.UUID(bytes=x).hex
+                for (x,) in struct.iter_unpack("16s", mm[start:end])
+            ]
+            self._order(ids)
+
+    def _order(self, ids: list[str]):
+        for job_id in reversed(ids):
+            if job_id in self._pending:
+                self._pending.move_to_end(job_id, last=False)
+
+    def _wait_for_append(self):
+        # called with the lock held, the log is only written at its end
+        while self._appending:
+            self._appended.wait()
+
+    def _write(self, kind: int, job_id: Optional[str], payload: bytes = b""):
+        self._wait_for_append()
+        raw_id = uuid.UUID(hex=job_id).bytes if job_id else bytes(16)
+        header = HEADER.pack(
+            MAGIC, kind, raw_id, 0.0, len(payload), zlib.crc32(payload)
+        )
+        os.pwrite(self._fd, header + payload, self._size)
+        os.fsync(self._fd)
+        self._size += len(header) + len(payload)
+
+    def append(self, job_id: str, queued_at: float, data: Job) -> Entry:
+        """write a job to the log, chunk by chunk as it is produced"""
+        raw_id = uuid.UUID(hex=job_id).bytes
+
+        with self._lock:
+            self._wait_for_append()
+            self._maybe_compact()
+            if self._size + HEADER.size > self.max_bytes:
+                self._make_room(0, HEADER.size)
+
+            # the end of the log is this job's until it is complete
+            self._appending = True
+            fd = self._fd
+            offset = self._size
+
+        start = offset + HEADER.size
+        length = crc = 0
+        try:
+            header = HEADER.pack(MAGIC, JOB, raw_id, queued_at, UNCOMMITTED, 0)
+            os.pwrite(fd, header, offset)
+            for chunk in _chunks(data):
+                if start + length + len(chunk) > self.max_bytes:
+                    # only now is there a job to compact the log for
+                    written = HEADER.size + length
+                    with self._lock:
+                        offset = self._make_room(written, written + len(chunk))
+                        fd = self._fd
+                    start = offset + HEADER.size
+                os.pwrite(fd, chunk, start + length)
+                crc = zlib.crc32(chunk, crc)
+                length += len(chunk)
+
+            # the payload is on disk before the header says it is complete
+            os.fsync(fd)
+            header = HEADER.pack(MAGIC, JOB, raw_id, queued_at, length, crc)
+            os.pwrite(fd, header, offset)
+            os.fsync(fd)
+        except BaseException:
+            os.ftruncate(fd, offset)
+            with self._lock:
+                self._appending = False
+                self._appended.notify_all()
+            raise
+
+        with self._lock:
+            self._size = start + length
+            entry = Entry(job_id, queued_at, start, length, crc)
+            self._pending[job_id] = entry
+            self._appending = False
+            self._appended.notify_all()
+            return entry
+
+    def take(self) -> Optional[Entry]:
+        """the next job to send, which cannot be cancelled until released"""
+        with self._lock:
+            entry = next(iter(self._pending.values()), None)
+            self.sending = entry.id if entry is not None else None
+            return entry
+
+    def release(self):
+        with self._lock:
+            self.sending = None
+
+    def read(self, job_id: str) -> Iterator[bytes]:
+        """a pending job's bytes, in chunks read from the log"""
+        with self._lock:
+            entry = self._pending.get(job_id)
+            if entry is None:
+                raise SpoolError(f"job {job_id} is not spooled")
+            mm = self._map()
+
+        return self._read(mm, entry)
+
+    @staticmethod
+    def _read(mm: Optional[mmap.mmap], entry: Entry) -> Iterator[bytes]:
+        end = entry.offset + entry.size
+        for offset in range(entry.offset, end, READ_CHUNK):
+            assert mm is not None, "a pending job in an empty log"
+            stop = min(offset + READ_CHUNK, end)
+            yield mm[offset:stop]
+
+    def mark_sent(self, job_id: str):
+        with self._lock:
+            self._pending.pop(job_id, None)
+            self._write(SENT, job_id)
+            self._maybe_compact()
+
+    def cancel(self, job_id: str):
+        with self._lock:
+            if job_id not in self._pending:
+                raise SpoolError(f"job {job_id} is not spooled")
+            if job_id == self.sending:
+                raise SpoolError(f"job {job_id} is being sent")
+
+            del self._pending[job_id]
+            self._write(CANCELLED, job_id)
+            self._maybe_compact()
+
+    def reorder(self, ids: list[str]):
+        """move the given pending jobs to the front, in that order"""
+        with self._lock:
+            missing = [x for x in ids if x not in self._pending]
+            if missing:
+                raise SpoolError(f"jobs not spooled: {', '.join(missing)}")
+
+            self._order(ids)
+            self._write(ORDER, None, b"".join(uuid.UUID(hex=x).bytes for x in ids))
+
+    def _maybe_compact(self):
+        dead = self._size - self.live_bytes
+        if dead > max(self.live_bytes, COMPACT_MIN):
+            self.compact()
+
+    def _make_room(self, written: int, needed: int) -> int:
+        # called with the lock held, by an append needing this many bytes
+        # at the end of the log, the first written of which are on disk
+        if self._size == self.live_bytes or self.live_bytes + needed > self.max_bytes:
+            raise SpoolFull(f"spool {self.path} is full")
+
+        return self._rewrite(tail=written)
+
+    def compact(self):
+        """rewrite the log with only the pending jobs, in order"""
+        with self._lock:
+            self._wait_for_append()
+            self._rewrite()
+
+    def _rewrite(self, tail: int = 0) -> int:
+        # up to tail bytes past the end of the log, from a job still being
+        # appended, are copied after the pending jobs; returns where they went
+        with self._lock:
+            mm = self._map()
+            tmp_path = f"{self.path}.tmp"
+
+            pending = OrderedDict()
+            with open(tmp_path, "wb") as f:
+                for entry in self._pending.values():
+                    raw_id = uuid.UUID(hex=entry.id).bytes
+                    f.write(
+                        HEADER.pack(
+                            MAGIC, JOB, raw_id, entry.queued_at, entry.size, entry.crc
+                        )
+                    )
+                    pending[entry.id] = entry._replace(offset=f.tell())
+                    for chunk in self._read(mm, entry):
+                        f.write(chunk)
+
+                size = f.tell()
+                for offset in range(self._size, self._size + tail, READ_CHUNK):
+                    stop = min(offset + READ_CHUNK, self._size + tail)
+                    f.write(os.pread(self._fd, stop - offset, offset))
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.replace(tmp_path, self.path)
+            dir_fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+            # readers still sending from the old log keep their own map
+            os.close(self._fd)
+            self._fd = os.open(self.path, os.O_RDWR)
+            self._mm = None
+            self._pending = pending
+            self._size = size
+            return size
+
+    def close(self):
+        with self._lock:
+            self._wait_for_append()
+            self._mm = None
+            os.close(self._fd)
@@ -1,9 +1,17 @@
 var active_label = 'text'
 var printer_ready = false
 
+// live previews: each request gets a sequence number, and only the
+// answer to the newest one sent is shown
+var preview_socket = null
+var preview_seq = 0
+var preview_header = null
+
 function onload() {
     update_config()
     update_status()
+    watch_status()
+    open_preview_socket()
     set_label('text')
 }
 
@@ -77,6 +85,27 @@ function set_label(what) {
     update_preview()
 }
 
+function show_status(data) {
+    printer = $('#printer').val()
+    tape = data[printer]["media"]
+    ready = data[printer]["ready"]
+
+    if(!ready) {
+        $('#warning_div').removeClass('alert-success')
+        $('#warning_div').addClass('alert-danger')
+        $('#warning_div').html('printer not ready')
+    } else {
+        if (!printer_ready) {
+            $('#warning_div').removeClass('alert-danger')
+            $('#warning_div').addClass('alert-success')
+            $('#warning_div').html('Ok')
+        }
+    }
+
+    printer_ready = ready
+    $('#tape').val(tape)
+}
+
 function update_status(async=false) {
     $.ajax({
         type: "GET",
@@ -84,24 +113,7 @@ function update_status(async=false) {
         url: "/status",
         async: async
     }).done(function(data) {
-        printer = $('#printer').val()
-        tape = data[printer]["media"]
-        ready = data[printer]["ready"]
-
-        if(!ready) {
-            $('#warning_div').removeClass('alert-success')
-            $('#warning_div').addClass('alert-danger')
-            $('#warning_div').html('printer not ready')
-        } else {
-            if (!printer_ready) {
-                $('#warning_div').removeClass('alert-danger')
-                $('#warning_div').addClass('alert-success')
-                $('#warning_div').html('Ok')
-            }
-        }
-
-        printer_ready = ready
-        $('#tape').val(tape)
+        show_status(data)
     }).fail(function(jqXHR) {
         $('#warning_div').removeClass('alert-success')
         $('#warning_div').addClass('alert-danger')
@@ -109,6 +121,14 @@ function update_status(async=false) {
     })
 }
 
+function watch_status() {
+    // the server pushes printer status as it changes
+    var events = new EventSource('/status/events')
+    events.onmessage = function(event) {
+        show_status(JSON.parse(event.data))
+    }
+}
+
 function update_config() {
     $.ajax({
         type: "GET",
@@ -179,7 +199,7 @@ function get_request_json() {
     request['label_type'] = active_label
 
     request = {'label': request,
-               'count': 1}
+               'count': Number($('#count').val()) || 1}
 
     request = JSON.stringify(request)
 
@@ -204,7 +224,8 @@ function print() {
     }).done(function(data) {
         $('#warning_div').removeClass('alert-danger')
         $('#warning_div').addClass('alert-success')
-        $('#warning_div').html('Printed')
+        $('#warning_div').html('Queued')
+        watch_job(data["id"])
     }).fail(function(jqXHR) {
         $('#warning_div').removeClass('alert-success')
         $('#warning_div').addClass('alert-danger')
@@ -212,29 +233,123 @@ function print() {
     })
 }
 
-function update_preview() {
-    update_status()
-    request = get_request_json()
-
-    max_size = Math.trunc($('#preview_div').width())
-
+function watch_job(job_id) {
     $.ajax({
-        type: "PUT",
+        type: "GET",
         dataType: "json",
-        url: "/preview?max_width="+max_size,
-        contentType: "application/json",
-        data: request
+        url: "/jobs/" + job_id
     }).done(function(data) {
-        new_label = data["height"] + " in X " + data["width"] + " in"
-        $('#preview_label').html(new_label)
-        $('#preview').attr('src', 'data:image/png;base64,' + data["preview"])
-        $('#warning_div').removeClass('alert-danger')
-        $('#warning_div').addClass('alert-success')
-        $('#warning_div').html('Ok')
+        if (data["state"] == "done") {
+            $('#warning_div').removeClass('alert-danger')
+            $('#warning_div').addClass('alert-success')
+            $('#warning_div').html('Printed')
+        } else if (data["state"] == "failed") {
+            $('#warning_div').removeClass('alert-success')
+            $('#warning_div').addClass('alert-danger')
+            $('#warning_div').html('Failure: ' + data["error"])
+        } else {
+            $('#warning_div').html('Printing (' + data["state"] + ')...')
+            setTimeout(function() { watch_job(job_id) }, 500)
+        }
     }).fail(function(jqXHR) {
         $('#warning_div').removeClass('alert-success')
         $('#warning_div').addClass('alert-danger')
         $('#warning_div').html('Failure: ' + jqXHR.responseText)
     })
+}
+
+function preview_ok() {
+    $('#warning_div').removeClass('alert-danger')
+    $('#warning_div').addClass('alert-success')
+    $('#warning_div').html('Ok')
+}
+
+function preview_failed(message) {
+    $('#warning_div').removeClass('alert-success')
+    $('#warning_div').addClass('alert-danger')
+    $('#warning_div').html('Failure: ' + message)
+}
+
+function show_preview(blob, width, height) {
+    $('#preview_label').html(height + " in X " + width + " in")
+
+    old_src = $('#preview').attr('src')
+    if (old_src && old_src.startsWith('blob:')) {
+        URL.revokeObjectURL(old_src)
+    }
+    $('#preview').attr('src', URL.createObjectURL(blob))
+    preview_ok()
+}
+
+function open_preview_socket() {
+    scheme = window.location.protocol == 'https:' ? 'wss://' : 'ws://'
+    socket = new WebSocket(scheme + window.location.host + '/preview/live')
+
+    socket.onopen = function() {
+        preview_socket = socket
+        update_preview()
+    }
+
+    socket.onmessage = function(event) {
+        if (typeof event.data == 'string') {
+            header = JSON.parse(event.data)
+            if (header["seq"] != preview_seq) {
+                // answers a request already replaced, a newer one follows
+                preview_header = null
+            } else if (header["error"]) {
+                preview_header = null
+                preview_failed(header["error"])
+            } else if (header["unchanged"]) {
+                preview_header = null
+                preview_ok()
+            } else {
+                preview_header = header
+            }
+        } else if (preview_header) {
+            show_preview(event.data, preview_header["width"], preview_header["height"])
+            preview_header = null
+        }
+    }
+
+    socket.onclose = function() {
+        // previews fall back to plain requests until it reconnects
+        preview_socket = null
+        setTimeout(open_preview_socket, 2000)
+    }
+}
+
+function update_preview() {
+    request = get_request_json()
+
+    max_size = Math.trunc($('#preview_div').width())
+
+    if (preview_socket) {
+        preview_seq += 1
+        preview_socket.send(JSON.stringify({
+            seq: preview_seq,
+            request: JSON.parse(request),
+            max_width: max_size
+        }))
+        return
+    }
+
+    // a GET, so the browser revalidates with the etag and an unchanged
+    // label comes back as a 304 from its cache
+    url = "/preview.png?" + $.param({request: request, max_width: max_size})
+
+    fetch(url).then(function(response) {
+        if (!response.ok) {
+            return response.text().then(function(text) { throw new Error(text) })
+        }
+        return response.blob().then(function(blob) {
+            show_preview(
+                blob,
+                response.headers.get("X-Label-Width"),
+                response.headers.get("X-Label-Height")
+            )
+        })
+    }).catch(function(error) {
+        preview_failed(error.message)
+    })
 
 }
@@ -0,0 +1,162 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from pt750.models import PrinterStatus
+
+StatusFn = Callable[[], Optional[PrinterStatus]]
+
+# an async waiter, woken by setting the event on its own loop
+Waiter = tuple[asyncio.AbstractEventLoop, asyncio.Event]
+
+
+class StatusPoller:
+    """keeps the status of every printer fresh in the background
+
+    Each printer is polled on its own pool thread, so an unreachable
+    printer only delays its own entry.  A printer whose previous poll
+    is still running is skipped rather than piling up more polls.
+    Every change bumps version, which waiters can block on.  Waiters
+    are woken from the polling threads through their event loop, so a
+    waiting client does not hold a thread.  A stopped poller can be
+    started again.
+    """
+
+    def __init__(self, printers: dict[str, StatusFn], interval: float):
+        self.printers = printers
+        self.interval = interval
+        self.version = 0
+
+        self._statuses: dict[str, PrinterStatus] = {}
+        self._in_flight: set[str] = set()
+        self._lock = threading.RLock()
+        self._waiters: set[Waiter] = set()
+        self._settled = False
+        # each run of the polling thread has its own stop event
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._stop = threading.Event()
+                self._thread = threading.Thread(
+                    target=self._run,
+                    args=(self._stop,),
+                    name="status-poller",
+                    daemon=True,
+                )
+                self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stop.set()
+            self._thread = None
+            executor, self._executor = self._executor, None
+
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, stop: threading.Event):
+        while not stop.is_set():
+            self.poll()
+            stop.wait(self.interval)
+
+    def poll(self):
+        for printer, fn in self.printers.items():
+            with self._lock:
+                if printer in self._in_flight:
+                    continue
+                self._in_flight.add(printer)
+
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=max(len(self.printers), 1),
+                        thread_name_prefix="status",
+                    )
+                future = self._executor.submit(self._poll_one, printer, fn)
+
+            future.add_done_callback(functools.partial(self._cancelled, printer))
+
+    def _cancelled(self, printer: str, future: Future):
+        # a poll cancelled by stop never ran, so never finished either
+        if future.cancelled():
+            with self._lock:
+                self._in_flight.discard(printer)
+
+    def _poll_one(self, printer: str, fn: StatusFn):
+        try:
+            status = fn()
+            if status is None:
+                status = PrinterStatus(ready=False, error="no status from printer")
+        except Exception as e:
+            logging.warning(f"Cannot get status for {printer}: {e}")
+            status = PrinterStatus(ready=False, error=str(e))
+
+        status.updated_at = time.time()
+
+        with self._lock:
+            self._in_flight.discard(printer)
+
+            old = self._statuses.get(printer)
+            self._statuses[printer] = status
+
+            if old is None or old.model_dump(
+                exclude={"updated_at"}
+            ) != status.model_dump(exclude={"updated_at"}):
+                self.version += 1
+                for loop, event in self._waiters:
+                    try:
+                        loop.call_soon_threadsafe(event.set)
+                    except RuntimeError:
+                        # the loop was closed while waiting
+                        pass
+
+    def snapshot(self) -> dict[str, PrinterStatus]:
+        """latest status for each printer, not ready if never polled"""
+        with self._lock:
+            return {
+                printer: self._statuses.get(printer, PrinterStatus(ready=False))
+                for printer in self.printers
+            }
+
+    async def wait_for_change(
+        self, version: int, timeout: float
+    ) -> tuple[int, dict[str, PrinterStatus]]:
+        waiter: Waiter = (asyncio.get_running_loop(), asyncio.Event())
+
+        with self._lock:
+            if self.version != version:
+                return self.version, self.snapshot()
+            self._waiters.add(waiter)
+
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+        with self._lock:
+            return self.version, self.snapshot()
+
+    async def settle(self, timeout: float):
+        """wait once for every printer to be polled, later calls return at once"""
+        deadline = time.monotonic() + timeout
+        while not self._settled:
+            with self._lock:
+                ready = len(self._statuses) == len(self.printers)
+                version = self.version
+
+            remaining = deadline - time.monotonic()
+            if ready or remaining <= 0:
+                self._settled = True
+                break
+
+            await self.wait_for_change(version, remaining)
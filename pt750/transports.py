@@ -1,13 +1,24 @@
 import base64
+import importlib.util
 import logging
+import select
 import socket
+import threading
+import time
+from typing import Iterable, Iterator, Optional, TYPE_CHECKING, Union
 from urllib.parse import urlparse, urlunparse
 
-import requests
-from easysnmp import Session
 from PIL import Image
 
-from pt750.models import PrinterStatus, tapes
+from pt750 import metrics
+from pt750.models import ParameterError, PrinterStatus, settings, tapes
+
+if TYPE_CHECKING:
+    import httpx  # slow to import, so only imported by http_client on first use
+
+
+class TransportError(Exception):
+    pass
 
 
 class LabelPrinter:
@@ -30,49 +41,248 @@ class LabelPrinter:
         raise NotImplementedError
 
 
+# lookup table to invert every bit of a byte, PIL uses 1 for white and
+# the printer uses 1 for a printed dot
+INVERT_TABLE = bytes(x ^ 0xFF for x in range(256))
+
+
+def packbits(data: bytes) -> bytes:
+    """TIFF PackBits, as used by the printer's compressed raster mode"""
+    result = bytearray()
+    length = len(data)
+    idx = 0
+
+    while idx < length:
+        run_end = idx + 1
+        while run_end < length and data[run_end] == data[idx] and run_end - idx < 128:
+            run_end += 1
+
+        if run_end - idx > 1:
+            # repeat run, header is 1 - count as a signed byte
+            result.append(257 - (run_end - idx))
+            result.append(data[idx])
+            idx = run_end
+            continue
+
+        # literal run, up to the start of the next repeat
+        literal_start = idx
+        idx += 1
+        while idx < length and idx - literal_start < 128:
+            if idx + 1 < length and data[idx] == data[idx + 1]:
+                break
+            idx += 1
+
+        result.append(idx - literal_start - 1)
+        result += data[literal_start:idx]
+
+    return bytes(result)
+
+
 class PT750W(LabelPrinter):
-    def print(self, img: Image):
-        img = img.transpose(Image.Transpose.ROTATE_90)
-        img = img.transpose(Image.Transpose.FLIP_TOP_BOTTOM)
+    LINE_BYTES = 16  # 128 dots per raster line
 
-        image_data = bytearray(img.tobytes())
+    PREAMBLE = (
+        b"\x00" * 100  # reset stream
+        + b"\x1B\x40"  # initialize
+        + b"\x1B\x69\x4D\x40"  # auto tape cut
+    )
 
-        for idx in range(len(image_data)):
-            image_data[idx] = image_data[idx] ^ 0xFF
+    # advanced mode, low res (128?) with or without chain printing.
+    # Without chain printing the last label is fed and cut, with it the
+    # tape stays put so the next job starts without a leading margin.
+    NO_CHAIN_PRINTING = b"\x1B\x69\x4B\x08"
+    CHAIN_PRINTING = b"\x1B\x69\x4B\x00"
 
-        bytes = b"\x00" * 100  # reset stream
-        bytes += b"\x1B\x40"  # initialize
-        bytes += b"\x1B\x69\x4D\x40"  # auto tape cut
-        bytes += b"\x1B\x69\x4B\x08"  # no chain printing, low res (128?)
-        bytes += b"\x4d\x02"  # compression
+    CUT_EACH_LABEL = b"\x1B\x69\x41\x01"  # with auto cut, cut every page
+
+    COMPRESSION_ON = b"\x4d\x02"  # tiff compression
+    COMPRESSION_OFF = b"\x4d\x00"
 
-        label_width = img.width
-        label_height = img.height
+    # raster graphics transfer, 16 uncompressed bytes
+    LINE_HEADER = b"\x47\x10\x00"
+    ZERO_LINE = b"\x5a"  # zero raster graphics, compressed mode only
+
+    PAGE_BREAK = b"\x0c"  # print, more pages follow
+    TRAILER = b"\x1a"  # print and feed
+
+    def __init__(self, uri, compress: bool = True):
+        super().__init__(uri)
+        self.compress = compress
+
+    # raster lines encoded and yielded at a time when streaming a job
+    CHUNK_LINES = 1024
+
+    # distinct compressed lines remembered while encoding a job
+    MAX_ENCODED_LINES = 1024
+
+    def raster_data(self, img: Image) -> bytes:
+        """image as printer raster lines, one bit per dot"""
+        # each column of the label is one raster line across the head,
+        # which is a transpose (rotate 90 and flip) of the image
+        img = img.transpose(Image.Transpose.TRANSPOSE)
+
+        assert img.width == self.LINE_BYTES * 8
+
+        return img.tobytes().translate(INVERT_TABLE)
+
+    def _uncompressed_lines(self, image_data: bytes) -> bytes:
+        # each raster line is a fixed header plus the line bytes, so the
+        # lines can be laid out with one strided copy per column of bytes
+        # instead of a loop over lines
+        lines = len(image_data) // self.LINE_BYTES
+        stride = len(self.LINE_HEADER) + self.LINE_BYTES
+        end = lines * stride
+
+        job = bytearray(end)
+
+        for idx, value in enumerate(self.LINE_HEADER):
+            job[idx:end:stride] = bytes([value]) * lines
+
+        data_start = len(self.LINE_HEADER)
+        for idx in range(self.LINE_BYTES):
+            job[data_start + idx : end : stride] = image_data[  # noqa: E203
+                idx :: self.LINE_BYTES  # noqa: E203
+            ]
+
+        return bytes(job)
+
+    def _compressed_lines(
+        self, image_data: bytes, encoded: Optional[dict[bytes, bytes]] = None
+    ) -> bytes:
+        # labels repeat the same few lines (blank tape, vertical strokes)
+        # over and over, so only pack each distinct line once
+        if encoded is None:
+            encoded = {}
+        elif len(encoded) > self.MAX_ENCODED_LINES:
+            encoded.clear()
+        encoded.setdefault(bytes(self.LINE_BYTES), self.ZERO_LINE)
+        lines = []
+
+        for ofs in range(0, len(image_data), self.LINE_BYTES):
+            line = image_data[ofs : ofs + self.LINE_BYTES]  # noqa: E203
+
+            command = encoded.get(line)
+            if command is None:
+                packed = packbits(line)
+                command = b"\x47" + len(packed).to_bytes(2, "little") + packed
+                encoded[line] = command
+
+            lines.append(command)
+
+        return b"".join(lines)
+
+    def encode_page(self, img: Image) -> bytes:
+        """raster line commands for one label"""
+        with metrics.encode_seconds.time():
+            image_data = self.raster_data(img)
+
+            if self.compress:
+                return self._compressed_lines(image_data)
+
+            return self._uncompressed_lines(image_data)
+
+    def iter_page(
+        self, img: Image, encoded: Optional[dict[bytes, bytes]] = None
+    ) -> Iterator[bytes]:
+        """raster line commands for one label, CHUNK_LINES at a time
+
+        Only a slice of the image is transposed and encoded at once, so
+        memory does not grow with the length of the label.  encoded is
+        shared between calls to reuse packed lines across copies.
+        """
+        if encoded is None:
+            encoded = {}
+
+        for start in range(0, img.width, self.CHUNK_LINES):
+            with metrics.encode_seconds.time():
+                end = min(start + self.CHUNK_LINES, img.width)
+                image_data = self.raster_data(img.crop((start, 0, end, img.height)))
+
+                if self.compress:
+                    chunk = self._compressed_lines(image_data, encoded)
+                else:
+                    chunk = self._uncompressed_lines(image_data)
 
-        assert label_width == 128
+            yield chunk
 
-        for line in range(label_height):
-            bytes_per_line = label_width // 8
-            byte_ofs = bytes_per_line * line
-            row_bytes = image_data[byte_ofs : byte_ofs + bytes_per_line]  # noqa: E203
+    def _header(self, pages: int, chain: bool) -> bytes:
+        header = [
+            self.PREAMBLE,
+            self.CHAIN_PRINTING if chain else self.NO_CHAIN_PRINTING,
+        ]
+        if pages > 1:
+            header.append(self.CUT_EACH_LABEL)
+        header.append(self.COMPRESSION_ON if self.compress else self.COMPRESSION_OFF)
 
-            # raster graphics transfer
-            bytes += b"\x47\x11\x00\x0F"  # "compressed" 16 literal bytes
-            bytes += row_bytes
+        return b"".join(header)
 
-        bytes += b"\x1a"  # print and feed
+    def encode_pages(self, pages: list[bytes], chain: bool = False) -> bytes:
+        """printer job for pages from encode_page, cut apart by the printer"""
+        if not pages:
+            raise ParameterError("no pages to print")
 
-        self.transport.send_bytes(bytes)
+        job = [self._header(len(pages), chain)]
+        for page in pages[:-1]:
+            job += [page, self.PAGE_BREAK]
+        job += [pages[-1], self.TRAILER]
+
+        return b"".join(job)
+
+    def iter_job(
+        self, img: Image, count: int = 1, chain: bool = False
+    ) -> Iterator[bytes]:
+        """the job from encode, as chunks produced while it is sent"""
+        if count < 1:
+            raise ParameterError("count must be at least 1")
+
+        return self._job_chunks(img, count, chain)
+
+    def _job_chunks(self, img: Image, count: int, chain: bool) -> Iterator[bytes]:
+        encoded: dict[bytes, bytes] = {}
+
+        yield self._header(count, chain)
+        for copy in range(count):
+            yield from self.iter_page(img, encoded)
+            yield self.TRAILER if copy == count - 1 else self.PAGE_BREAK
+
+    def encode(self, img: Image, count: int = 1, chain: bool = False) -> bytes:
+        """printer job for count copies of img
+
+        Copies are pages of a single job, so the preamble is sent and
+        the raster encoded only once.
+        """
+        if count < 1:
+            raise ParameterError("count must be at least 1")
+
+        return self.encode_pages([self.encode_page(img)] * count, chain=chain)
+
+    def print(self, img: Image, count: int = 1):
+        # encoded as it is sent, so the printer can start on long labels
+        # before the whole job is ready
+        self.transport.send_bytes(self.iter_job(img, count=count))
 
     def status(self) -> PrinterStatus:
         return self.transport.get_status()
 
 
+# a job as one bytes object, or as chunks to send as they are produced
+Job = Union[bytes, Iterable[bytes]]
+
+
+def is_streamed(data: Job) -> bool:
+    return not isinstance(data, (bytes, bytearray, memoryview))
+
+
+def job_chunks(data: Job) -> Iterable[bytes]:
+    return data if is_streamed(data) else (data,)  # type: ignore
+
+
 class Transport:
     def __init__(self, uri):
         self.uri = uri
 
-    def send_bytes(self, bytes: bytes):
+    def send_bytes(self, bytes: Job):
+        """send a job, writing each chunk of an iterable as it comes"""
         raise NotImplementedError
 
     def get_status(self) -> PrinterStatus:
@@ -88,7 +298,8 @@ class USBTransport(Transport):
 
     def send_bytes(self, bytes):
         with open(self.path, "wb") as f:
-            f.write(bytes)
+            for chunk in job_chunks(bytes):
+                f.write(chunk)
 
     def get_status(self) -> PrinterStatus:
         max_attempts = 3
@@ -116,6 +327,13 @@ class USBTransport(Transport):
         return PrinterStatus(media=media, ready=True)
 
 
+KEEPALIVE_OPTIONS = {
+    "TCP_KEEPIDLE": 30,
+    "TCP_KEEPINTVL": 10,
+    "TCP_KEEPCNT": 3,
+}
+
+
 class TCPTransport(Transport):
     MEDIA_OID = ".1.3.6.1.2.1.43.8.2.1.12.1.1"
     STATUS_OID = ".1.3.6.1.2.1.43.8.2.1.11.1.1"
@@ -127,15 +345,112 @@ class TCPTransport(Transport):
         self.host = parts.hostname
         self.port = parts.port if parts.port else 9100
 
-        # I don't believe this is configurable for the printer... I believe it's
-        # just plain always on with v2c/public read-only
-        self.snmp = Session(hostname=self.host, community="public", version=2)
+        self._snmp = None
+
+        # the connection to the printer is kept open between jobs, and
+        # re-established if it goes idle or the printer drops it
+        self.send_timeout = settings.tcp_send_timeout
+        self.idle_timeout = settings.tcp_idle_timeout
+        self.reuse = settings.tcp_reuse
+
+        self._sock: Optional[socket.socket] = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def snmp(self):
+        if self._snmp is None:
+            from easysnmp import Session
+
+            # I don't believe this is configurable for the printer... I believe
+            # it's just plain always on with v2c/public read-only
+            self._snmp = Session(hostname=self.host, community="public", version=2)
+
+        return self._snmp
+
+    def _connect(self) -> socket.socket:
+        sock = socket.create_connection(
+            (self.host, self.port), timeout=self.send_timeout
+        )
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+        # not every platform can tune keepalive timing
+        for option, value in KEEPALIVE_OPTIONS.items():
+            if hasattr(socket, option):
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+        return sock
+
+    def _is_stale(self, sock: socket.socket) -> bool:
+        if time.monotonic() - self._last_used > self.idle_timeout:
+            return True
+
+        # the printer never talks on this port, so anything readable is
+        # either EOF or an error, and the connection is gone
+        readable, _, _ = select.select([sock], [], [], 0)
+        return bool(readable)
+
+    def _close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    def close(self):
+        with self._lock:
+            self._close()
 
     def send_bytes(self, bytes):
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.connect((self.host, self.port))
-        s.sendall(bytes)
-        s.close()
+        chunks = iter(job_chunks(bytes))
+        first = next(chunks, b"")
+
+        with self._lock:
+            if self._sock is not None and self._is_stale(self._sock):
+                self._close()
+
+            while True:
+                fresh = self._sock is None
+
+                try:
+                    if fresh:
+                        self._sock = self._connect()
+                    self._sock.sendall(first)
+                    break
+                except OSError as e:
+                    self._close()
+
+                    # a reused connection may have been dropped by the
+                    # printer, try once more on a new one
+                    if not fresh:
+                        logging.info(f"Reconnecting to {self.host}:{self.port}: {e}")
+                        continue
+
+                    raise TransportError(
+                        f"Cannot send to {self.host}:{self.port}: {e}"
+                    ) from e
+
+            # only the first chunk can be retried, the rest of the job
+            # is being produced as it is sent
+            try:
+                for chunk in chunks:
+                    self._sock.sendall(chunk)
+            except OSError as e:
+                self._close()
+                raise TransportError(
+                    f"Cannot send to {self.host}:{self.port}: {e}"
+                ) from e
+            except BaseException:
+                # don't leave half a job on a connection we'll reuse
+                self._close()
+                raise
+
+            self._last_used = time.monotonic()
+
+            if not self.reuse:
+                self._close()
 
     def get_status(self) -> PrinterStatus:
         media_descriptor = self.snmp.get(self.MEDIA_OID)
@@ -151,6 +466,33 @@ class TCPTransport(Transport):
         return PrinterStatus(media=media, ready=ready)
 
 
+_http_client: Optional["httpx.Client"] = None
+_http_client_lock = threading.Lock()
+
+
+def http_client() -> "httpx.Client":
+    """connection-pooled client shared by every HTTPTransport"""
+    global _http_client
+
+    with _http_client_lock:
+        if _http_client is None:
+            import httpx
+
+            # http/2 needs the optional h2 package
+            http2 = settings.http2
+            if http2 and importlib.util.find_spec("h2") is None:
+                logging.warning("HTTP/2 needs the h2 package, using HTTP/1.1")
+                http2 = False
+
+            _http_client = httpx.Client(
+                http2=http2,
+                timeout=httpx.Timeout(settings.http_timeout, connect=5.0),
+                limits=httpx.Limits(max_keepalive_connections=8),
+            )
+
+    return _http_client
+
+
 class HTTPTransport(Transport):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -160,9 +502,19 @@ class HTTPTransport(Transport):
         parts = parts._replace(path=parts.path.rsplit("/", 1)[0])
         self.base_uri = urlunparse(parts)
 
+        # whether the remote takes binary uploads, None until known
+        self.binary_upload: Optional[bool] = None
+
     def get_status(self) -> PrinterStatus:
-        rv = requests.get(f"{self.base_uri}/status")
-        if not rv.ok:
+        import httpx
+
+        try:
+            rv = http_client().get(f"{self.base_uri}/status")
+        except httpx.HTTPError as e:
+            logging.error(f"Error getting status for {self.printer}: {e}")
+            return PrinterStatus(media="24mm", ready=False, error=str(e))
+
+        if not rv.is_success:
             logging.error(f"Error getting status for {self.printer}: {rv.status_code}")
             return PrinterStatus(media="24mm", ready=False)
 
@@ -173,7 +525,7 @@ class HTTPTransport(Transport):
 
         return PrinterStatus(**body[self.printer])
 
-    def send_bytes(self, bytes):
+    def _send_json(self, bytes) -> "httpx.Response":
         request = {
             "count": 1,
             "label": {
@@ -186,5 +538,49 @@ class HTTPTransport(Transport):
             },
         }
 
-        rv = requests.put(f"{self.base_uri}/print", json=request)
-        rv.raise_for_status()
+        return http_client().put(
+            f"{self.base_uri}/print", params={"wait": "true"}, json=request
+        )
+
+    def _put_raw(self, content) -> "httpx.Response":
+        rv = http_client().put(
+            f"{self.base_uri}/print/raw/{self.printer}",
+            params={"wait": "true"},
+            content=content,
+            headers={"Content-Type": "application/octet-stream"},
+        )
+
+        if rv.status_code in (404, 405):
+            logging.info(f"{self.base_uri} has no binary upload, using json")
+            self.binary_upload = False
+        else:
+            self.binary_upload = True
+
+        return rv
+
+    def send_bytes(self, bytes):
+        import httpx
+
+        # wait for the remote to print, so failures come back to us
+        try:
+            streamed = is_streamed(bytes)
+
+            # a stream can only be sent once, so find out first whether
+            # the remote can take it.  An empty upload is refused with a
+            # 400 by remotes that can.
+            if streamed and self.binary_upload is None:
+                self._put_raw(b"")
+
+            rv = None
+            if self.binary_upload is not False:
+                # a stream goes up with chunked transfer encoding
+                rv = self._put_raw(iter(bytes) if streamed else bytes)
+                if self.binary_upload is False:
+                    rv = None
+
+            if rv is None:
+                rv = self._send_json(b"".join(job_chunks(bytes)))
+
+            rv.raise_for_status()
+        except httpx.HTTPError as e:
+            raise TransportError(f"Cannot send to {self.uri}: {e}") from e
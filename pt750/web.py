@@ -1,20 +1,73 @@
 #!/usr/bin/env python
 
+import asyncio
 import base64
+import collections
+import functools
 import io
+import json
+import logging
 import os
+import time
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from typing import Any, Iterable, Iterator, NamedTuple, Optional
 
 import uvicorn
-from fastapi import FastAPI, Request
+from fastapi import (
+    FastAPI,
+    Header,
+    HTTPException,
+    Request,
+    WebSocket,
+    WebSocketDisconnect,
+)
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import (
+    JSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from PIL import Image
-
-from pt750 import draw, labels, models, transports
-
-app = FastAPI()
+from pydantic import ValidationError
+
+from pt750 import (
+    cache,
+    draw,
+    fonts,
+    jobs,
+    labels,
+    metrics,
+    models,
+    render,
+    series,
+    spool,
+    status,
+    transports,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # scan (or reload) the font index before taking requests
+    fonts.warm()
+    status_poller.start()
+    if settings.spool_dir:
+        # replay whatever was left spooled by the last run
+        for printer in settings.printers:
+            try:
+                _queue_for(printer)
+            except Exception as e:
+                logging.warning(f"Cannot replay spool for {printer}: {e}")
+    yield
+    status_poller.stop()
+    renderer.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 static_dir = os.path.join(os.path.dirname(__file__), "static")
 template_dir = os.path.join(os.path.dirname(__file__), "templates")
 
@@ -24,6 +77,35 @@ templates = Jinja2Templates(directory=template_dir)
 settings = models.Settings()
 
 _drivers = {}
+_queues: dict[str, jobs.PrintQueue] = {}
+
+# drivers are looked up when polled, so a bad printer uri shows up as
+# that printer's status error
+status_poller = status.StatusPoller(
+    {
+        printer: (lambda printer=printer: _printer_status(printer))
+        for printer in settings.printers
+    },
+    settings.status_interval,
+)
+renderer = render.Renderer(settings.render_executor, settings.render_workers)
+render_cache = cache.RenderCache(settings.render_cache_size, settings.render_cache_dir)
+
+metrics.Gauge(
+    "pt750_cache_hit_ratio",
+    "Fraction of lookups served from each cache",
+    ("cache",),
+    lambda: {
+        ("render",): metrics.hit_ratio(render_cache.info()),
+        ("face",): metrics.hit_ratio(draw.face_cache_info()),
+    },
+)
+metrics.Gauge(
+    "pt750_queue_depth",
+    "Jobs waiting in each printer's queue",
+    ("printer",),
+    lambda: {(printer,): queue.depth for printer, queue in list(_queues.items())},
+)
 
 
 def _driver_for(printer: str) -> transports.LabelPrinter:
@@ -33,34 +115,217 @@ def _driver_for(printer: str) -> transports.LabelPrinter:
         if not uri:
             raise models.ParameterError("printer not found")
 
-        _drivers[printer] = transports.PT750W(uri)
+        _drivers[printer] = transports.PT750W(uri, compress=settings.raster_compression)
 
     return _drivers[printer]
 
 
-def _image_for_request(request: models.LabelRequest):
-    label_info = request.model_dump()["label"]
+def _printer_status(printer: str) -> Optional[models.PrinterStatus]:
+    driver = _driver_for(printer)
+    with metrics.transport_seconds.time(printer=printer, operation="status"):
+        return driver.status()
+
+
+def _sender_for(printer: str, driver: transports.LabelPrinter):
+    def counted(data: transports.Job):
+        for chunk in transports.job_chunks(data):
+            metrics.bytes_sent.inc(len(chunk), printer=printer)
+            yield chunk
+
+    def send(data: transports.Job):
+        if not transports.is_streamed(data):
+            metrics.bytes_sent.inc(len(data), printer=printer)  # type: ignore
+        else:
+            data = counted(data)
+
+        with metrics.transport_seconds.time(printer=printer, operation="send"):
+            driver.transport.send_bytes(data)
+
+    return send
 
-    label_type = label_info.pop("label_type")
 
-    _ = label_info.pop("printer")
-    tape = label_info.pop("tape").value
+def _spool_for(printer: str) -> Optional[spool.Spool]:
+    if not settings.spool_dir:
+        return None
+
+    path = os.path.join(settings.spool_dir, f"{printer}.spool")
+    return spool.Spool(path, settings.spool_max_bytes)
+
+
+def _queue_for(printer: str) -> jobs.PrintQueue:
+    if printer not in _queues:
+        driver = _driver_for(printer)
+        _queues[printer] = jobs.PrintQueue(
+            printer, _sender_for(printer, driver), _spool_for(printer)
+        )
+
+    return _queues[printer]
+
+
+def _job_for_request(
+    driver: transports.LabelPrinter, label_request: models.LabelRequest
+) -> transports.Job:
+    if label_request.label.label_type == "raw":
+        # already a complete job, so copies are just repeats of it
+        return base64.b64decode(label_request.label.b64_bytes) * label_request.count
+
+    # cached as rendered, already placed across the print head, and
+    # encoded while it is sent, see PT750W.iter_job
+    img = _image_for_request(label_request)
+    return driver.iter_job(img, count=label_request.count)
+
+
+def _batch_job(
+    driver: transports.LabelPrinter,
+    items: Iterable[tuple[int, models.LabelRequest]],
+    job: models.PrintJob,
+    chain: bool = False,
+) -> bytes:
+    """render items concurrently, then encode and join them into one job
+
+    Items that fail are recorded on the job and left out.
+    """
+    futures = []
+    for idx, item in items:
+        if item.label.label_type == "raw":
+            error = "raw labels cannot be batched"
+            job.item_errors.append(models.ItemError(index=idx, error=error))
+        else:
+            futures.append((idx, item, _submit_image(item)))
+
+    pages = []
+    for idx, item, future in futures:
+        try:
+            pages += [driver.encode_page(future.result())] * item.count
+        except Exception as e:
+            job.item_errors.append(models.ItemError(index=idx, error=str(e)))
+
+    if not pages:
+        raise models.ParameterError("no labels in the batch could be rendered")
+
+    return driver.encode_pages(pages, chain=chain)
+
+
+class SeriesRows:
+    """the labels of a series, filled and checked as chunk jobs take them
+
+    A row that does not make a valid label for the printer becomes an
+    ItemError in its place.  Shared by every chunk job of one series,
+    which the printer's worker runs one at a time.
+    """
+
+    def __init__(
+        self,
+        printer: str,
+        items: Iterator[tuple[int, series.Item]],
+        ahead: Iterable[tuple[int, series.Item]] = (),
+    ):
+        self.printer = printer
+        self._items = items
+        self._ahead = collections.deque(ahead)
+
+    def _pull(self) -> Optional[tuple[int, series.Item]]:
+        row = next(self._items, None)
+        if row is None:
+            return None
+
+        idx, item = row
+        if isinstance(item, models.LabelRequest) and item.label.printer != self.printer:
+            error = "series labels must share a printer"
+            return idx, models.ItemError(index=idx, error=error)
+
+        return row
+
+    def _next(self) -> Optional[tuple[int, series.Item]]:
+        if self._ahead:
+            return self._ahead.popleft()
+
+        return self._pull()
+
+    def take(self, size: int) -> list[tuple[int, series.Item]]:
+        taken = []
+        while len(taken) < size and (row := self._next()) is not None:
+            taken.append(row)
+
+        return taken
+
+    def more(self) -> bool:
+        """whether a label is left that will print
+
+        Rows are read ahead until one renders, so a chunk only chain
+        prints into a following one that has something to print.  Its
+        image is left in the render cache for that chunk.
+        """
+        if any(isinstance(x, models.LabelRequest) for _, x in self._ahead):
+            return True
+
+        while (row := self._pull()) is not None:
+            idx, item = row
+            if isinstance(item, models.LabelRequest):
+                try:
+                    _image_for_request(item)
+                except Exception as e:
+                    item = models.ItemError(index=idx, error=str(e))
+
+            self._ahead.append((idx, item))
+            if isinstance(item, models.LabelRequest):
+                return True
+
+        return False
+
+
+def _series_job(
+    driver: transports.LabelPrinter, rows: SeriesRows, job: models.PrintJob
+) -> bytes:
+    """the next chunk of a series, pulled from rows as the job runs
+
+    Chain printed into the next chunk, unless nothing after it prints,
+    so the last label printed is always fed and cut.
+    """
+    chunk = []
+    for idx, item in rows.take(settings.series_chunk):
+        if isinstance(item, models.ItemError):
+            job.item_errors.append(item)
+        else:
+            chunk.append((idx, item))
 
-    height = models.tapes[tape].printable_height
+    return _batch_job(driver, chunk, job, chain=rows.more())
 
-    if label_type == "text":
-        assert isinstance(request.label, models.TextLabelRequest)
-        if not request.label.lines:
-            raise models.ParameterError("must supply some lines to print")
-        img = labels.TextLabel(height=height, **label_info).image
-    elif label_type == "qr":
-        img = labels.QRLabel(height=height, **label_info).image
-    elif label_type == "wrap":
-        img = labels.WrapLabel(height=height, **label_info).image
-    elif label_type == "flag":
-        img = labels.FlagLabel(height=height, **label_info).image
-    elif label_type == "aruco":
-        img = labels.ArucoLabel(height=height, **label_info).image
+
+def _submit_image(request: models.LabelRequest) -> "Future[Image.Image]":
+    """the label's image from the cache, or rendering on the renderer"""
+    key = cache.key_for(request.label)
+
+    img = render_cache.get(key)
+    if img is not None:
+        cached: Future[Image.Image] = Future()
+        cached.set_result(img)
+        return cached
+
+    start = time.perf_counter()
+
+    def rendered(future: "Future[Image.Image]"):
+        metrics.render_stage_seconds.observe(time.perf_counter() - start, stage="label")
+        if future.exception() is None:
+            render_cache.put(key, future.result())
+
+    future = renderer.submit(request.label)
+    future.add_done_callback(rendered)
+    return future
+
+
+def _image_for_request(request: models.LabelRequest):
+    return _submit_image(request).result()
+
+
+async def _image_for_request_async(request: models.LabelRequest):
+    key = cache.key_for(request.label)
+
+    img = render_cache.get(key)
+    if img is None:
+        with metrics.render_stage_seconds.time(stage="label"):
+            img = await renderer.render_async(request.label)
+        render_cache.put(key, img)
 
     return img
 
@@ -75,14 +340,82 @@ async def parameter_exception_handler(request: Request, exc: models.ParameterErr
     return PlainTextResponse(str(exc), status_code=400)
 
 
+@app.exception_handler(spool.SpoolError)
+async def spool_exception_handler(request: Request, exc: spool.SpoolError):
+    return PlainTextResponse(str(exc), status_code=409)
+
+
+@app.exception_handler(transports.TransportError)
+async def transport_exception_handler(request: Request, exc: transports.TransportError):
+    return PlainTextResponse(str(exc), status_code=503)
+
+
 @app.get("/")
 async def index(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 
+async def _status_snapshot():
+    status_poller.start()
+
+    # the first request after startup waits for one round of polling
+    await status_poller.settle(settings.status_timeout)
+    return status_poller.snapshot()
+
+
 @app.get("/status")
-async def status():
-    return {printer: _driver_for(printer).status() for printer in settings.printers}
+async def get_status():
+    return await _status_snapshot()
+
+
+@app.get("/status/wait")
+async def wait_status(version: int = -1, timeout: float = 30.0):
+    """long poll, answers once the status differs from version"""
+    await _status_snapshot()
+
+    version, snapshot = await status_poller.wait_for_change(version, min(timeout, 60.0))
+    return {
+        "version": version,
+        "printers": {k: v.model_dump(mode="json") for k, v in snapshot.items()},
+    }
+
+
+@app.get("/status/events")
+async def status_events():
+    """server-sent events, one per status change"""
+    await _status_snapshot()
+
+    async def events():
+        version = -1
+        while True:
+            new_version, snapshot = await status_poller.wait_for_change(version, 15.0)
+            if new_version == version:
+                yield ": keepalive\n\n"
+                continue
+
+            version = new_version
+            body = {k: v.model_dump(mode="json") for k, v in snapshot.items()}
+            yield f"id: {version}\ndata: {json.dumps(body)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/stats")
+async def stats():
+    return {
+        "render_cache": render_cache.info(),
+        "face_cache": draw.face_cache_info(),
+    }
+
+
+@app.get("/metrics")
+async def get_metrics():
+    if not settings.metrics:
+        raise HTTPException(status_code=404, detail="metrics are turned off")
+
+    # queue depths take the spool locks, so are not read on the event loop
+    exposition = await asyncio.to_thread(metrics.exposition)
+    return PlainTextResponse(exposition, media_type="text/plain; version=0.0.4")
 
 
 @app.get("/config")
@@ -97,47 +430,389 @@ async def config():
     return response
 
 
-@app.put("/print")
-async def print(label_request: models.LabelRequest):
+async def _wait_all(waited: list[models.PrintJob]) -> bool:
+    """wait up to job_wait_timeout for the jobs, False if it ran out"""
+    deadline = time.monotonic() + settings.job_wait_timeout
+    for job in waited:
+        remaining = max(deadline - time.monotonic(), 0)
+        if not await asyncio.to_thread(jobs.wait_for, job, remaining):
+            return False
+
+    return True
+
+
+async def _wait_status(waited: list[models.PrintJob]) -> int:
+    """wait for the jobs, and the status code to answer for them
+
+    A printer fault on any job is a 500, a job that failed only on its
+    labels a 400.  Jobs still going when the wait runs out, or held in
+    the spool until their printer is back, are a 202.
+    """
+    if not await _wait_all(waited):
+        # still queued or printing, the caller can poll /jobs/{id}
+        return 202
+
+    failed = [x for x in waited if x.state == models.JobState.failed]
+    if failed:
+        bad_request = all(
+            isinstance(x._exception, models.ParameterError) for x in failed
+        )
+        return 400 if bad_request else 500
+
+    if any(x.state == models.JobState.spooled for x in waited):
+        return 202
+
+    return 200
+
+
+async def _job_response(job: models.PrintJob, wait: bool):
+    if wait:
+        status_code = await _wait_status([job])
+        return JSONResponse(job.model_dump(mode="json"), status_code=status_code)
+
+    return job
+
+
+@app.put("/print", status_code=202)
+async def print(label_request: models.LabelRequest, wait: bool = False):
     driver = _driver_for(label_request.label.printer)
+    job = _queue_for(label_request.label.printer).submit(
+        lambda job: _job_for_request(driver, label_request)
+    )
 
-    if label_request.label.label_type != "raw":
-        img = _image_for_request(label_request)
+    return await _job_response(job, wait)
 
-        final_width = img.width
 
-        tape = label_request.label.tape.value
-        final_ofs = models.tapes[tape].offset
+@app.put("/print/batch", status_code=202)
+async def print_batch(batch_request: models.BatchRequest, wait: bool = False):
+    """one job per printer, holding every label for that printer"""
+    by_printer: dict[str, list[tuple[int, models.LabelRequest]]] = {}
+    for idx, item in enumerate(batch_request.labels):
+        by_printer.setdefault(item.label.printer, []).append((idx, item))
 
-        out_img = Image.new(mode="1", size=(final_width, 128), color=1)
-        out_img.paste(img, (0, final_ofs))
+    # check every printer before queueing anything
+    drivers = {printer: _driver_for(printer) for printer in by_printer}
 
-        driver.print(out_img)
-    else:
-        driver.transport.send_bytes(base64.b64decode(label_request.label.b64_bytes))
+    batch_jobs = [
+        _queue_for(printer).submit(
+            functools.partial(_batch_job, drivers[printer], items)
+        )
+        for printer, items in by_printer.items()
+    ]
 
+    if wait:
+        status_code = await _wait_status(batch_jobs)
+        return JSONResponse(
+            [x.model_dump(mode="json") for x in batch_jobs], status_code=status_code
+        )
 
-@app.put("/preview")
-async def preview(label_request: models.LabelRequest, max_width: int = 0):
-    img = _image_for_request(label_request)
+    return batch_jobs
+
+
+@app.put("/print/series", status_code=202)
+async def print_series(series_request: models.SeriesRequest, wait: bool = False):
+    """a templated series, rendered and sent a chunk at a time
+
+    Each chunk is its own job, chain printed into the next one.
+    """
+    items = series.expand_values(
+        series_request.template,
+        series.series_values(series_request),
+        series_request.count,
+    )
+
+    # check the template with the first label before queueing anything
+    row = next(items, None)
+    if row is None:
+        raise models.ParameterError("no labels in the series")
+
+    first = row[1]
+    if isinstance(first, models.ItemError):
+        raise models.ParameterError(first.error)
+
+    printer = first.label.printer
+    driver = _driver_for(printer)
+    queue = _queue_for(printer)
+
+    # chunks are taken from the shared rows in turn by the printer's
+    # worker, so only the chunk being printed is ever rendered
+    rows = SeriesRows(printer, items, [row])
+    chunks = -(-series.series_length(series_request) // settings.series_chunk)
+
+    series_jobs = [
+        queue.submit(functools.partial(_series_job, driver, rows))
+        for _ in range(chunks)
+    ]
+
+    if wait:
+        status_code = await _wait_status(series_jobs)
+        return JSONResponse(
+            [x.model_dump(mode="json") for x in series_jobs], status_code=status_code
+        )
+
+    return series_jobs
+
+
+@app.put("/print/raw/{printer}", status_code=202)
+async def print_raw(request: Request, printer: str, count: int = 1, wait: bool = False):
+    """queue an already encoded job sent as the request body"""
+    if count < 1:
+        raise models.ParameterError("count must be at least 1")
+
+    data = await request.body()
+    if not data:
+        raise models.ParameterError("no job data")
+
+    job = _queue_for(printer).submit(lambda job: data * count)
+
+    return await _job_response(job, wait)
+
+
+@app.get("/jobs")
+async def list_jobs(printer: Optional[str] = None):
+    return jobs.list_jobs(printer)
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+
+    return job
+
+
+def _queue_depths() -> dict[str, dict[str, int]]:
+    return {printer: {"depth": queue.depth} for printer, queue in list(_queues.items())}
+
+
+@app.get("/queues")
+async def queues():
+    return await asyncio.to_thread(_queue_depths)
+
+
+# spools do file io, and wait on a job being written to them, so they
+# are only used off the event loop
+def _spooled_queue(printer: str) -> jobs.PrintQueue:
+    queue = _queue_for(printer)
+    if queue.spool is None:
+        raise HTTPException(status_code=404, detail="spooling is turned off")
+
+    return queue
+
+
+def _spool_listing(printer: str) -> list[dict[str, Any]]:
+    printer_spool = _spooled_queue(printer).spool
+    assert printer_spool is not None
+
+    return [
+        {
+            "id": x.id,
+            "queued_at": x.queued_at,
+            "bytes": x.size,
+            "sending": x.id == printer_spool.sending,
+        }
+        for x in printer_spool.pending()
+    ]
+
+
+def _reorder_spool(printer: str, job_ids: list[str]) -> list[dict[str, Any]]:
+    printer_spool = _spooled_queue(printer).spool
+    assert printer_spool is not None
+
+    printer_spool.reorder(job_ids)
+    return _spool_listing(printer)
+
+
+@app.get("/spool/{printer}")
+async def list_spool(printer: str):
+    """jobs waiting in a printer's spool, in the order they will be sent"""
+    return await asyncio.to_thread(_spool_listing, printer)
+
+
+@app.delete("/spool/{printer}/{job_id}")
+async def cancel_spooled(printer: str, job_id: str):
+    queue = await asyncio.to_thread(_spooled_queue, printer)
+    return await asyncio.to_thread(queue.cancel, job_id)
+
+
+@app.put("/spool/{printer}/order")
+async def reorder_spool(printer: str, job_ids: list[str]):
+    """send the given jobs next, in the given order"""
+    return await asyncio.to_thread(_reorder_spool, printer, job_ids)
+
+
+class Preview(NamedTuple):
+    png: bytes
+    width: str
+    height: str
+
+
+def _preview_etag(label_request: models.LabelRequest, max_width: int) -> str:
+    # strong, everything that changes the png is in the render cache key
+    return f'"{cache.key_for(label_request.label)}-{max_width}"'
+
+
+async def _preview_for(label_request: models.LabelRequest, max_width: int) -> Preview:
+    img = await _image_for_request_async(label_request)
+    img = labels.off_tape(img, label_request.label.tape.value)
 
     label_height = f"{(img.height / 128):0.1f}"
     label_width = f"{(img.width / 128):0.1f}"
 
-    if max_width != 0 and max_width < img.width:
-        resize_ratio = max_width / img.width
-        new_height = img.height * resize_ratio
-        img = img.resize((max_width, int(new_height)))
-
     bytes = io.BytesIO()
-    img.save(bytes, format="PNG")
+    labels.shrink(img, max_width).save(bytes, format="PNG")
+
+    return Preview(bytes.getvalue(), label_width, label_height)
+
+
+async def _png_response(
+    label_request: models.LabelRequest, max_width: int, if_none_match: Optional[str]
+) -> Response:
+    etag = _preview_etag(label_request, max_width)
+    # always revalidate, an unchanged label is then a bodiless 304
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if if_none_match:
+        tags = [x.strip().removeprefix("W/") for x in if_none_match.split(",")]
+        if etag in tags or "*" in tags:
+            return Response(status_code=304, headers=headers)
 
-    bytes.seek(0)
+    preview = await _preview_for(label_request, max_width)
+    headers["X-Label-Width"] = preview.width
+    headers["X-Label-Height"] = preview.height
+    return Response(preview.png, media_type="image/png", headers=headers)
+
+
+@app.put("/preview")
+async def preview(label_request: models.LabelRequest, max_width: int = 0):
+    preview = await _preview_for(label_request, max_width)
     return {
-        "preview": base64.b64encode(bytes.read()),
-        "width": label_width,
-        "height": label_height,
+        "preview": base64.b64encode(preview.png),
+        "width": preview.width,
+        "height": preview.height,
+    }
+
+
+@app.get("/preview.png")
+async def preview_png_get(
+    request: str, max_width: int = 0, if_none_match: Optional[str] = Header(None)
+):
+    """the preview of a label request given as json in the query string
+
+    As a GET, browsers cache it and revalidate with If-None-Match.
+    """
+    try:
+        label_request = models.LabelRequest.model_validate_json(request)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
+    return await _png_response(label_request, max_width, if_none_match)
+
+
+@app.put("/preview.png")
+async def preview_png(
+    label_request: models.LabelRequest,
+    max_width: int = 0,
+    if_none_match: Optional[str] = Header(None),
+):
+    return await _png_response(label_request, max_width, if_none_match)
+
+
+class LatestOnly:
+    """a mailbox holding only the newest item, for a consumer that falls behind
+
+    Putting an item replaces any still waiting, which is dropped.
+    get() returns None once closed.
+    """
+
+    def __init__(self):
+        self.closed = False
+        self._item = None
+        self._ready = asyncio.Event()
+
+    def put(self, item):
+        if self._item is not None:
+            metrics.previews_superseded.inc()
+        self._item = item
+        self._ready.set()
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+    async def get(self):
+        await self._ready.wait()
+        self._ready.clear()
+        if self.closed:
+            return None
+
+        item, self._item = self._item, None
+        return item
+
+
+async def _live_preview(text: str, last_etag: Optional[str]):
+    """the json header and png for one live preview message"""
+    seq = None
+    try:
+        message = json.loads(text)
+        seq = message.get("seq")
+        label_request = models.LabelRequest.model_validate(message["request"])
+        max_width = int(message.get("max_width", 0))
+
+        etag = _preview_etag(label_request, max_width)
+        if etag == last_etag:
+            return {"seq": seq, "etag": etag, "unchanged": True}, None
+
+        preview = await _preview_for(label_request, max_width)
+    except Exception as e:
+        return {"seq": seq, "error": str(e)}, None
+
+    header = {
+        "seq": seq,
+        "etag": etag,
+        "width": preview.width,
+        "height": preview.height,
     }
+    return header, preview.png
+
+
+@app.websocket("/preview/live")
+async def preview_live(websocket: WebSocket):
+    """previews of a label as it is edited
+
+    Clients send {"seq", "request", "max_width"} text messages.  Only
+    the newest one waiting is rendered, so a fast typist does not queue
+    up renders of text already replaced.  Each rendered preview is a
+    json header with the seq it answers, followed by the png as a
+    binary message.  Headers for errors, or for a label that looks
+    the same as the last one sent, have no png after them.
+    """
+    await websocket.accept()
+    mailbox = LatestOnly()
+
+    async def receive():
+        try:
+            while True:
+                mailbox.put(await websocket.receive_text())
+        except WebSocketDisconnect:
+            pass
+        finally:
+            mailbox.close()
+
+    receiver = asyncio.create_task(receive())
+    last_etag = None
+    try:
+        while (text := await mailbox.get()) is not None:
+            header, png = await _live_preview(text, last_etag)
+            await websocket.send_json(header)
+            if png is not None:
+                await websocket.send_bytes(png)
+                last_etag = header["etag"]
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
 
 
 if __name__ == "__main__":
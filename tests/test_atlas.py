@@ -0,0 +1,89 @@
+"""the glyph atlas should draw exactly what ImageDraw.text does"""
+
+import random
+import string
+
+import pytest
+from PIL import Image, ImageDraw
+from pt750 import atlas, draw, labels, models
+
+TAGS = ["ASSET-0042", "RACK-A01", "SRV-DB-07", "PDU-B2 OUTLET 14 ", "x"]
+
+
+def random_text(rng):
+    return "".join(rng.choice(string.printable[:95]) for _ in range(rng.randint(1, 20)))
+
+
+def text_block(height, fontname, fontsize, lines):
+    block = draw.TextBlock(height, fontname, fontsize, lines, models.HAlignment.left)
+    img = Image.new("1", (block.width, height), 1)
+    block.draw(img)
+    return img
+
+
+@pytest.fixture
+def use_atlas(monkeypatch):
+    def use(enabled: bool):
+        monkeypatch.setattr(models.settings, "glyph_atlas", enabled)
+
+    yield use
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_draw_matches_imagedraw(seed):
+    rng = random.Random(seed)
+    fontpath = draw.path_for("mono")
+
+    for _ in range(100):
+        font = draw.get_font(fontpath, rng.randint(atlas.MIN_ATLAS_SIZE, 160))
+        glyphs = atlas.atlas_for(font)
+        text = random_text(rng)
+        xy = (
+            rng.choice([0, 0.5, rng.uniform(0, 10)]),
+            rng.choice([0, 0.999, rng.uniform(0, 10)]),
+        )
+        size = (int(font.getlength(text)) + 20, font.size * 2 + 20)
+
+        expected = Image.new("1", size, 1)
+        ImageDraw.Draw(expected).text(xy, text, font=font)
+        img = Image.new("1", size, 1)
+        glyphs.draw(img, xy, text)
+
+        assert glyphs.supports(text)
+        assert img.tobytes() == expected.tobytes(), (font.size, text, xy)
+        assert glyphs.getsize(text) == draw.getsize(font, text)
+
+
+@pytest.mark.parametrize("tape", models.tapes.values(), ids=models.tapes)
+@pytest.mark.parametrize("align", list(models.HAlignment))
+@pytest.mark.parametrize("size", list(draw.font_sizes))
+def test_text_labels_unchanged(use_atlas, tape, align, size):
+    def render():
+        return [
+            labels.TextLabel(tape.printable_height, "mono", lines, align, size).image
+            for lines in [TAGS[:1], TAGS[:2], TAGS[1:4]]
+        ] + [
+            labels.FlagLabel(tape.printable_height, "mono", x, size).image for x in TAGS
+        ]
+
+    use_atlas(False)
+    expected = render()
+    use_atlas(True)
+
+    for img, expected_img in zip(render(), expected):
+        assert img.size == expected_img.size
+        assert img.tobytes() == expected_img.tobytes()
+
+
+def test_unsupported_fallback(use_atlas):
+    font = draw.get_font(draw.path_for("sans"), 40)
+    assert not atlas.atlas_for(font).supports("ASSET")
+
+    mono = atlas.atlas_for(draw.get_font(draw.path_for("mono"), 40))
+    assert not mono.supports("café")
+
+    for lines in [["ASSET-0042"], ["café", "ASSET"]]:
+        use_atlas(False)
+        expected = text_block(64, "sans", "large", lines)
+        use_atlas(True)
+        assert text_block(64, "sans", "large", lines).tobytes() == expected.tobytes()
@@ -0,0 +1,32 @@
+from pt750 import bench, labels, models
+
+STAGES = ["render", "encode", "send_tcp", "send_http", "send_usb"]
+
+
+def test_suite_covers_everything():
+    results = bench.run_suite(iterations=1)
+
+    names = {(x["label"], x["tape"], x["stage"]) for x in results}
+    assert names == {
+        (label, tape, stage)
+        for label in labels.label_classes
+        for tape in models.tapes
+        for stage in STAGES
+    }
+    assert all(x["min_ms"] <= x["median_ms"] for x in results)
+
+
+def test_compare_results():
+    old = {
+        "results": [
+            {"label": "text", "tape": "24mm", "stage": "render", "median_ms": 2.0}
+        ]
+    }
+    new = {
+        "results": [
+            {"label": "text", "tape": "24mm", "stage": "render", "median_ms": 3.0},
+            {"label": "qr", "tape": "24mm", "stage": "render", "median_ms": 1.0},
+        ]
+    }
+
+    assert bench.compare_results(old, new) == [("text/24mm/render", 2.0, 3.0)]
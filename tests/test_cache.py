@@ -0,0 +1,71 @@
+"""rendered label cache"""
+
+import os
+
+from PIL import Image
+from pt750 import cache, models
+
+
+def a_label(**kwargs):
+    label = {
+        "label_type": "text",
+        "printer": "default",
+        "tape": "24mm",
+        "align": "left",
+        "lines": ["hello"],
+    }
+    label.update(kwargs)
+
+    return models.LabelRequest(label=label).label
+
+
+def test_key_ignores_printer():
+    assert cache.key_for(a_label()) == cache.key_for(a_label(printer="other"))
+    assert cache.key_for(a_label()) != cache.key_for(a_label(lines=["bye"]))
+
+
+def test_lru_bounded():
+    render_cache = cache.RenderCache(2)
+
+    for key in ["a", "b", "c"]:
+        render_cache.put(key, Image.new("1", (1, 1)))
+
+    assert render_cache.get("a") is None
+    assert render_cache.get("c") is not None
+
+    info = render_cache.info()
+    assert info["size"] == 2
+    assert info["hits"] == 1
+    assert info["misses"] == 1
+
+
+def test_disk_spill(tmp_path):
+    img = Image.new("1", (20, 10), color=1)
+    img.putpixel((3, 4), 0)
+
+    cache.RenderCache(4, str(tmp_path)).put("key", img)
+
+    # a fresh cache, as after a restart, finds the entry on disk
+    loaded = cache.RenderCache(4, str(tmp_path)).get("key")
+    assert loaded.mode == "1"
+    assert loaded.tobytes() == img.tobytes()
+
+
+def test_key_includes_settings(monkeypatch):
+    key = cache.key_for(a_label())
+
+    monkeypatch.setattr(models.settings, "qr_ecc", "H")
+    assert cache.key_for(a_label()) != key
+
+    monkeypatch.undo()
+    monkeypatch.setattr(models.settings, "glyph_atlas", False)
+    assert cache.key_for(a_label()) != key
+
+
+def test_disk_spill_bounded(tmp_path):
+    render_cache = cache.RenderCache(2, str(tmp_path))
+
+    for key in ["a", "b", "c"]:
+        render_cache.put(key, Image.new("1", (1, 1)))
+
+    assert sorted(os.listdir(tmp_path)) == ["b.png", "c.png"]
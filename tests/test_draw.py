@@ -0,0 +1,136 @@
+"""font fitting should match the original linear search"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy
+import pytest
+from PIL import Image, ImageOps
+from pt750 import bench, draw, fonts, models
+
+tape_heights = [(x.printable_height,) for x in models.tapes.values()]
+
+
+@pytest.fixture
+def fontpath():
+    draw._fit_cache.clear()
+    yield draw.path_for("mono")
+
+
+@pytest.mark.parametrize("height", tape_heights)
+@pytest.mark.parametrize("constrain_height", [True, False])
+def test_find_fit_matches_linear(fontpath, height, constrain_height):
+    text = "ASSET-0042"
+    expected = bench.linear_fit(fontpath, height[0], text, constrain_height)
+
+    assert draw.find_fit(fontpath, height[0], text, constrain_height) == expected
+
+
+def test_find_fit_memoized(fontpath):
+    first = draw.find_fit(fontpath, 64, "ASSET-0042")
+    assert len(draw._fit_cache) == 1
+
+    # the probe text is used for height fits, so any text hits the cache
+    assert draw.find_fit(fontpath, 64, "something else") == first
+    assert len(draw._fit_cache) == 1
+
+
+def test_find_fit_threads(fontpath, monkeypatch):
+    # a small cache, so threads evict while others look entries up
+    monkeypatch.setattr(draw, "FIT_CACHE_SIZE", 4)
+
+    def fit(height):
+        return draw.find_fit(fontpath, height % 16 + 20, "x", False)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        fits = list(pool.map(fit, range(2000)))
+
+    assert fits[:16] == fits[16:32]
+    assert len(draw._fit_cache) <= 4
+
+
+def test_face_cache(fontpath):
+    draw.clear_face_cache()
+
+    font = draw.get_font(fontpath, 20)
+    assert draw.get_font(fontpath, 20) is font
+
+    info = draw.face_cache_info()
+    assert info["hits"] == 1
+    assert info["misses"] == 1
+    assert info["size"] == 1
+
+    draw.clear_face_cache()
+    assert draw.face_cache_info()["size"] == 0
+    assert draw.get_font(fontpath, 20) is not font
+
+
+def test_face_cache_bounded(fontpath, monkeypatch):
+    monkeypatch.setattr(draw.settings, "face_cache_size", 4)
+    draw.clear_face_cache()
+
+    for fontsize in range(10, 20):
+        draw.get_font(fontpath, fontsize)
+
+    assert draw.face_cache_info()["size"] == 4
+
+
+def test_font_index_persisted(tmp_path):
+    font_dir = tmp_path / "fonts"
+    font_dir.mkdir()
+    (font_dir / "Example.otf").write_bytes(b"")
+    (font_dir / "Example.txt").write_bytes(b"")
+    cache_path = str(tmp_path / "index.json")
+
+    index = fonts.FontIndex([str(font_dir)], cache_path)
+    assert index.lookup("Example") == str(font_dir / "Example.otf")
+    assert index.lookup("Example.txt") is None
+
+    reloaded = fonts.FontIndex([str(font_dir)], cache_path)
+    assert reloaded.load()
+    assert reloaded.fonts == index.fonts
+
+    # a new file changes the directory mtime and invalidates the index
+    (font_dir / "Other.ttc").write_bytes(b"")
+    os.utime(font_dir, ns=(0, 0))
+    stale = fonts.FontIndex([str(font_dir)], cache_path)
+    assert not stale.load()
+    assert stale.lookup("Other") == str(font_dir / "Other.ttc")
+
+
+@pytest.mark.parametrize("dictionary", list(models.ArucoDictionary))
+def test_aruco_marker_matches_cv2(dictionary):
+    aruco_dict = cv2.aruco.getPredefinedDictionary(dictionary)
+    height = (aruco_dict.markerSize + 2) * 10
+
+    expected = cv2.aruco.generateImageMarker(aruco_dict, 3, height)
+    img = draw.aruco_marker(dictionary, 3, height)
+
+    assert img.mode == "1"
+    assert img.tobytes() == Image.fromarray(expected).convert("1").tobytes()
+
+
+@pytest.mark.parametrize("height", [32, 48, 70, 128])
+def test_aruco_marker_detected(height):
+    img = draw.aruco_marker(models.ArucoDictionary.DICT_4X4_100, 42, height)
+    assert img.size == (height, height)
+
+    # detection needs a quiet zone around the marker
+    padded = ImageOps.expand(img.convert("L"), border=height // 2, fill=255)
+    detector = cv2.aruco.ArucoDetector(
+        cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_100)
+    )
+    _, ids, _ = detector.detectMarkers(numpy.asarray(padded))
+    assert ids is not None and ids.flatten().tolist() == [42]
+
+
+def test_aruco_marker_memoized():
+    draw._aruco_marker.cache_clear()
+    for _ in range(3):
+        draw.aruco_marker(models.ArucoDictionary.DICT_4X4_50, 7, 64)
+
+    assert draw._aruco_marker.cache_info().hits == 2
+
+    with pytest.raises(models.ParameterError):
+        draw.aruco_marker(models.ArucoDictionary.DICT_4X4_50, 50, 64)
@@ -0,0 +1,17 @@
+import cv2
+import pytest
+
+from pt750 import bench, models
+
+
+@pytest.mark.parametrize("module", bench.IMPORT_BUDGETS)
+def test_heavy_modules_lazy(module):
+    _, loaded = bench.import_time(module)
+
+    assert module in loaded
+    assert not loaded.intersection(bench.LAZY_MODULES)
+
+
+def test_aruco_dictionaries_match_cv2():
+    for item in models.ArucoDictionary:
+        assert item.value == getattr(cv2.aruco, item.name)
@@ -0,0 +1,142 @@
+"""labels drawn straight into one image should match compositing them"""
+
+import random
+import string
+
+import pytest
+from PIL import Image, ImageDraw
+from pt750 import draw, labels, models
+from pt750.models import HAlignment
+
+# glyphs reaching past the line box, which blocks must clip
+EDGE_TEXT = ["|_(Qgjy)", "jjj", "ÅÉ ÿ", "__", "a"]
+
+
+def legacy_text_block(height, fontname, fontsize, lines, alignment=HAlignment.left):
+    # each block in an image of its own, as labels used to be built
+    fontpath = draw.path_for(fontname)
+    height_per_row = height / len(lines)
+    font_height = height_per_row * draw.font_sizes[fontsize]
+    fs = draw.find_fit(fontpath, font_height, "".join(lines))
+    line_ofs = (height_per_row - font_height) // 2
+    font = draw.get_font(fontpath, fs)
+
+    widths = [draw.getsize(font, line)[0] for line in lines]
+    width = max(widths)
+    img = Image.new("1", (width, height), 1)
+    img_draw = ImageDraw.Draw(img)
+    for idx, (line, line_width) in enumerate(zip(lines, widths)):
+        xofs = {
+            HAlignment.left: 0,
+            HAlignment.center: (width - line_width) / 2,
+            HAlignment.right: width - line_width,
+        }[alignment]
+        img_draw.text((xofs, idx * height_per_row + line_ofs), line, font=font)
+
+    return img
+
+
+def legacy_on_tape(img, tape):
+    # a label image pasted at the tape's offset across the print head
+    out_img = Image.new("1", (img.width, labels.PRINT_HEAD_DOTS), 1)
+    out_img.paste(img, (0, models.tapes[tape].offset))
+    return out_img
+
+
+def legacy_side_by_side(left, right, padding):
+    img = Image.new("1", (left.width + right.width + padding, left.height), 1)
+    img.paste(left)
+    img.paste(right, (left.width + padding, 0))
+    return img
+
+
+def legacy_image(label):
+    if isinstance(label, labels.TextLabel):
+        return legacy_text_block(
+            label.height, label.fontname, label.size, label.lines, label.align
+        )
+
+    if isinstance(label, labels.QRLabel):
+        left = draw.qr_code(label.height, label.qrtext)
+    elif isinstance(label, labels.ArucoLabel):
+        idx = int(getattr(models.ArucoDictionary, label.dictionary))
+        left = draw.aruco_marker(idx, label.id, label.height)
+    elif isinstance(label, labels.FlagLabel):
+        text = legacy_text_block(
+            label.height, label.fontname, label.size, [label.label]
+        )
+        img = legacy_side_by_side(text, text, label.padding)
+        middle = text.width + label.padding // 2
+        ImageDraw.Draw(img).line(((middle, 0), (middle, label.height)), width=1)
+        return img
+    else:
+        return draw.vertical_text_block(
+            label.height, label.length, label.fontname, label.label, label.min_count
+        )
+
+    if not label.lines:
+        return left
+
+    text = legacy_text_block(
+        label.height, label.fontname, label.size, label.lines, label.align
+    )
+    return legacy_side_by_side(left, text, label.padding)
+
+
+def random_lines(rng):
+    alphabet = string.ascii_letters + string.digits + "-_|()@ "
+    lines = [
+        "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 16)))
+        for _ in range(rng.randint(1, 3))
+    ]
+    return [rng.choice(EDGE_TEXT) if rng.random() < 0.3 else x for x in lines]
+
+
+def random_label(rng, tape):
+    height = models.tapes[tape].printable_height
+    font = rng.choice(list(draw.font_map))
+    size = rng.choice(list(draw.font_sizes))
+    align = rng.choice(list(HAlignment))
+    lines = random_lines(rng)
+
+    return rng.choice(
+        [
+            lambda: labels.TextLabel(height, font, lines, align, size),
+            lambda: labels.QRLabel(height, font, "x" * 20, size, 10, align, lines),
+            lambda: labels.QRLabel(height, font, "only a code"),
+            lambda: labels.ArucoLabel(height, font, "DICT_4X4_100", 7, size, 10, align),
+            lambda: labels.ArucoLabel(
+                height, font, "DICT_6X6_250", 42, size, 4, align, lines
+            ),
+            lambda: labels.WrapLabel(height, font, lines[0], length=200),
+            lambda: labels.FlagLabel(height, font, lines[0], size, padding=33),
+        ]
+    )()
+
+
+@pytest.mark.parametrize("glyph_atlas", [True, False])
+@pytest.mark.parametrize("tape", models.tapes)
+def test_matches_composited(monkeypatch, glyph_atlas, tape):
+    monkeypatch.setattr(models.settings, "glyph_atlas", glyph_atlas)
+    rng = random.Random(tape)
+
+    for _ in range(25):
+        label = random_label(rng, tape)
+        expected = legacy_image(label)
+        tape_img = label.tape_image(tape)
+
+        assert label.image.size == expected.size
+        assert label.image.tobytes() == expected.tobytes(), type(label)
+        assert tape_img.tobytes() == legacy_on_tape(expected, tape).tobytes()
+        assert labels.off_tape(tape_img, tape).tobytes() == expected.tobytes()
+
+
+def test_render_is_printer_ready():
+    request = models.TextLabelRequest(
+        label_type="text", printer="default", tape="12mm", align="left", lines=["hi"]
+    )
+    label = labels.from_request(request)
+    img = labels.render(request)
+
+    assert img.size == (label.width, labels.PRINT_HEAD_DOTS)
+    assert img.tobytes() == legacy_on_tape(label.image, "12mm").tobytes()
@@ -0,0 +1,62 @@
+import pytest
+from fastapi.testclient import TestClient
+from pt750 import metrics, models, web
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(metrics, "_registry", [])
+
+
+def test_histogram_exposition(registry):
+    histogram = metrics.Histogram(
+        "test_seconds", "a test", ("stage",), buckets=(0.1, 1.0)
+    )
+    histogram.observe(0.05, stage="fit")
+    histogram.observe(0.5, stage="fit")
+    histogram.observe(5, stage="fit")
+
+    assert metrics.exposition().splitlines() == [
+        "# HELP test_seconds a test",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{stage="fit",le="0.1"} 1',
+        'test_seconds_bucket{stage="fit",le="1.0"} 2',
+        'test_seconds_bucket{stage="fit",le="+Inf"} 3',
+        'test_seconds_sum{stage="fit"} 5.55',
+        'test_seconds_count{stage="fit"} 3',
+    ]
+
+
+def test_disabled(registry, monkeypatch):
+    monkeypatch.setattr(models.settings, "metrics", False)
+
+    histogram = metrics.Histogram("test_seconds", "a test")
+    counter = metrics.Counter("test_total", "a test")
+    with histogram.time():
+        counter.inc(10)
+
+    assert histogram.time() is metrics._null_timer
+    samples = [x for x in metrics.exposition().splitlines() if not x.startswith("#")]
+    assert samples == []
+
+
+def test_metrics_endpoint(monkeypatch):
+    client = TestClient(web.app)
+    label = {
+        "label_type": "text",
+        "printer": "default",
+        "tape": "24mm",
+        "align": "left",
+        "lines": ["metrics test"],
+    }
+    assert client.put("/print?wait=true", json={"label": label}).status_code == 200
+
+    text = client.get("/metrics").text
+    assert 'pt750_bytes_sent_total{printer="default"}' in text
+    assert 'pt750_transport_seconds_count{printer="default",operation="send"}' in text
+    assert 'pt750_render_stage_seconds_count{stage="label"}' in text
+    assert 'pt750_queue_depth{printer="default"} 0.0' in text
+    assert 'pt750_cache_hit_ratio{cache="render"}' in text
+
+    monkeypatch.setattr(web.settings, "metrics", False)
+    assert client.get("/metrics").status_code == 404
@@ -1,13 +1,19 @@
 """testing web previews actually exercises most of the stack"""
 
+import asyncio
+import base64
+import io
 import json
 import random
 import string
+import threading
+import time
 
 import pytest
 from fastapi.testclient import TestClient
 from jsf import JSF
-from pt750 import models, web
+from PIL import Image
+from pt750 import labels, models, transports, web
 
 
 @pytest.fixture
@@ -101,3 +107,303 @@ def test_label_requests(client, tape, height, label_type):
     assert "preview" in res
 
     # should load the preview and make sure height is right.
+
+
+def test_preview_cached(client):
+    lr = a_random_model(models.TextLabelRequest, tape="24mm")
+    request = {"label": lr, "count": 1}
+
+    before = client.get("/stats").json()["render_cache"]
+
+    assert client.put("/preview", json=request).status_code == 200
+    assert client.put("/preview", json=request).status_code == 200
+
+    after = client.get("/stats").json()["render_cache"]
+    assert after["misses"] == before["misses"] + 1
+    assert after["hits"] == before["hits"] + 1
+
+
+def test_print_queued(client):
+    lr = a_random_model(models.TextLabelRequest, tape="24mm", printer="default")
+    request = {"label": lr, "count": 1}
+
+    rv = client.put("/print", json=request)
+    assert rv.status_code == 202
+    job_id = rv.json()["id"]
+
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["state"] in ["done", "failed"]:
+            break
+        time.sleep(0.05)
+
+    assert job["state"] == "done"
+    assert job["render_time"] is not None
+    assert job["send_time"] is not None
+
+    assert client.get("/queues").json()["default"]["depth"] == 0
+
+
+def test_print_wait_reports_failure(client):
+    lr = a_random_model(models.TextLabelRequest, tape="24mm", printer="default")
+    lr["lines"] = [""]
+    request = {"label": lr, "count": 1}
+
+    # a label that cannot be drawn is the caller's fault
+    rv = client.put("/print?wait=true", json=request)
+    assert rv.status_code == 400
+    assert rv.json()["state"] == "failed"
+
+    assert client.get("/jobs/not-a-job").status_code == 404
+
+
+def test_print_wait_printer_failure(client, monkeypatch):
+    def send(data):
+        raise OSError("printer is off")
+
+    monkeypatch.setattr(web, "_queues", {})
+    monkeypatch.setattr(web, "_sender_for", lambda printer, driver: send)
+
+    rv = client.put("/print/raw/default?wait=true", content=b"x")
+    assert rv.status_code == 500
+    assert rv.json()["error"] == "printer is off"
+
+
+def test_print_wait_times_out(client, monkeypatch):
+    released = threading.Event()
+
+    monkeypatch.setattr(web.settings, "job_wait_timeout", 0.1)
+    monkeypatch.setattr(web, "_queues", {})
+    monkeypatch.setattr(
+        web, "_sender_for", lambda printer, driver: lambda data: released.wait(5)
+    )
+
+    try:
+        rv = client.put("/print/raw/default?wait=true", content=b"x")
+        assert rv.status_code == 202
+        assert rv.json()["state"] == "sending"
+    finally:
+        released.set()
+
+
+def test_print_batch_reports_item_failures(client):
+    good = a_random_model(models.TextLabelRequest, tape="12mm", printer="default")
+    bad = a_random_model(models.TextLabelRequest, tape="12mm", printer="default")
+    bad["lines"] = [""]
+    request = {"labels": [{"label": good}, {"label": bad}, {"label": good}]}
+
+    rv = client.put("/print/batch?wait=true", json=request)
+    assert rv.status_code == 200
+
+    (job,) = rv.json()
+    assert job["state"] == "done"
+    assert [x["index"] for x in job["item_errors"]] == [1]
+
+    # nothing in the batch could be drawn
+    request = {"labels": [{"label": bad}]}
+    rv = client.put("/print/batch?wait=true", json=request)
+    assert rv.status_code == 400
+    assert rv.json()[0]["state"] == "failed"
+
+
+def test_status_cached(client):
+    rv = client.get("/status")
+    assert rv.status_code == 200
+
+    default = rv.json()["default"]
+    assert default["updated_at"] is not None
+
+    rv = client.get("/status/wait", params={"version": -1, "timeout": 1})
+    assert rv.status_code == 200
+    assert "default" in rv.json()["printers"]
+
+
+def test_print_raw_upload(client):
+    rv = client.put(
+        "/print/raw/default?wait=true&count=2",
+        content=b"\x00" * 100 + b"\x1a",
+        headers={"Content-Type": "application/octet-stream"},
+    )
+    assert rv.status_code == 200
+    assert rv.json()["state"] == "done"
+
+    assert client.put("/print/raw/nonexistent", content=b"x").status_code == 400
+
+
+def test_print_series(client, monkeypatch):
+    monkeypatch.setattr(web.settings, "series_chunk", 2)
+
+    template = {
+        "label_type": "aruco",
+        "printer": "default",
+        "tape": "24mm",
+        "align": "left",
+        "dictionary": "DICT_4X4_50",
+        "id": "{n}",
+        "lines": ["marker {n}"],
+    }
+    rv = client.put(
+        "/print/series?wait=true",
+        json={"template": template, "counters": {"n": {"start": 0, "stop": 4}}},
+    )
+    assert rv.status_code == 200
+    assert [x["state"] for x in rv.json()] == ["done"] * 3
+
+    # a template that cannot fill is rejected before anything is queued
+    rv = client.put(
+        "/print/series",
+        json={"template": template, "counters": {"m": {"stop": 4}}},
+    )
+    assert rv.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "ids, status_code, states, chained, errors",
+    [
+        ([1, 2, "bad", 4, 5, 6], 200, ["done"] * 3, [True, True, False], [2]),
+        ([1, 2, 3, "bad"], 200, ["done"] * 2, [True, False], [3]),
+        # a chunk with nothing to print fails, as a batch would
+        ([1, 2, "bad", "bad"], 400, ["done", "failed"], [False], [2, 3]),
+    ],
+)
+def test_print_series_bad_rows(
+    client, monkeypatch, ids, status_code, states, chained, errors
+):
+    sent = []
+    monkeypatch.setattr(web.settings, "series_chunk", 2)
+    monkeypatch.setattr(web, "_queues", {})
+    monkeypatch.setattr(web, "_sender_for", lambda printer, driver: sent.append)
+
+    template = {
+        "label_type": "aruco",
+        "printer": "default",
+        "tape": "24mm",
+        "align": "left",
+        "dictionary": "DICT_4X4_50",
+        "id": "{n}",
+    }
+    rows = [{"n": x} for x in ids]
+    rv = client.put(
+        "/print/series?wait=true", json={"template": template, "rows": rows}
+    )
+    assert rv.status_code == status_code
+
+    series_jobs = rv.json()
+    assert [x["state"] for x in series_jobs] == states
+    assert [y["index"] for x in series_jobs for y in x["item_errors"]] == errors
+
+    # every printed chunk but the last runs into the next, which is cut
+    printer = transports.PT750W
+    assert [printer.CHAIN_PRINTING in x for x in sent] == chained
+    assert sent[-1].endswith(printer.TRAILER)
+
+
+def test_preview_png(client):
+    lr = a_random_model(models.TextLabelRequest, tape="24mm")
+    body = {"label": lr, "count": 1}
+    request = json.dumps(body)
+
+    rv = client.get("/preview.png", params={"request": request})
+    assert rv.status_code == 200
+    assert rv.headers["content-type"] == "image/png"
+    assert rv.content.startswith(b"\x89PNG")
+
+    # the same image the json variant carries
+    res = client.put("/preview", json=body).json()
+    assert base64.b64decode(res["preview"]) == rv.content
+    assert rv.headers["x-label-width"] == res["width"]
+
+    etag = rv.headers["etag"]
+    rv = client.get(
+        "/preview.png", params={"request": request}, headers={"If-None-Match": etag}
+    )
+    assert rv.status_code == 304
+    assert not rv.content
+
+    rv = client.put("/preview.png", json=body, headers={"If-None-Match": etag})
+    assert rv.status_code == 304
+
+    # a different size is a different image
+    rv = client.get(
+        "/preview.png",
+        params={"request": request, "max_width": 50},
+        headers={"If-None-Match": etag},
+    )
+    assert rv.status_code == 200
+    assert rv.headers["etag"] != etag
+    with Image.open(io.BytesIO(rv.content)) as img:
+        assert img.width == 50
+
+
+def test_preview_png_bad_request(client):
+    rv = client.get("/preview.png", params={"request": '{"label": {}}'})
+    assert rv.status_code == 400
+
+
+def test_shrink_keeps_thin_lines():
+    img = Image.new("1", (400, 40), 1)
+    for x in range(1, 400, 10):
+        img.paste(0, (x, 0, x + 1, 40))
+
+    small = labels.shrink(img, 100)
+    assert small.size == (100, 10)
+    # every column averages in part of a line, none are dropped
+    assert all(small.getpixel((x, 5)) < 255 for x in range(0, 100, 10))
+    assert labels.shrink(img, 0) is img
+
+
+def test_latest_only():
+    async def run():
+        mailbox = web.LatestOnly()
+        for x in range(3):
+            mailbox.put(x)
+        assert await mailbox.get() == 2
+
+        mailbox.put(3)
+        mailbox.close()
+        assert await mailbox.get() is None
+
+    asyncio.run(run())
+
+
+def test_preview_live(client):
+    lr = a_random_model(models.TextLabelRequest, tape="24mm")
+    body = {"label": lr, "count": 1}
+
+    with client.websocket_connect("/preview/live") as ws:
+        ws.send_json({"seq": 1, "request": body, "max_width": 50})
+        header = ws.receive_json()
+        png = ws.receive_bytes()
+
+        assert header["seq"] == 1
+        assert png.startswith(b"\x89PNG")
+        rv = client.put("/preview?max_width=50", json=body)
+        assert header["width"] == rv.json()["width"]
+
+        # the same label again needs no new image
+        ws.send_json({"seq": 2, "request": body, "max_width": 50})
+        assert ws.receive_json() == {
+            "seq": 2,
+            "etag": header["etag"],
+            "unchanged": True,
+        }
+
+        ws.send_json({"seq": 3, "request": {"label": {}}})
+        header = ws.receive_json()
+        assert header["seq"] == 3
+        assert header["error"]
+
+        # only the newest of a burst is sure to be answered, in order
+        for seq in range(4, 10):
+            body["label"]["lines"] = [f"line {seq}"]
+            ws.send_json({"seq": seq, "request": body})
+
+        seen = []
+        while not seen or seen[-1] != 9:
+            header = ws.receive_json()
+            assert "error" not in header
+            ws.receive_bytes()
+            seen.append(header["seq"])
+
+        assert seen == sorted(seen)
@@ -0,0 +1,56 @@
+"""the native qr encoder should produce codes a reader can decode"""
+
+import cv2
+import numpy
+import pytest
+from PIL import Image
+from pt750 import draw, models, qr
+
+tape_heights = [(x.printable_height,) for x in models.tapes.values()]
+
+
+def decode(img):
+    # the opencv reader is picky about module size, so try a few scales
+    for scale in range(1, 5):
+        scaled = img.convert("L").resize(
+            (img.width * scale, img.height * scale), Image.Resampling.NEAREST
+        )
+        padded = numpy.full(
+            (scaled.height + 64, scaled.width + 64), 255, dtype=numpy.uint8
+        )
+        padded[32:-32, 32:-32] = numpy.array(scaled)
+
+        text, _, _ = cv2.QRCodeDetector().detectAndDecode(padded)
+        if text:
+            return text
+
+    return None
+
+
+@pytest.mark.parametrize("ecc", ["L", "M", "Q", "H"])
+@pytest.mark.parametrize("length", [1, 20, 100, 300])
+def test_encode_decodes(ecc, length):
+    text = ("pt750-" * length)[:length]
+    matrix = qr.encode(text, ecc=ecc)
+
+    assert decode(qr.render(matrix, scale=2, border=4)) == text
+
+
+def test_encode_version_sizes():
+    assert len(qr.encode("x" * 14, ecc="M")) == 21
+    assert len(qr.encode("x" * 15, ecc="M")) == 25
+
+    with pytest.raises(models.ParameterError):
+        qr.encode("x" * 3000, ecc="L")
+
+
+@pytest.mark.parametrize("height", tape_heights)
+def test_qr_code_fits_tape(height, monkeypatch):
+    monkeypatch.setattr(draw.settings, "qr_backend", "native")
+    text = "WIFI:T:WPA;S:office;P:hunter2;;"
+
+    img = draw.qr_code(height[0], text)
+
+    assert img.mode == "1"
+    assert img.size == (height[0], height[0])
+    assert decode(img) == text
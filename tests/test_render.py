@@ -0,0 +1,67 @@
+"""rendering executors should all produce the same image"""
+
+import asyncio
+
+import pytest
+from PIL import Image
+from pt750 import labels, models, render
+
+
+def a_label():
+    request = {
+        "label": {
+            "label_type": "qr",
+            "printer": "default",
+            "tape": "12mm",
+            "align": "left",
+            "qrtext": "https://example.com/asset/42",
+            "lines": ["ASSET-0042", "rack A01"],
+        }
+    }
+    return models.LabelRequest.model_validate(request).label
+
+
+def test_packed_roundtrip():
+    img = Image.new("1", (13, 7), color=1)
+    img.putpixel((12, 6), 0)
+
+    packed = render.PackedImage.from_image(img)
+
+    assert len(packed.data) == 2 * 7
+    assert packed.to_image().tobytes() == img.tobytes()
+
+
+@pytest.mark.parametrize("kind", render.Renderer.KINDS)
+def test_renderers_match_inline(kind):
+    label = a_label()
+    expected = labels.render(label)
+
+    renderer = render.Renderer(kind, workers=2)
+    try:
+        img = renderer.render(label)
+        async_img = asyncio.run(renderer.render_async(label))
+    finally:
+        renderer.shutdown()
+
+    assert img.size == expected.size
+    assert img.tobytes() == expected.tobytes()
+    assert async_img.tobytes() == expected.tobytes()
+
+
+def test_bad_kind():
+    with pytest.raises(models.ParameterError):
+        render.Renderer("gpu")
+
+
+@pytest.mark.parametrize("kind", ["inline", "thread"])
+def test_submit_failure(kind):
+    label = a_label()
+    label.fontname = "not-a-font"
+
+    renderer = render.Renderer(kind, workers=2)
+    try:
+        future = renderer.submit(label)
+        with pytest.raises(RuntimeError):
+            future.result()
+    finally:
+        renderer.shutdown()
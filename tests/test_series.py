@@ -0,0 +1,110 @@
+import json
+import sys
+
+import pytest
+from pt750 import main, models, series, transports
+
+TEMPLATE = {
+    "label_type": "text",
+    "printer": "default",
+    "tape": "12mm",
+    "align": "left",
+    "lines": ["RACK-{row}{n:02d}"],
+}
+
+
+def test_counters():
+    counters = dict(map(series.parse_counter, ["row=1:2", "n=10:6:-2"]))
+    values = list(series.counter_values(counters))
+
+    assert values == [
+        {"row": 1, "n": 10},
+        {"row": 1, "n": 8},
+        {"row": 1, "n": 6},
+        {"row": 2, "n": 10},
+        {"row": 2, "n": 8},
+        {"row": 2, "n": 6},
+    ]
+
+    with pytest.raises(models.ParameterError):
+        series.parse_counter("n=1")
+
+
+def test_fill():
+    assert series.fill(TEMPLATE, {"row": "A", "n": 7})["lines"] == ["RACK-A07"]
+
+    # a lone placeholder keeps its type
+    assert series.fill({"id": "{n}", "text": "{n}!"}, {"n": 3}) == {
+        "id": 3,
+        "text": "3!",
+    }
+
+    with pytest.raises(models.ParameterError):
+        series.fill(TEMPLATE, {"n": 1})
+
+
+def test_rows():
+    rows = list(series.read_rows(iter(["row,n\n", "A,1\n", "B,2\n"])))
+    assert rows == [{"row": "A", "n": "1"}, {"row": "B", "n": "2"}]
+
+    request = models.SeriesRequest(
+        template=TEMPLATE | {"lines": ["RACK-{row}{n}"]}, rows=rows, count=2
+    )
+    values = series.series_values(request)
+    items = list(series.expand_values(request.template, values, request.count))
+
+    assert series.series_length(request) == 2
+    assert [idx for idx, _ in items] == [0, 1]
+    assert [x.label.lines for _, x in items] == [["RACK-A1"], ["RACK-B2"]]
+    assert all(x.count == 2 for _, x in items)
+
+
+def test_print_jobs_chained():
+    printer = transports.PT750W("file:///dev/null")
+    request = models.SeriesRequest(
+        template=TEMPLATE, counters={"row": {"stop": 1}, "n": {"stop": 5}}
+    )
+
+    errors = []
+    items = series.expand_values(TEMPLATE, series.series_values(request))
+    pages = series.render_pages(printer, items, errors)
+    jobs = list(series.print_jobs(printer, pages, 2))
+
+    assert len(jobs) == 3
+    assert all(printer.CHAIN_PRINTING in x for x in jobs[:-1])
+    assert printer.NO_CHAIN_PRINTING in jobs[-1]
+    assert not errors
+
+
+def test_cli_bad_rows(tmp_path, monkeypatch, capsys):
+    sent = []
+    monkeypatch.setattr(transports.USBTransport, "send_bytes", sent.append)
+
+    template = TEMPLATE | {"label_type": "aruco", "dictionary": "DICT_4X4_50"}
+    template |= {"id": "{n}", "lines": []}
+    rows = tmp_path / "rows.jsonl"
+    rows.write_text("".join(f'{{"n": {json.dumps(x)}}}\n' for x in [1, 2, "x", 4]))
+
+    argv = ["makelabel", "--printer", "file:///dev/null", "series"]
+    argv += [json.dumps(template), "--rows", str(rows), "--chunk", "2"]
+    monkeypatch.setattr(sys, "argv", argv)
+    with pytest.raises(SystemExit) as exc:
+        main.main()
+
+    assert exc.value.code == 1
+    assert "rows not printed: 2" in capsys.readouterr().err
+
+    # the second job holds row 4, and is the one fed and cut
+    assert len(sent) == 2
+    assert transports.PT750W.CHAIN_PRINTING in sent[0]
+    assert transports.PT750W.NO_CHAIN_PRINTING in sent[1]
+    assert sent[1].endswith(transports.PT750W.TRAILER)
+
+
+def test_cli_bad_count(monkeypatch):
+    argv = ["makelabel", "--count", "0", "series", json.dumps(TEMPLATE)]
+    monkeypatch.setattr(sys, "argv", argv + ["--counter", "n=1:2"])
+    with pytest.raises(SystemExit) as exc:
+        main.main()
+
+    assert exc.value.code == 2
@@ -0,0 +1,298 @@
+import os
+import threading
+import time
+import uuid
+
+import pytest
+from pt750 import jobs, models, spool
+
+
+def an_id():
+    return uuid.uuid4().hex
+
+
+def chunks_of(data, size=1000):
+    for x in range(0, len(data), size):
+        yield data[x : x + size]  # noqa: E203
+
+
+@pytest.fixture
+def path(tmp_path):
+    yield str(tmp_path / "default.spool")
+
+
+def test_append_and_read(path):
+    s = spool.Spool(path, 1 << 20)
+    data = os.urandom(200_000)
+    job_id = an_id()
+
+    entry = s.append(job_id, 12.5, chunks_of(data))
+
+    assert entry.size == len(data)
+    assert b"".join(s.read(job_id)) == data
+    assert [x.id for x in s.pending()] == [job_id]
+
+    s.mark_sent(job_id)
+    assert not s.pending()
+    with pytest.raises(spool.SpoolError):
+        s.read(job_id)
+
+
+def test_recovers_pending_jobs(path):
+    s = spool.Spool(path, 1 << 20)
+    ids = [an_id() for _ in range(4)]
+    for idx, job_id in enumerate(ids):
+        s.append(job_id, float(idx), bytes([idx]) * 100)
+
+    s.mark_sent(ids[0])
+    s.cancel(ids[2])
+    s.reorder([ids[3]])
+    s.close()
+
+    s = spool.Spool(path, 1 << 20)
+    assert [x.id for x in s.pending()] == [ids[3], ids[1]]
+    assert s.pending()[1].queued_at == 1.0
+    assert b"".join(s.read(ids[3])) == bytes([3]) * 100
+
+
+def test_torn_write_is_dropped(path):
+    s = spool.Spool(path, 1 << 20)
+    kept = an_id()
+    s.append(kept, 0.0, b"kept")
+    size = s.size
+
+    def crash():
+        yield b"partial"
+        raise KeyboardInterrupt
+
+    # as if the process stopped part way through writing a job
+    with pytest.raises(KeyboardInterrupt):
+        s.append(an_id(), 0.0, crash())
+    assert os.path.getsize(path) == size
+
+    with open(path, "ab") as f:
+        f.write(spool.HEADER.pack(spool.MAGIC, spool.JOB, bytes(16), 0, 99, 0))
+        f.write(b"not all of it")
+    s.close()
+
+    s = spool.Spool(path, 1 << 20)
+    assert [x.id for x in s.pending()] == [kept]
+    assert os.path.getsize(path) == size
+
+
+def test_compaction(path, monkeypatch):
+    monkeypatch.setattr(spool, "COMPACT_MIN", 0)
+    s = spool.Spool(path, 1 << 20)
+
+    ids = [an_id() for _ in range(10)]
+    for job_id in ids:
+        s.append(job_id, 0.0, os.urandom(1000))
+
+    # a reader part way through keeps going after the log is rewritten
+    reader = s.read(ids[-1])
+    first = next(reader)
+
+    for job_id in ids[:-2]:
+        s.mark_sent(job_id)
+
+    assert s.size == s.live_bytes
+    assert [x.id for x in s.pending()] == ids[-2:]
+    assert first + b"".join(reader) == b"".join(s.read(ids[-1]))
+
+    s.close()
+    assert [x.id for x in spool.Spool(path, 1 << 20).pending()] == ids[-2:]
+
+
+def test_size_cap(path):
+    s = spool.Spool(path, 10_000)
+    sent = an_id()
+    s.append(sent, 0.0, bytes(6000))
+
+    with pytest.raises(spool.SpoolFull):
+        s.append(an_id(), 0.0, chunks_of(bytes(6000)))
+    assert [x.id for x in s.pending()] == [sent]
+
+    # sent jobs are compacted away to make room
+    s.mark_sent(sent)
+    s.append(an_id(), 0.0, bytes(6000))
+    assert len(s) == 1
+
+
+def test_compacts_under_an_append(path):
+    s = spool.Spool(path, 10_000)
+    kept, sent = an_id(), an_id()
+    s.append(kept, 0.0, b"kept")
+    s.append(sent, 0.0, bytes(6000))
+    s.mark_sent(sent)
+
+    # the log only runs out partway through the job, which is carried over
+    job_id = an_id()
+    data = os.urandom(6000)
+    s.append(job_id, 0.0, chunks_of(data))
+
+    assert [x.id for x in s.pending()] == [kept, job_id]
+    assert b"".join(s.read(kept)) == b"kept"
+    assert b"".join(s.read(job_id)) == data
+    assert [x.id for x in spool.Spool(path, 10_000).pending()] == [kept, job_id]
+
+
+def test_append_only_compacts_when_full(path, monkeypatch):
+    s = spool.Spool(path, 20_000)
+    rewrites = []
+    rewrite = s._rewrite
+    monkeypatch.setattr(
+        s, "_rewrite", lambda tail=0: rewrites.append(tail) or rewrite(tail)
+    )
+
+    for _ in range(100):
+        job_id = an_id()
+        s.append(job_id, 0.0, bytes(100))
+        s.mark_sent(job_id)
+    assert s.size > 10_000
+    assert not rewrites
+
+
+def test_cancel_while_sending(path):
+    s = spool.Spool(path, 1 << 20)
+    job_id = an_id()
+    s.append(job_id, 0.0, b"job")
+
+    assert s.take().id == job_id
+    with pytest.raises(spool.SpoolError):
+        s.cancel(job_id)
+
+    s.release()
+    s.cancel(job_id)
+    assert s.take() is None
+
+
+def test_append_does_not_hold_the_lock(path):
+    s = spool.Spool(path, 1 << 20)
+    kept = an_id()
+    s.append(kept, 0.0, b"kept")
+
+    encoding = threading.Event()
+    release = threading.Event()
+
+    def slow():
+        yield b"some"
+        encoding.set()
+        release.wait(5)
+        yield b"more"
+
+    job_id = an_id()
+    appending = threading.Thread(target=s.append, args=(job_id, 0.0, slow()))
+    appending.start()
+    try:
+        assert encoding.wait(5)
+        assert len(s) == 1
+        assert [x.id for x in s.pending()] == [kept]
+
+        # written after the job, once it is complete
+        cancelling = threading.Thread(target=s.cancel, args=(kept,))
+        cancelling.start()
+        cancelling.join(0.1)
+        assert cancelling.is_alive()
+    finally:
+        release.set()
+        appending.join(5)
+
+    cancelling.join(5)
+    assert [x.id for x in s.pending()] == [job_id]
+    assert b"".join(s.read(job_id)) == b"somemore"
+
+    s.close()
+    assert [x.id for x in spool.Spool(path, 1 << 20).pending()] == [job_id]
+
+
+def test_queue_replays_after_outage(path, monkeypatch):
+    monkeypatch.setattr(models.settings, "spool_retry_interval", 0.05)
+
+    sent = []
+    printer_up = threading.Event()
+
+    def send(data):
+        if not printer_up.is_set():
+            raise OSError("printer is off")
+        sent.append(b"".join(data))
+
+    queue = jobs.PrintQueue("spooled", send, spool.Spool(path, 1 << 20))
+    job = queue.submit(lambda job: iter([b"a", b"b"]))
+
+    assert jobs.wait_for(job, 5)
+    assert job.state == models.JobState.spooled
+    assert job.error == "printer is off"
+    assert queue.depth == 1
+
+    printer_up.set()
+    deadline = time.monotonic() + 5
+    while job.state != models.JobState.done and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert job.state == models.JobState.done
+    assert sent == [b"ab"]
+    assert queue.depth == 0
+
+
+def test_queue_replays_after_restart(path):
+    s = spool.Spool(path, 1 << 20)
+    left = [an_id(), an_id()]
+    s.append(left[0], 1.0, b"first")
+    s.append(left[1], 2.0, b"second")
+    s.close()
+
+    sent = []
+    done = threading.Event()
+
+    def send(data):
+        sent.append(b"".join(data))
+        if len(sent) == 2:
+            done.set()
+
+    jobs.PrintQueue("restarted", send, spool.Spool(path, 1 << 20))
+
+    assert done.wait(5)
+    assert sent == [b"first", b"second"]
+    assert jobs.get_job(left[1]).queued_at == 2.0
+
+
+def test_spool_api(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    from pt750 import web
+
+    monkeypatch.setattr(web.settings, "spool_dir", str(tmp_path))
+    monkeypatch.setattr(web, "_queues", {})
+
+    # a printer that never comes back, so jobs stay spooled
+    def send(data):
+        raise OSError("printer is off")
+
+    monkeypatch.setattr(web, "_sender_for", lambda printer, driver: send)
+    client = TestClient(web.app)
+
+    rv = client.put("/print/raw/default?wait=true", content=b"one")
+    assert rv.status_code == 202
+    assert rv.json()["state"] == "spooled"
+    first = rv.json()["id"]
+    second = client.put("/print/raw/default?wait=true", content=b"two").json()["id"]
+
+    listed = client.get("/spool/default").json()
+    assert [x["id"] for x in listed] == [first, second]
+    assert listed[0]["bytes"] == 3
+
+    rv = client.put("/spool/default/order", json=[second])
+    assert [x["id"] for x in rv.json()] == [second, first]
+
+    # the first job in the spool is being retried
+    deadline = time.monotonic() + 5
+    rv = client.delete(f"/spool/default/{second}")
+    while rv.status_code == 409 and time.monotonic() < deadline:
+        time.sleep(0.01)
+        rv = client.delete(f"/spool/default/{second}")
+    assert rv.status_code == 200
+    assert rv.json()["state"] == "cancelled"
+    assert client.get(f"/jobs/{second}").json()["state"] == "cancelled"
+
+    assert client.delete(f"/spool/default/{second}").status_code == 409
+    assert client.put("/spool/default/order", json=["nope"]).status_code == 409
+    assert [x["id"] for x in client.get("/spool/default").json()] == [first]
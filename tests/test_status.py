@@ -0,0 +1,135 @@
+"""background printer status polling"""
+
+import asyncio
+import threading
+import time
+
+from pt750 import models, status
+
+
+async def reach(poller, version, timeout=5.0):
+    """wait for the poller to count version changes"""
+    deadline = time.monotonic() + timeout
+    while poller.version < version and time.monotonic() < deadline:
+        await poller.wait_for_change(poller.version, deadline - time.monotonic())
+
+    return poller.version
+
+
+def test_slow_printer_does_not_hold_up_others():
+    release = threading.Event()
+
+    def slow():
+        release.wait(10)
+        return models.PrinterStatus(media="24mm", ready=True)
+
+    def fast():
+        return models.PrinterStatus(media="12mm", ready=True)
+
+    def broken():
+        raise RuntimeError("unreachable")
+
+    poller = status.StatusPoller({"slow": slow, "fast": fast, "broken": broken}, 60)
+
+    async def check():
+        poller.poll()
+
+        # fast and broken answer while slow is still going
+        assert await reach(poller, 2) == 2
+        snapshot = poller.snapshot()
+        assert snapshot["fast"].ready
+        assert snapshot["fast"].updated_at is not None
+        assert not snapshot["broken"].ready
+        assert snapshot["broken"].error == "unreachable"
+        assert not snapshot["slow"].ready
+        assert snapshot["slow"].updated_at is None
+
+        # a poll of a printer still in flight is skipped
+        poller.poll()
+
+        release.set()
+        new_version, snapshot = await poller.wait_for_change(2, 5)
+        assert new_version == 3
+        assert snapshot["slow"].ready
+
+    try:
+        asyncio.run(check())
+    finally:
+        release.set()
+        poller.stop()
+
+
+def test_unchanged_status_keeps_version():
+    poller = status.StatusPoller(
+        {"printer": lambda: models.PrinterStatus(ready=True)}, 60
+    )
+
+    async def check():
+        poller.poll()
+        assert await reach(poller, 1) == 1
+
+        poller.poll()
+        assert (await poller.wait_for_change(1, 0.5))[0] == 1
+
+    try:
+        asyncio.run(check())
+    finally:
+        poller.stop()
+
+
+def test_restart():
+    ready = [True]
+    poller = status.StatusPoller(
+        {"printer": lambda: models.PrinterStatus(ready=ready[0])}, 0.01
+    )
+
+    async def check():
+        poller.start()
+        assert await reach(poller, 1) == 1
+        poller.stop()
+
+        ready[0] = False
+        poller.start()
+        assert await reach(poller, 2) == 2
+        assert not poller.snapshot()["printer"].ready
+
+    try:
+        asyncio.run(check())
+    finally:
+        poller.stop()
+
+
+def test_async_wait_holds_no_thread():
+    release = threading.Event()
+
+    def slow():
+        release.wait(10)
+        return models.PrinterStatus(ready=True)
+
+    poller = status.StatusPoller({"slow": slow}, 60)
+
+    async def wait():
+        threads = threading.active_count()
+        poller.poll()
+
+        # the only printer never answers in time, so this gives up once
+        start = time.monotonic()
+        await poller.settle(0.2)
+        await poller.settle(5)
+        assert time.monotonic() - start < 2
+
+        waiting = asyncio.create_task(poller.wait_for_change(0, 5))
+        await asyncio.sleep(0.1)
+        # the poll's own thread, and none for the waiter
+        assert threading.active_count() == threads + 1
+
+        release.set()
+        version, snapshot = await waiting
+        assert version == 1
+        assert snapshot["slow"].ready
+
+    try:
+        asyncio.run(wait())
+    finally:
+        release.set()
+        poller.stop()
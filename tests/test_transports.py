@@ -0,0 +1,397 @@
+"""printer job encoding and transports"""
+
+import base64
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+import tracemalloc
+
+import httpx
+import pytest
+from PIL import Image, ImageDraw
+from pt750 import transports
+
+data_dir = os.path.join(os.path.dirname(__file__), "data")
+
+RESET_LENGTH = 100
+
+
+def a_pattern(width):
+    img = Image.new("1", (width, 128), color=1)
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((10, 10, 60, 100), fill=0)
+    draw.line((0, 0, width - 1, 127), fill=0)
+    for x in range(0, width, 7):
+        img.putpixel((x, x % 128), 0)
+
+    return img
+
+
+def unpackbits(data):
+    result = bytearray()
+    idx = 0
+
+    while idx < len(data):
+        header = data[idx]
+        idx += 1
+
+        if header < 128:
+            result += data[idx : idx + header + 1]  # noqa: E203
+            idx += header + 1
+        elif header > 128:
+            result += bytes([data[idx]]) * (257 - header)
+            idx += 1
+
+    return bytes(result)
+
+
+def parse_job(job):
+    """split a job into its settings commands and decoded pages of lines"""
+    assert job[:RESET_LENGTH] == bytes(RESET_LENGTH)
+
+    commands = []
+    pages = [[]]
+    compressed = False
+    idx = RESET_LENGTH
+
+    while True:
+        command = job[idx]
+
+        if command == 0x1B:
+            length = 2 if job[idx + 1] == 0x40 else 4
+            commands.append(job[idx : idx + length])  # noqa: E203
+            idx += length
+        elif command == 0x4D:
+            compressed = job[idx + 1] == 0x02
+            commands.append(job[idx : idx + 2])  # noqa: E203
+            idx += 2
+        elif command == 0x5A:
+            assert compressed
+            pages[-1].append(bytes(16))
+            idx += 1
+        elif command == 0x47:
+            length = job[idx + 1] | job[idx + 2] << 8
+            data = job[idx + 3 : idx + 3 + length]  # noqa: E203
+            idx += 3 + length
+
+            line = unpackbits(data) if compressed else data
+            assert len(line) == 16
+            pages[-1].append(line)
+        elif command == 0x0C:
+            pages.append([])
+            idx += 1
+        else:
+            assert command == 0x1A
+            assert idx == len(job) - 1
+            break
+
+    return commands, pages
+
+
+def golden_job(width):
+    with open(os.path.join(data_dir, f"pt750w_{width}.bin"), "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("width", [1, 300])
+@pytest.mark.parametrize("compress", [True, False])
+def test_print_matches_golden(tmp_path, width, compress):
+    outfile = tmp_path / "job.bin"
+    printer = transports.PT750W(f"file://{outfile}", compress=compress)
+
+    printer.print(a_pattern(width))
+
+    job = outfile.read_bytes()
+    golden = golden_job(width)
+
+    job_commands, job_pages = parse_job(job)
+    golden_commands, golden_pages = parse_job(golden)
+
+    # only the compression mode may differ
+    assert job_commands[:-1] == golden_commands[:-1]
+    assert job_pages == golden_pages
+
+
+def test_compression_shrinks_job():
+    img = a_pattern(300)
+
+    compressed = transports.PT750W("file:///dev/null").encode(img)
+    uncompressed = transports.PT750W("file:///dev/null", compress=False).encode(img)
+
+    assert len(compressed) < len(uncompressed)
+
+
+def test_blank_lines_are_one_byte():
+    img = Image.new("1", (1000, 128), color=1)
+
+    job = transports.PT750W("file:///dev/null").encode(img)
+
+    assert job.endswith(b"\x4d\x02" + b"\x5a" * 1000 + b"\x1a")
+
+
+def test_copies_in_one_job():
+    img = a_pattern(300)
+    printer = transports.PT750W("file:///dev/null")
+
+    commands, pages = parse_job(printer.encode(img, count=3))
+    _, single_pages = parse_job(printer.encode(img))
+
+    assert transports.PT750W.CUT_EACH_LABEL in commands
+    assert transports.PT750W.NO_CHAIN_PRINTING in commands
+    assert pages == single_pages * 3
+
+    commands, _ = parse_job(printer.encode(img, chain=True))
+    assert transports.PT750W.CHAIN_PRINTING in commands
+
+
+@pytest.mark.parametrize("width", [1, 300, 5000])
+@pytest.mark.parametrize("compress", [True, False])
+@pytest.mark.parametrize("count", [1, 3])
+def test_iter_job_matches_encode(monkeypatch, width, compress, count):
+    monkeypatch.setattr(transports.PT750W, "CHUNK_LINES", 128)
+    printer = transports.PT750W("file:///dev/null", compress=compress)
+    img = a_pattern(width)
+
+    chunks = list(printer.iter_job(img, count=count))
+
+    assert len(chunks) >= 2 + count * (width // 128)
+    assert b"".join(chunks) == printer.encode(img, count=count)
+
+
+def test_streamed_print_memory(tmp_path):
+    # a label a few metres long
+    img = a_pattern(200000)
+    printer = transports.PT750W(f"file://{tmp_path / 'job.bin'}")
+
+    tracemalloc.start()
+    try:
+        printer.print(img)
+        _, streamed_peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+        printer.transport.send_bytes(printer.encode(img))
+        _, whole_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert (tmp_path / "job.bin").read_bytes() == printer.encode(img)
+    assert streamed_peak < 1024 * 1024
+    assert streamed_peak * 5 < whole_peak
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"",
+        b"\x00",
+        b"\x00" * 16,
+        b"\x01\x02\x03",
+        b"\x01\x01\x02\x03\x03\x03\x04",
+        bytes(range(200)),
+        b"\xff" * 300,
+        bytes(range(16)) + b"\x00" * 200 + bytes(range(130)),
+    ],
+)
+def test_packbits_roundtrip(data):
+    assert unpackbits(transports.packbits(data)) == data
+
+
+class FakePrinter(socketserver.ThreadingTCPServer):
+    """port 9100 stand-in that records every connection it accepts"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakePrinterHandler)
+        self.connections = 0
+        self.received = bytearray()
+        self.lock = threading.Lock()
+
+    @property
+    def uri(self):
+        return "tcp://%s:%d" % self.server_address
+
+
+class FakePrinterHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        with self.server.lock:
+            self.server.connections += 1
+
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                break
+            with self.server.lock:
+                self.server.received += data
+
+
+@pytest.fixture
+def fake_printer():
+    server = FakePrinter()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def wait_for(fake_printer, length):
+    deadline = time.monotonic() + 5
+    while len(fake_printer.received) < length and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize("reuse", [True, False])
+def test_tcp_jobs_per_second(fake_printer, reuse):
+    transport = transports.TCPTransport(fake_printer.uri)
+    transport.reuse = reuse
+    job = transports.PT750W("file:///dev/null").encode(a_pattern(300))
+    jobs = 50
+
+    start = time.perf_counter()
+    for _ in range(jobs):
+        transport.send_bytes(job)
+    elapsed = time.perf_counter() - start
+    transport.close()
+
+    wait_for(fake_printer, len(job) * jobs)
+    print(f"reuse={reuse}: {jobs / elapsed:.0f} jobs/sec")
+
+    assert fake_printer.received == job * jobs
+    assert fake_printer.connections == (1 if reuse else jobs)
+
+
+def test_tcp_reconnects(fake_printer):
+    transport = transports.TCPTransport(fake_printer.uri)
+
+    transport.send_bytes(b"first")
+
+    # the printer dropping the connection is picked up before the next job
+    transport._sock.shutdown(socket.SHUT_RDWR)
+    transport.send_bytes(b"second")
+
+    transport._last_used -= transport.idle_timeout + 1
+    transport.send_bytes(b"third")
+    transport.close()
+
+    wait_for(fake_printer, len(b"firstsecondthird"))
+    assert fake_printer.received == b"firstsecondthird"
+    assert fake_printer.connections == 3
+
+
+def test_tcp_unreachable(fake_printer):
+    uri = fake_printer.uri
+    fake_printer.server_close()
+
+    with pytest.raises(transports.TransportError):
+        transports.TCPTransport(uri).send_bytes(b"job")
+
+
+@pytest.fixture
+def mock_http(monkeypatch):
+    requests = []
+    routes = {}
+
+    def handler(request):
+        request.read()
+        requests.append(request)
+
+        response = routes.get(request.url.path, httpx.Response(404))
+        return response(request) if callable(response) else response
+
+    client = httpx.Client(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(transports, "_http_client", client)
+
+    yield requests, routes
+    client.close()
+
+
+def test_http_binary_upload(mock_http):
+    requests, routes = mock_http
+    routes["/print/raw/office"] = httpx.Response(200, json={"state": "done"})
+
+    transport = transports.HTTPTransport("http://remote:5000/office")
+    transport.send_bytes(b"job bytes")
+
+    (request,) = requests
+    assert request.method == "PUT"
+    assert request.content == b"job bytes"
+    assert request.url.params["wait"] == "true"
+
+
+def test_http_json_fallback(mock_http):
+    requests, routes = mock_http
+    routes["/print"] = httpx.Response(200, json={"state": "done"})
+
+    transport = transports.HTTPTransport("http://remote:5000/office")
+    transport.send_bytes(b"job bytes")
+    transport.send_bytes(b"job bytes")
+
+    # the remote has no binary upload, so it is only tried once
+    assert [x.url.path for x in requests] == ["/print/raw/office", "/print", "/print"]
+    body = json.loads(requests[-1].content)
+    assert base64.b64decode(body["label"]["b64_bytes"]) == b"job bytes"
+
+
+def test_http_streamed_upload(mock_http):
+    requests, routes = mock_http
+    routes["/print/raw/office"] = lambda request: httpx.Response(
+        200 if request.content else 400
+    )
+
+    transport = transports.HTTPTransport("http://remote:5000/office")
+    transport.send_bytes(iter([b"job ", b"bytes"]))
+    transport.send_bytes(iter([b"more"]))
+
+    # an empty upload first checks the remote takes binary uploads
+    assert [x.content for x in requests] == [b"", b"job bytes", b"more"]
+    assert requests[1].headers["Transfer-Encoding"] == "chunked"
+
+
+def test_http_streamed_json_fallback(mock_http):
+    requests, routes = mock_http
+    routes["/print"] = httpx.Response(200, json={"state": "done"})
+
+    transport = transports.HTTPTransport("http://remote:5000/office")
+    transport.send_bytes(iter([b"job ", b"bytes"]))
+
+    assert [x.url.path for x in requests] == ["/print/raw/office", "/print"]
+    body = json.loads(requests[-1].content)
+    assert base64.b64decode(body["label"]["b64_bytes"]) == b"job bytes"
+
+
+def test_tcp_streamed(fake_printer):
+    transport = transports.TCPTransport(fake_printer.uri)
+    transport.send_bytes(iter([b"first ", b"second ", b"third"]))
+    transport.close()
+
+    wait_for(fake_printer, 18)
+    assert bytes(fake_printer.received) == b"first second third"
+
+
+def test_http_errors(mock_http):
+    requests, routes = mock_http
+    routes["/print/raw/office"] = httpx.Response(500)
+
+    transport = transports.HTTPTransport("http://remote:5000/office")
+    with pytest.raises(transports.TransportError):
+        transport.send_bytes(b"job bytes")
+
+    assert not transport.get_status().ready
+
+
+def test_http2_without_h2(monkeypatch, caplog):
+    monkeypatch.setattr(transports.settings, "http2", True)
+    monkeypatch.setattr(transports.importlib.util, "find_spec", lambda name: None)
+    monkeypatch.setattr(transports, "_http_client", None)
+
+    client = transports.http_client()
+    try:
+        assert "HTTP/2 needs the h2 package" in caplog.text
+    finally:
+        client.close()